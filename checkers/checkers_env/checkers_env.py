@@ -5,6 +5,14 @@ from numba import jit
 
 from checkers.checkers_env.env_parts.checkers_board import Board
 from checkers.checkers_env.env_parts.move_finder import MoveFinder
+from checkers.checkers_env.env_parts.bitboard_engine import BitboardEngine
+
+
+# INDEXES OF ALL POSITIONS, TO LOOK UP THE ZOBRIST KEYS OF A WHOLE BOARD AT ONCE
+ROWS, COLUMNS = np.indices((8, 8))
+
+# SEED OF THE ZOBRIST KEYS, CHANGING IT INVALIDATES ALL STORED KEYS
+ZOBRIST_SEED = 20230830
 
 
 class CheckersEnv:
@@ -22,9 +30,30 @@ class CheckersEnv:
         with open('./checkers/checkers_env/moves_list/moves_list.pkl', 'rb') as f:
             self.moves_list = pickle.load(f)
 
+        # ACTION OF EVERY MOVE, AND THE ACTIONS OF EVERY (START, END) PAIR OF POSITIONS (SORTED)
+        self.action_indexes = {move: action for action, move in enumerate(self.moves_list)}
+        self.endpoint_actions = {}
+        for action, move in enumerate(self.moves_list):
+            self.endpoint_actions.setdefault((move[0], move[-1]), []).append(action)
+
+        # CAPTURED POSITIONS OF EVERY MOVE AS A TUPLE OF UNIQUE (X, Y) POSITIONS, FOR THE IN-PLACE MOVES
+        self.move_captures = []
+        for captures in self.captures_list:
+            if len(captures) != 0 and isinstance(captures[0], int):  # A SINGLE CAPTURE IS STORED AS ITS POSITION
+                captures = [captures]
+            self.move_captures.append(tuple(dict.fromkeys(tuple(capture) for capture in captures)))
+
         self.optimal_move_count = -1
         self.board = Board(board_parameters, draw_parameters, to_render)
-        self.move_finder = MoveFinder()
+        self.move_finder = MoveFinder(self.moves_list)
+
+        # RULES ENGINE - BITBOARDS, OR THE NUMPY BOARD WITH THE POSITION SETS OF THE MOVE FINDER (None)
+        if board_parameters["ENGINE"] == "BITBOARD":
+            self.engine = BitboardEngine(self.moves_list, self.captures_list)
+        elif board_parameters["ENGINE"] == "ARRAY":
+            self.engine = None
+        else:
+            raise NameError(f"ENGINE NAME '{board_parameters['ENGINE']}' IS INCORRECT, TRY - 'BITBOARD', 'ARRAY'")
 
         # ACTION AND OBSERVATION SPACE
         self.action_space = 2852  # NUM MOVES
@@ -37,6 +66,14 @@ class CheckersEnv:
         self.move_counter = 0
         self.previous_action = None
 
+        # ZOBRIST KEYS - A RANDOM 64 BIT KEY FOR EVERY PIECE (-2, -1, 1, 2 => INDEX PIECE + 2) ON EVERY POSITION,
+        # AND ONE FOR BLACK (-1) TO MOVE, THE FIXED SEED GIVES THE SAME KEYS IN EVERY PROCESS
+        zobrist_generator = np.random.default_rng(ZOBRIST_SEED)
+        self.zobrist_pieces = zobrist_generator.integers(0, 2 ** 64, size=(8, 8, 5), dtype=np.uint64)
+        self.zobrist_pieces[:, :, 2] = 0  # EMPTY POSITIONS DON'T CHANGE THE KEY
+        self.zobrist_black = int(zobrist_generator.integers(0, 2 ** 64, dtype=np.uint64))
+        self.hash_key = self.hash_state(self.board.np_board, self.player)
+
         # HEURISTICS
         self.piece_value = 5
         self.king_value = 10
@@ -79,8 +116,9 @@ class CheckersEnv:
         self.board.reset()
         self.move_finder.initialized_positions(self.board.np_board)
         self.move_counter = 0
-        moves_player = self.move_finder.find_moves(self.board.np_board, self.player, self.move_finder.piece_positions,
-                                                   self.move_finder.king_positions, self.moves_list)
+        self.hash_key = self.hash_state(self.board.np_board, self.player)
+        moves_player = self.find_moves(self.board.np_board, self.player, self.move_finder.piece_positions,
+                                       self.move_finder.king_positions)
         return np.copy(self.board.np_board), moves_player
 
     def add_heuristics(self, state, player, possible_moves):
@@ -132,18 +170,37 @@ class CheckersEnv:
         return self.board.highlight_piece(click_position, self.player, highlighted_before,
                                           possible_moves, self.moves_list)
 
+    def find_action(self, start, end, possible_moves):
+        # FIRST POSSIBLE ACTION MOVING THE PIECE FROM START TO END, None IF THERE IS NONE
+        for action in self.endpoint_actions.get((start, end), ()):
+            if action in possible_moves:
+                return action
+        return None
+
     def end_highlight(self, highlighted_before):
         self.board.end_highlight(highlighted_before, self.player)
 
+    def hash_state(self, state, player):
+        # ZOBRIST KEY OF THE STATE WITH THE PLAYER TO MOVE, COMPUTED FROM SCRATCH (step UPDATES self.hash_key IN PLACE)
+        pieces = self.zobrist_pieces[ROWS, COLUMNS, state.astype(np.intp) + 2]
+        hash_key = int(np.bitwise_xor.reduce(pieces, axis=None))
+        return hash_key ^ self.zobrist_black if player == -1 else hash_key
+
+    def update_hash(self, hash_key, state, action, player):
+        # ZOBRIST KEY AFTER THE MOVE, FROM THE KEY AND THE STATE BEFORE IT - ONLY THE CHANGED POSITIONS ARE XORED
+        start, end = self.moves_list[action][0], self.moves_list[action][-1]
+        moved_piece = int(state[start])
+        promoted = abs(moved_piece) == 1 and end[0] == (0 if player == 1 else 7)
+        hash_key ^= int(self.zobrist_pieces[start][moved_piece + 2]) ^ self.zobrist_black
+        hash_key ^= int(self.zobrist_pieces[end][(2 * player if promoted else moved_piece) + 2])
+        for position in self.move_captures[action]:
+            hash_key ^= int(self.zobrist_pieces[position][int(state[position]) + 2])
+        return hash_key
+
     @staticmethod
-    def hash_state(state):
-        array = []
-        for x in range(8):
-            row = tuple(state[x])
-            array.append(row)
-        array = tuple(array)
-        hash_value = hash(array)
-        return hash_value
+    def position_key(state, player, move_counter):
+        # THE MOVE COUNTER IS PART OF THE MODEL INPUT AND DECIDES THE MOVE LIMIT DRAW
+        return state.tobytes(), player, move_counter
 
     @staticmethod
     def flip_board_perspective(state):
@@ -176,15 +233,70 @@ class CheckersEnv:
         return self.move_finder.find_positions(state)
 
     def find_moves(self, state, player, piece_positions, king_positions):
-        return self.move_finder.find_moves(state, player, piece_positions, king_positions, self.moves_list)
+        # THE BITBOARD ENGINE DOESN'T USE THE POSITION SETS
+        if self.engine is not None:
+            return self.engine.find_moves(state, player)
+        return self.move_finder.find_moves(state, player, piece_positions, king_positions, self.action_indexes)
+
+    def legal_moves_mask(self, moves):
+        # BOOLEAN MASK OVER THE ACTION SPACE, NO MOVES (None) => ALL FALSE
+        mask = np.zeros(self.action_space, dtype=bool)
+        if moves is not None:
+            mask[moves] = True
+        return mask
 
     def make_move(self, state, action, player):
+        if self.engine is not None:
+            return self.engine.make_move(state, action, player)
+
+        # THE BOARD MOVES THE PIECES IN PLACE, SO THE ONLY COPY IS MADE HERE
         next_state, _ = self.board.make_move(np.copy(state), action, player, self.moves_list,
                                              self.captures_list, to_render=None)
-        return np.copy(next_state)
+        return next_state
+
+    def make_move_in_place(self, state, action, player, piece_positions=None, king_positions=None):
+        # MAKE THE MOVE ON THE PROVIDED BOARD (AND THE POSITION SETS OF THE MOVE FINDER, IF PROVIDED) WITHOUT COPYING,
+        # THE RETURNED UNDO RECORD (START, END, MOVED PIECE, CAPTURED (POSITION, PIECE) PAIRS, PROMOTION FLAG)
+        # TAKES THE MOVE BACK IN unmake_move, SO A SEARCH CAN WALK DOWN AND BACK UP ONE BOARD
+        start, end = self.moves_list[action][0], self.moves_list[action][-1]
+        moved_piece = state[start]
+        captured = tuple((position, state[position]) for position in self.move_captures[action])
+        promoted = abs(moved_piece) == 1 and end[0] == (0 if player == 1 else 7)
+
+        state[start] = 0
+        state[end] = 2 * player if promoted else moved_piece
+        for position, _ in captured:
+            state[position] = 0
+
+        if piece_positions is not None:
+            moved_positions = piece_positions if abs(moved_piece) == 1 else king_positions
+            moved_positions[player].remove(start)
+            (king_positions if promoted else moved_positions)[player].add(end)
+            for position, piece in captured:
+                (piece_positions if abs(piece) == 1 else king_positions)[-player].remove(position)
+        return start, end, moved_piece, captured, promoted
+
+    @staticmethod
+    def unmake_move(state, undo, piece_positions=None, king_positions=None):
+        # RESTORE THE BOARD (AND THE POSITION SETS) FROM THE UNDO RECORD OF make_move_in_place
+        start, end, moved_piece, captured, promoted = undo
+        state[end] = 0
+        state[start] = moved_piece
+        for position, piece in captured:
+            state[position] = piece
+
+        if piece_positions is not None:
+            player = 1 if moved_piece > 0 else -1
+            moved_positions = piece_positions if abs(moved_piece) == 1 else king_positions
+            (king_positions if promoted else moved_positions)[player].remove(end)
+            moved_positions[player].add(start)
+            for position, piece in captured:
+                (piece_positions if abs(piece) == 1 else king_positions)[-player].add(position)
 
     def state_reward(self, state, player, move_counter):
-        piece_positions, king_positions = self.find_positions(state)
+        piece_positions, king_positions = None, None
+        if self.engine is None:
+            piece_positions, king_positions = self.find_positions(state)
         game_end, win_state, moves_enemy = self.check_win(state, player, -player, move_counter,
                                                           piece_positions, king_positions)
         reward = self.give_reward(win_state)
@@ -222,8 +334,11 @@ class CheckersEnv:
         moves_enemy = self.find_moves(state, enemy, piece_positions, king_positions)
         win_state = None
         game_end = False
-        if len(np.where(state == enemy)[0]) == 0 and \
-                len(np.where(state == 2 * enemy)[0]) == 0:
+        if self.engine is not None:
+            enemy_lost = not self.engine.has_pieces(state, enemy)
+        else:
+            enemy_lost = len(np.where(state == enemy)[0]) == 0 and len(np.where(state == 2 * enemy)[0]) == 0
+        if enemy_lost:
             win_state = player
             game_end = True
         elif moves_enemy is None:
@@ -244,6 +359,7 @@ class CheckersEnv:
         return reward
 
     def step(self, action):
+        self.hash_key = self.update_hash(self.hash_key, self.board.np_board, action, self.player)
         self.move_finder.update_finder(self.board.np_board, action, self.player,
                                        self.enemy, self.moves_list, self.captures_list)
         current_board, new_king_position = self.board.make_move(self.board.np_board, action, self.player,
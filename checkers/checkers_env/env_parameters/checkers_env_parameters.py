@@ -3,7 +3,7 @@ Parameters stored for setting up the connect4
 environment and tools necessary to make it work
 """
 
-board_parameters = {"BOARD_WIDTH": 800, "BOARD_HEIGHT": 800, "BORDER_WIDTH": 40}
+board_parameters = {"BOARD_WIDTH": 800, "BOARD_HEIGHT": 800, "BORDER_WIDTH": 40, "ENGINE": "BITBOARD"}
 
 
 draw_parameters = {"DOT_R": 10, "HIGHLIGHT_COLOR": (150, 146, 146), "PIECE_R": 40, "KING_R": 20, "BORDER_R": 5,
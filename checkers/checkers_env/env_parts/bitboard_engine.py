@@ -0,0 +1,377 @@
+import numpy as np
+from numba import jit
+
+from checkers.checkers_env.env_parts.position_finders import create_action_tree, MAX_CAPTURE_PATHS
+
+# The 32 playable cells (x + y odd) are numbered row by row, square = 4 * x + y // 2,
+# every bitboard is an integer with one bit per square
+NUM_SQUARES = 32
+SQUARE_COORDINATES = tuple((square // 4, 2 * (square % 4) + 1 - (square // 4) % 2) for square in range(NUM_SQUARES))
+COORDINATE_SQUARES = {coordinates: square for square, coordinates in enumerate(SQUARE_COORDINATES)}
+
+# Diagonal directions as (x, y) steps, in the order used by the king captures of the array engine
+UP_LEFT, UP_RIGHT, DOWN_RIGHT, DOWN_LEFT = (-1, -1), (-1, 1), (1, 1), (1, -1)
+OPPOSITE = {UP_LEFT: DOWN_RIGHT, UP_RIGHT: DOWN_LEFT, DOWN_RIGHT: UP_LEFT, DOWN_LEFT: UP_RIGHT}
+
+# Directions of the men (forward only) of both players, and of the kings
+MAN_DIRECTIONS = {1: (UP_LEFT, UP_RIGHT), -1: (DOWN_RIGHT, DOWN_LEFT)}
+KING_DIRECTIONS = (UP_LEFT, UP_RIGHT, DOWN_RIGHT, DOWN_LEFT)
+
+# Squares on which the men of each player are promoted to kings (row 0 for player 1, row 7 for player -1)
+PROMOTION_ROWS = {1: 0b1111, -1: 0b1111 << 28}
+
+
+def neighbour(square, direction, distance=1):
+    """
+    Get the square reached from a square by moving along a diagonal
+
+    :param square: index of the start square
+    :param direction: (x, y) step of the diagonal
+    :param distance: number of steps along the diagonal
+    :return: index of the reached square, -1 if it is outside the board
+    """
+
+    x = SQUARE_COORDINATES[square][0] + distance * direction[0]
+    y = SQUARE_COORDINATES[square][1] + distance * direction[1]
+    return COORDINATE_SQUARES.get((x, y), -1)
+
+
+def create_shifts():
+    """
+    Create the shift of every direction. On the 32 square board, a step along a diagonal is a shift by 3, 4 or 5,
+    depending on the parity of the row, so every direction has a shift (and a mask of the squares
+    which have a neighbour in the direction) for the even and for the odd rows
+
+    :return: dictionary of direction - ((shift, mask) of even rows, (shift, mask) of odd rows) pairs
+    """
+
+    shifts = {}
+    for direction in KING_DIRECTIONS:
+        parities = []
+        for parity in (0, 1):
+            steps = {neighbour(square, direction) - square for square in range(NUM_SQUARES)
+                     if SQUARE_COORDINATES[square][0] % 2 == parity and neighbour(square, direction) != -1}
+            mask = sum(1 << square for square in range(NUM_SQUARES)
+                       if SQUARE_COORDINATES[square][0] % 2 == parity and neighbour(square, direction) != -1)
+            # Every square of the parity moves by the same step, which is what makes the shift possible
+            assert len(steps) == 1
+            parities.append((steps.pop(), mask))
+        shifts[direction] = tuple(parities)
+    return shifts
+
+
+SHIFTS = create_shifts()
+
+# Neighbouring square, and the square behind the neighbour (the landing square of a jump), in every direction
+NEIGHBOURS = {direction: tuple(neighbour(square, direction) for square in range(NUM_SQUARES))
+              for direction in KING_DIRECTIONS}
+JUMPS = {direction: tuple(neighbour(square, direction, 2) for square in range(NUM_SQUARES))
+         for direction in KING_DIRECTIONS}
+
+# The same squares as arrays for the compiled capture search, with a row for every direction of KING_DIRECTIONS,
+# the men of each player capture in the rows from the first (inclusive) to the last (exclusive) one
+NEIGHBOUR_TABLE = np.array([NEIGHBOURS[direction] for direction in KING_DIRECTIONS], dtype=np.int64)
+JUMP_TABLE = np.array([JUMPS[direction] for direction in KING_DIRECTIONS], dtype=np.int64)
+MAN_DIRECTION_ROWS = {1: (0, 2), -1: (2, 4)}
+
+
+def shift(bitboard, direction):
+    """
+    Move every piece of a bitboard one step along a diagonal, the pieces leaving the board are dropped
+
+    :param bitboard: the bitboard to shift
+    :param direction: (x, y) step of the diagonal
+    :return: the shifted bitboard
+    """
+
+    shifted = 0
+    for step, mask in SHIFTS[direction]:
+        if step > 0:
+            shifted |= (bitboard & mask) << step
+        else:
+            shifted |= (bitboard & mask) >> -step
+    return shifted
+
+
+def squares(bitboard):
+    """
+    Iterate over the squares of the set bits of a bitboard, from the lowest one
+
+    :param bitboard: the bitboard to iterate over
+    :return: generator of the square indexes
+    """
+
+    while bitboard:
+        lowest_bit = bitboard & -bitboard
+        yield lowest_bit.bit_length() - 1
+        bitboard ^= lowest_bit
+
+
+@jit(nopython=True)
+def state_to_bitboards(state):
+    """
+    Convert a NumPy board to the bitboards of the men and kings of both players
+
+    :param state: 8x8 board with 1 / -1 for the men and 2 / -2 for the kings of players 1 / -1
+    :return: men of player 1, kings of player 1, men of player -1, kings of player -1
+    """
+
+    men_red, kings_red, men_black, kings_black = 0, 0, 0, 0
+    for square in range(32):
+        x = square // 4
+        piece = state[x, 2 * (square % 4) + 1 - x % 2]
+        if piece == 1:
+            men_red |= 1 << square
+        elif piece == 2:
+            kings_red |= 1 << square
+        elif piece == -1:
+            men_black |= 1 << square
+        elif piece == -2:
+            kings_black |= 1 << square
+    return men_red, kings_red, men_black, kings_black
+
+
+@jit(nopython=True)
+def bitboards_to_state(men_red, kings_red, men_black, kings_black):
+    """
+    Convert the bitboards of both players to a NumPy board
+
+    :param men_red: men of player 1
+    :param kings_red: kings of player 1
+    :param men_black: men of player -1
+    :param kings_black: kings of player -1
+    :return: 8x8 board with 1 / -1 for the men and 2 / -2 for the kings of players 1 / -1
+    """
+
+    state = np.zeros((8, 8))
+    for square in range(32):
+        x = square // 4
+        y = 2 * (square % 4) + 1 - x % 2
+        bit = 1 << square
+        if men_red & bit:
+            state[x, y] = 1
+        elif kings_red & bit:
+            state[x, y] = 2
+        elif men_black & bit:
+            state[x, y] = -1
+        elif kings_black & bit:
+            state[x, y] = -2
+    return state
+
+
+@jit(nopython=True)
+def find_capture_actions(men, kings, enemy, empty, first_direction, last_direction, action_tree, node_actions):
+    """
+    Find the capture moves of all pieces of the player, by enumerating the capture sequences of every piece
+    breadth first over fixed-size arrays. The jumps are checked on the board at the start of the move,
+    a sequence can't return to a square it has visited, and the sequences ending on a square passed (not ended on)
+    by another sequence of the same piece are dropped, like in the array engine
+
+    :param men: men of the player
+    :param kings: kings of the player
+    :param enemy: all pieces of the enemy
+    :param empty: empty squares
+    :param first_direction: first row of the direction tables in which the men capture
+    :param last_direction: row of the direction tables after the last one in which the men capture
+    :param action_tree: child nodes of the prefix tree of the moves over the squares
+    :param node_actions: actions of the nodes of the prefix tree
+    :return: sorted NumPy array of the action indexes of the capture moves
+    """
+
+    actions = np.empty(NUM_SQUARES * MAX_CAPTURE_PATHS, dtype=np.int64)
+    num_actions = 0
+    # Every sequence is stored as its node in the prefix tree, its last square and the bitboard of its squares
+    nodes = np.empty(MAX_CAPTURE_PATHS, dtype=np.int64)
+    ends = np.empty(MAX_CAPTURE_PATHS, dtype=np.int64)
+    visited = np.empty(MAX_CAPTURE_PATHS, dtype=np.int64)
+
+    for square in range(NUM_SQUARES):
+        if (kings >> square) & 1:
+            first, last = 0, 4
+        elif (men >> square) & 1:
+            first, last = first_direction, last_direction
+        else:
+            continue
+
+        nodes[0] = action_tree[0, square]
+        ends[0] = square
+        visited[0] = 1 << square
+        num_paths = 1
+        index = 0
+        while index < num_paths:
+            for direction in range(first, last):
+                captured = NEIGHBOUR_TABLE[direction, ends[index]]
+                landing = JUMP_TABLE[direction, ends[index]]
+                if (landing != -1 and (enemy >> captured) & 1 and (empty >> landing) & 1
+                        and not (visited[index] >> landing) & 1):
+                    node = action_tree[nodes[index], landing]
+                    if node == -1:
+                        raise ValueError("capture sequence missing from the moves list")
+                    nodes[num_paths] = node
+                    ends[num_paths] = landing
+                    visited[num_paths] = visited[index] | (1 << landing)
+                    num_paths += 1
+            index += 1
+
+        # The start square is passed by every capture, which drops the sequence without any jumps
+        passed = 0
+        for i in range(num_paths):
+            passed |= visited[i] & ~(1 << ends[i])
+        for i in range(1, num_paths):
+            if not (passed >> ends[i]) & 1:
+                actions[num_actions] = node_actions[nodes[i]]
+                num_actions += 1
+    return np.sort(actions[:num_actions])
+
+
+class BitboardEngine:
+    """
+    Checkers rules on bitboards - 32 bit masks of the men and kings of both players.
+    The moves of all pieces are found at once with shifts and masks, only the multi-jump captures
+    are enumerated square by square, by a compiled search. The rules match the array engine (MoveFinder) move for move:
+    the captures are mandatory, the men move and capture only forward, the kings move one square
+    in all directions, and a capture sequence can't end on a square passed by another sequence of the same piece.
+    The moves are returned as the action indexes of the moves list, looked up by the squares visited by the move
+    """
+
+    def __init__(self, moves_list, captures_list):
+        """
+        Precompute the action of every sequence of visited squares,
+        and the start square, end square and captured squares of every action
+
+        :param moves_list: list of all possible moves as tuples of the visited (x, y) coordinates
+        :param captures_list: list of the captured (x, y) coordinates of every move
+        """
+
+        self.path_actions = {}
+        paths = []
+        self.action_start = []
+        self.action_end = []
+        self.action_captures = []
+        for action, move in enumerate(moves_list):
+            # The moves list also covers the unplayable cells, their actions never occur
+            if all(position in COORDINATE_SQUARES for position in move):
+                self.path_actions[tuple(COORDINATE_SQUARES[position] for position in move)] = action
+                paths.append(tuple(COORDINATE_SQUARES[position] for position in move))
+            else:
+                paths.append(None)
+            self.action_start.append(1 << COORDINATE_SQUARES.get(move[0], 0))
+            self.action_end.append(1 << COORDINATE_SQUARES.get(move[-1], 0))
+            captures = captures_list[action]
+            if len(captures) != 0 and isinstance(captures[0], int):
+                captures = [captures]
+            self.action_captures.append(sum(1 << COORDINATE_SQUARES[capture] for capture in set(captures)
+                                            if capture in COORDINATE_SQUARES))
+        self.action_tree, self.node_actions = create_action_tree(paths, NUM_SQUARES)
+
+    @staticmethod
+    def bitboards(state, player):
+        """
+        Get the bitboards of a state, from the perspective of the provided player
+
+        :param state: the NumPy board
+        :param player: the player whose pieces are returned first
+        :return: men of the player, kings of the player, men of the enemy, kings of the enemy
+        """
+
+        men_red, kings_red, men_black, kings_black = state_to_bitboards(state)
+        if player == 1:
+            return men_red, kings_red, men_black, kings_black
+        return men_black, kings_black, men_red, kings_red
+
+    def find_moves(self, state, player):
+        """
+        Find the legal moves of the player, only the captures if any capture is possible
+
+        :param state: the NumPy board
+        :param player: the player to move
+        :return: sorted list of the action indexes of the moves, None if the player can't move
+        """
+
+        men, kings, enemy_men, enemy_kings = self.bitboards(state, player)
+        enemy = enemy_men | enemy_kings
+        empty = ~(men | kings | enemy) & 0xFFFFFFFF
+
+        captures = self.find_captures(men, kings, enemy, empty, player)
+        if captures:
+            return captures
+        moves = self.find_simple_moves(men, kings, empty, player)
+        if not moves:
+            return None
+        return sorted(self.path_actions[move] for move in moves)
+
+    def find_captures(self, men, kings, enemy, empty, player):
+        """
+        Find the capture moves of all pieces of the player with the compiled capture search
+
+        :param men: men of the player
+        :param kings: kings of the player
+        :param enemy: all pieces of the enemy
+        :param empty: empty squares
+        :param player: the player to move
+        :return: sorted list of the action indexes of the capture moves
+        """
+
+        first_direction, last_direction = MAN_DIRECTION_ROWS[player]
+        return find_capture_actions(men, kings, enemy, empty, first_direction, last_direction,
+                                    self.action_tree, self.node_actions).tolist()
+
+    @staticmethod
+    def find_simple_moves(men, kings, empty, player):
+        """
+        Find the non-capture moves of all pieces of the player, with one shift per direction
+
+        :param men: men of the player
+        :param kings: kings of the player
+        :param empty: empty squares
+        :param player: the player to move
+        :return: list of the moves as tuples of the start and end squares
+        """
+
+        moves = []
+        for pieces, directions in ((men, MAN_DIRECTIONS[player]), (kings, KING_DIRECTIONS)):
+            for direction in directions:
+                backwards = NEIGHBOURS[OPPOSITE[direction]]
+                for end in squares(shift(pieces, direction) & empty):
+                    moves.append((backwards[end], end))
+        return moves
+
+    def make_move(self, state, action, player):
+        """
+        Make the move on the bitboards - move the piece, remove the captured pieces and promote a man,
+        which reached the last row
+
+        :param state: the NumPy board before the move, it is not modified
+        :param action: action index of the move
+        :param player: the player making the move
+        :return: the NumPy board after the move
+        """
+
+        men, kings, enemy_men, enemy_kings = self.bitboards(state, player)
+        start, end, captures = self.action_start[action], self.action_end[action], self.action_captures[action]
+
+        if men & start:
+            men ^= start | end
+            if end & PROMOTION_ROWS[player]:
+                men ^= end
+                kings |= end
+        else:
+            kings ^= start | end
+        enemy_men &= ~captures
+        enemy_kings &= ~captures
+
+        if player == 1:
+            return bitboards_to_state(men, kings, enemy_men, enemy_kings)
+        return bitboards_to_state(enemy_men, enemy_kings, men, kings)
+
+    def has_pieces(self, state, player):
+        """
+        Check if the player has any pieces left
+
+        :param state: the NumPy board
+        :param player: the player to check
+        :return: boolean whether the player has a man or a king
+        """
+
+        men, kings, _, _ = self.bitboards(state, player)
+        return (men | kings) != 0
@@ -272,7 +272,8 @@ class Board:
         :param moves_list: list of all possible moves
         :param captures_list: list of all possible captures
         :param to_render: render the board flag
-        :return: board state after performing the move, positions of new king (if one has been made, else None)
+        :return: board state after performing the move (the provided state, modified in place),
+                 positions of new king (if one has been made, else None)
         """
 
         starting_position = moves_list[action][0]
@@ -313,7 +314,7 @@ class Board:
 
         new_king_position = self.check_new_king_made(state, player, new_position, new_pixel_x, new_pixel_y, to_render)
 
-        return np.copy(state), new_king_position
+        return state, new_king_position
 
     def check_new_king_made(self, state, player, new_position, new_pixel_x, new_pixel_y, to_render):
         """
@@ -1,9 +1,12 @@
-from checkers.checkers_env.env_parts.position_finders import (piece_future_positions,
-                                                              king_future_positions, get_captures)
+from checkers.checkers_env.env_parts.position_finders import (piece_future_positions, king_future_positions,
+                                                              get_captures, create_action_tree)
 
 
 class MoveFinder:
-    def __init__(self):
+    def __init__(self, moves_list):
+        # PREFIX TREE OF THE MOVES (POSITION INDEX 8 * X + Y), THE COMPILED CAPTURE SEARCH RETURNS THE ACTIONS FROM IT
+        self.action_tree, self.node_actions = create_action_tree(
+            [tuple(8 * x + y for x, y in move) for move in moves_list], 64)
         self.piece_positions = {}
         self.king_positions = {}
         self.players = (1, -1)
@@ -79,19 +82,18 @@ class MoveFinder:
         self.king_positions[player].add(new_position)
 
     def moves_capture(self, np_board, piece_type, player, piece_positions, king_positions):
-        moves = []  # NEW POSITIONS
-        captures = []  # CAPTURE POSITIONS
+        moves = []  # ACTION INDEXES OF THE CAPTURES
         if abs(piece_type) == 1:  # PIECE
             for piece_position in piece_positions[player]:
-                piece_moves, piece_captures = get_captures(np_board, piece_position, player, self.piece)
-                moves.extend(piece_moves)
-                captures.extend(piece_captures)
+                piece_moves = get_captures(np_board, piece_position[0], piece_position[1], player, self.piece,
+                                          self.action_tree, self.node_actions)
+                moves.extend(piece_moves.tolist())
         else:  # KING
             for king_position in king_positions[player]:
-                king_moves, king_captures = get_captures(np_board, king_position, player, self.king)
-                moves.extend(king_moves)
-                captures.extend(king_captures)
-        return moves, captures
+                king_moves = get_captures(np_board, king_position[0], king_position[1], player, self.king,
+                                         self.action_tree, self.node_actions)
+                moves.extend(king_moves.tolist())
+        return moves
 
     @staticmethod
     def moves_no_capture(np_board, piece_type, player, piece_positions, king_positions):
@@ -112,34 +114,26 @@ class MoveFinder:
                     moves.append((king_position, move))
         return moves
 
-    def find_moves(self, np_board, player, piece_positions, king_positions, moves_list):
+    def find_moves(self, np_board, player, piece_positions, king_positions, action_indexes):
+        captures = self.moves_capture(np_board, self.piece, player, piece_positions, king_positions)
+        captures.extend(self.moves_capture(np_board, self.king, player, piece_positions, king_positions))
+        if len(captures) > 0:
+            # THE CAPTURES ARE ALREADY ACTION INDEXES
+            captures.sort()
+            return captures
+
         moves_piece = self.moves_no_capture(np_board, self.piece, player, piece_positions, king_positions)
         moves_king = self.moves_no_capture(np_board, self.king, player, piece_positions, king_positions)
-        captures_piece, captured_enemy_piece = self.moves_capture(np_board, self.piece, player,
-                                                                  piece_positions, king_positions)
-        captures_king, captured_enemy_king = self.moves_capture(np_board, self.king, player,
-                                                                piece_positions, king_positions)
-        if len(captures_piece) > 0 or len(captures_king) > 0:
-            moves = []
-            captures = []
-            captures.extend(captured_enemy_piece)
-            captures.extend(captured_enemy_king)
-            moves.extend(captures_piece)
-            moves.extend(captures_king)
-            return self.filter_moves(moves, moves_list)
-
-        elif len(moves_piece) > 0 or len(moves_king) > 0:
+        if len(moves_piece) > 0 or len(moves_king) > 0:
             moves = []
             moves.extend(moves_piece)
             moves.extend(moves_king)
-            return self.filter_moves(moves, moves_list)
+            return self.filter_moves(moves, action_indexes)
         return None
 
     @staticmethod
-    def filter_moves(moves, moves_list):
-        move_index = []
-        for move in moves:
-            index = moves_list.index(move)
-            move_index.append(index)
+    def filter_moves(moves, action_indexes):
+        # ACTION INDEXES ARE LOOKED UP IN THE DICTIONARY OF THE MOVES LIST (MOVE -> ACTION)
+        move_index = [action_indexes[move] for move in moves]
         move_index.sort()
         return move_index
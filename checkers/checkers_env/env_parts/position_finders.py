@@ -1,5 +1,12 @@
+import numpy as np
 from numba import jit
 
+# DIRECTIONS OF THE CAPTURES - FORWARD FOR RED (0 - 2), FORWARD FOR BLACK (2 - 4), ALL FOR KINGS (0 - 4)
+CAPTURE_DIRECTIONS = np.array([(-1, -1), (-1, 1), (1, 1), (1, -1)])
+
+# UPPER BOUND OF THE CAPTURE SEQUENCES OF ONE PIECE, CHECKED AGAINST THE MOVES LIST IN create_action_tree
+MAX_CAPTURE_PATHS = 64
+
 
 @jit(nopython=True)
 def valid(np_board, x, y):
@@ -68,52 +75,105 @@ def king_future_positions(np_board, x, y):
     return future_positions
 
 
-def get_captures(np_board, start_pos, player, piece_type):
-    directions_red = [(-1, -1), (-1, 1)]
-    directions_black = [(1, 1), (1, -1)]
-    directions_king = [(-1, -1), (-1, 1), (1, 1), (1, -1)]
+def create_action_tree(paths, num_positions):
+    """
+    Create a prefix tree of the moves, in which the compiled capture search looks up the action of a capture
+    sequence one jump at a time, the root node has a child for every start position
+
+    :param paths: list of the moves as tuples of position indexes (the action of a move is its index in the list),
+                  None for the moves which can't be played
+    :param num_positions: number of the position indexes
+    :return: array with the child node of every node for every position (-1 if there is no such move),
+             array with the action of every node (-1 if the node isn't a move)
+    """
+
+    children = [[-1] * num_positions]
+    actions = [-1]
+    start_nodes = [0] * num_positions  # NODES BELOW EVERY START POSITION
+    for action, path in enumerate(paths):
+        if path is None:
+            continue
+        node = 0
+        for position in path:
+            if children[node][position] == -1:
+                children[node][position] = len(children)
+                children.append([-1] * num_positions)
+                actions.append(-1)
+                start_nodes[path[0]] += 1
+            node = children[node][position]
+        actions[node] = action
+
+    # EVERY CAPTURE SEQUENCE OF A PIECE IS A NODE BELOW ITS START, SO THIS BOUNDS THE SEQUENCES OF THE SEARCH
+    assert max(start_nodes) <= MAX_CAPTURE_PATHS
+    return np.array(children, dtype=np.int64), np.array(actions, dtype=np.int64)
+
+
+@jit(nopython=True)
+def get_captures(np_board, x, y, player, piece_type, action_tree, node_actions):
+    """
+    Find the capture moves of the piece at (x, y), by enumerating the capture sequences breadth first
+    over fixed-size arrays. The jumps are checked on the board at the start of the move,
+    a sequence can't return to a position it has visited, and the sequences ending on a position passed
+    (not ended on) by another sequence of the piece are dropped
+
+    :param np_board: state of the game board as a numpy array
+    :param x: x coordinate of the piece on the numpy board
+    :param y: y coordinate of the piece on the numpy board
+    :param player: player making the capture moves
+    :param piece_type: type of the piece (1 -> standard, 2 -> king)
+    :param action_tree: child nodes of the prefix tree of the moves (from create_action_tree)
+    :param node_actions: actions of the nodes of the prefix tree of the moves
+    :return: numpy array with the action indexes of the capture moves
+    """
+
     if abs(piece_type) == 1 and player == 1:
-        used_directions = directions_red  # RED PIECE CAPTURES
+        first_direction, last_direction = 0, 2  # RED PIECE CAPTURES
     elif abs(piece_type) == 1 and player == -1:
-        used_directions = directions_black  # BLACK PIECE CAPTURES
+        first_direction, last_direction = 2, 4  # BLACK PIECE CAPTURES
     else:
-        used_directions = directions_king  # KING CAPTURES
+        first_direction, last_direction = 0, 4  # KING CAPTURES
+
+    # EVERY SEQUENCE IS STORED AS ITS NODE IN THE PREFIX TREE, ITS LAST POSITION AND THE MASK OF ITS POSITIONS
+    nodes = np.empty(MAX_CAPTURE_PATHS, dtype=np.int64)
+    ends = np.empty(MAX_CAPTURE_PATHS, dtype=np.int64)
+    visited = np.empty(MAX_CAPTURE_PATHS, dtype=np.int64)
+    nodes[0] = action_tree[0, 8 * x + y]
+    ends[0] = 8 * x + y
+    visited[0] = 1 << ends[0]
+    num_paths = 1
 
-    out = [[start_pos]]
     index = 0
-    while index < len(out):
-        move = out[index]
-        for direction in used_directions:
-            new_capture = (move[-1][0] + direction[0], move[-1][1] + direction[1])
-            new_move = (new_capture[0] + direction[0], new_capture[1] + direction[1])
-            if (len(move) == 1 or new_move not in move) and valid_capture(np_board, new_capture, new_move, player):
-                out.append(move+[new_move])
+    while index < num_paths:
+        end_x, end_y = ends[index] // 8, ends[index] % 8
+        for direction in range(first_direction, last_direction):
+            capture_x = end_x + CAPTURE_DIRECTIONS[direction, 0]
+            capture_y = end_y + CAPTURE_DIRECTIONS[direction, 1]
+            future_x = capture_x + CAPTURE_DIRECTIONS[direction, 0]
+            future_y = capture_y + CAPTURE_DIRECTIONS[direction, 1]
+            if not (0 <= future_x < 8 and 0 <= future_y < 8):
+                continue
+            future_position = 8 * future_x + future_y
+            if (visited[index] >> future_position) & 1 or np_board[future_x, future_y] != 0:
+                continue
+            if np_board[capture_x, capture_y] != -player and np_board[capture_x, capture_y] != -2 * player:
+                continue
+            node = action_tree[nodes[index], future_position]
+            if node == -1:
+                raise ValueError("capture sequence missing from the moves list")
+            nodes[num_paths] = node
+            ends[num_paths] = future_position
+            visited[num_paths] = visited[index] | (1 << future_position)
+            num_paths += 1
         index += 1
 
-    num_deleted = 0
-    out_copy = out.copy()
-    for i in range(len(out_copy)):
-        last_position = out_copy[i][-1]
-        for j in range(len(out_copy)):
-            if (last_position in out_copy[j]) and last_position != out_copy[j][-1] and i != j:
-                del out[i - num_deleted]
-                num_deleted += 1
-                break
-
-    moves = []
-    captures = []
-    for i in range(len(out)):
-        if len(out[i]) == 1:
-            continue
-        moves.append([])
-        captures.append([])
-        for j in range(len(out[i])):
-            moves[i].append(out[i][j])
-            if j < len(out[i]) - 1:
-                direction_x = (out[i][j + 1][0] - out[i][j][0]) / 2
-                direction_y = (out[i][j + 1][1] - out[i][j][1]) / 2
-                captures[i].append((int(out[i][j][0] + direction_x), int(out[i][j][1] + direction_y)))
-    for i in range(len(moves)):
-        moves[i] = tuple(moves[i])
-        captures[i] = tuple(captures[i])
-    return moves, captures
+    # PRUNE THE SEQUENCES ENDING ON A POSITION PASSED BY ANOTHER SEQUENCE (THE START IS PASSED BY ALL CAPTURES)
+    passed = 0
+    for i in range(num_paths):
+        passed |= visited[i] & ~(1 << ends[i])
+    actions = np.empty(num_paths, dtype=np.int64)
+    num_actions = 0
+    for i in range(1, num_paths):
+        if not (passed >> ends[i]) & 1:
+            actions[num_actions] = node_actions[nodes[i]]
+            num_actions += 1
+    return actions[:num_actions]
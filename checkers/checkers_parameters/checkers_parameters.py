@@ -3,6 +3,12 @@ trainer_parameters = {"LOAD": True, "MODEL_PATH": "saved_models/actor-critic-CHE
                       "LOGGER_PATH": "saved_models/saved_logs/log-CHECKERS-month-6-day-8-ep-125551-62.5%.pkl",
                       "TEST_GAMES": 16, "TEST_BUDGET": 250, "DECAY": 1, "TOURNAMENT_GAMES": 16,
                       "TOURNAMENT_BUDGET": 100, "MEMORY_SIZE": 40_000, "MCTS_BUDGET": 600,
+                      "MCTS_BATCH_SIZE": 8, "MCTS_C": 4, "MCTS_TRANSPOSITIONS": True, "MCTS_MAX_NODES": 100_000,
+                      "MCTS_THREADS": 1, "MCTS_NOISE": "ROOT", "MCTS_SPARSE_NOISE": True, "MCTS_WIDENING": None,
+                      "MCTS_SOLVER": True, "EVALUATION_CACHE_SIZE": 5_000,
+                      "FULL_SEARCH_PROBABILITY": 0.25, "FAST_MCTS_BUDGET": 100,
+                      "EVALUATION_ROOT_SELECTION": "GUMBEL", "GUMBEL_ACTIONS": 16,
+                      "MCTS_EARLY_STOP": "FORCED", "EVALUATION_EARLY_STOP": "SETTLED",
                       "NUM_WORKERS": 8, "ITERATIONS": 40, "DATA_GENERATION_EPISODES": 120,
                       "THRESHOLD": 0.55, "HEURISTIC_START_WEIGHT": 0, "HEURISTIC_END_WEIGHT": 0,
                       "HEURISTIC_STEPS": 10}
@@ -9,21 +9,32 @@ from checkers.checkers_env.checkers_env import CheckersEnv
 from checkers.checkers_env.env_parameters.checkers_env_parameters import board_parameters, draw_parameters
 from trainer.self_play_model.self_play_model import SelfPlayModel
 from trainer.monte_carlo_tree_search.monte_carlo_tree_search import MonteCarloTreeSearch
+from trainer.root_parallel.root_parallel import RootParallelSearch
 
 
-def test_checkers(human, episodes, num_simulations, ai_player, heuristic_weight, model_name):
+def test_checkers(human, episodes, num_simulations, ai_player, heuristic_weight, model_name, max_nodes=None,
+                  num_workers=1, time_limit=None):
     env = CheckersEnv(board_parameters, draw_parameters, to_render=True)
-    model = SelfPlayModel(f"./checkers/saved_models/{model_name}")
+    model_path = f"./checkers/saved_models/{model_name}"
+    search_parameters = {"max_nodes": max_nodes, "time_limit": time_limit}  # TIME LIMIT IN SECONDS PER MOVE
+    if num_workers > 1:  # ROOT-PARALLEL SEARCH, ONE TREE PER PROCESS
+        mcts = RootParallelSearch(env, board_parameters, draw_parameters, model_path, num_workers,
+                                  num_simulations, heuristic_weight, search_parameters)
+    else:
+        model = SelfPlayModel(model_path)
+        # THE AI MOVES ARE DETERMINISTIC, SO THE SEARCH STOPS ONCE THE MOVE IS SETTLED
+        mcts = MonteCarloTreeSearch(env, model, num_simulations, heuristic_weight, early_stop="SETTLED",
+                                    **search_parameters)
     for episode in range(episodes):
         reward = 0
         done = False
         current_state, actions_index = env.reset()
         state_player = env.refactor_state(current_state, env.player, env.move_counter)
         env.render()
+        root = None
         while not done:
             if env.player == ai_player:
-                mcts = MonteCarloTreeSearch(env, model, num_simulations, heuristic_weight)
-                root = mcts.run(current_state, state_player, env.player)
+                root = mcts.run(current_state, state_player, env.player, root)
                 action = root.select_action(temperature=0)
             else:  # HUMAN OR RANDOM PLAYER
                 if not human:
@@ -54,14 +65,12 @@ def test_checkers(human, episodes, num_simulations, ai_player, heuristic_weight,
                                         coord_x = mouse_position[0] // env.board.cell_size[0]
                                         coord_y = mouse_position[1] // env.board.cell_size[1]
                                         coords = (coord_y, coord_x)
-                                        if len(actions_index) > 0:
-                                            for move in actions_index:
-                                                if env.moves_list[move][-1] == coords and env.moves_list[move][0] == \
-                                                        highlighted_piece["board_piece_coordinates"]:
-                                                    action = move
-                                                    moved = True
-                                                    highlighting = False
-                                                    break
+                                        move = env.find_action(highlighted_piece["board_piece_coordinates"], coords,
+                                                               actions_index)
+                                        if move is not None:
+                                            action = move
+                                            moved = True
+                                            highlighting = False
                                     elif highlight_event.type == KEYDOWN:
                                         if highlight_event.key == K_ESCAPE:
                                             highlighting = False
@@ -69,6 +78,7 @@ def test_checkers(human, episodes, num_simulations, ai_player, heuristic_weight,
                                             env.render()
                                 pg.event.clear()
                     highlighted_piece = env.end_highlight(highlighted_piece)
+            root = mcts.advance_root(root, action)
             new_state, reward, done, actions_index = env.step(action)
             current_state = new_state
             state_player = env.refactor_state(new_state, env.player, env.move_counter)
@@ -76,6 +86,8 @@ def test_checkers(human, episodes, num_simulations, ai_player, heuristic_weight,
         time.sleep(3)
         print(f"LAST PLAYER: {env.player}, REWARD: {reward}")
         print("==================================================")
+    if num_workers > 1:
+        mcts.close()
 
 """
 HUMAN = True
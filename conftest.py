@@ -0,0 +1,6 @@
+"""
+Configuration of the pytest unit tests, found in trainer/test.
+The other test_*.py files of the repository are scripts playing the games (see run.py), not unit tests
+"""
+
+collect_ignore_glob = ["checkers/test_checkers.py", "simple_games/*/test_*.py", "trainer/test/test_games.py"]
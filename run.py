@@ -24,12 +24,13 @@ if __name__ == "__main__":
             raise ValueError("Invalid game")
 
     elif mode == "test":
-        if len(sys.argv) != 9:
+        if len(sys.argv) not in (9, 10, 11):
             raise TypeError(
                 """
                 Usage: make test game:=<game name> human:=<is human> eps:=<ep count> 
                 num_sim:=<MCTS sim num> ai_player:=<which player ai> heuristic_w:=<heuristic weight (0-1)>
-                model_name:=<model name>
+                model_name:=<model name> workers:=<number of root-parallel search processes (optional)>
+                time_limit:=<seconds per move (optional)>
                 """
             )
 
@@ -40,13 +41,18 @@ if __name__ == "__main__":
         ai_player = int(sys.argv[6])
         heuristic_weight = float(sys.argv[7])
         model_name = sys.argv[8]
+        num_workers = int(sys.argv[9]) if len(sys.argv) >= 10 else 1
+        time_limit = float(sys.argv[10]) if len(sys.argv) == 11 else None
 
         if game == "checkers":
-            test_checkers(human, episodes, num_simulations, ai_player, heuristic_weight, model_name)
+            test_checkers(human, episodes, num_simulations, ai_player, heuristic_weight, model_name,
+                          num_workers=num_workers, time_limit=time_limit)
         elif game == "connect4":
-            test_connect4(human, episodes, num_simulations, ai_player, model_name)
+            test_connect4(human, episodes, num_simulations, ai_player, model_name,
+                          num_workers=num_workers, time_limit=time_limit)
         elif game == "tic_tac_toe":
-            test_tic_tac_toe(human, episodes, num_simulations, ai_player, model_name)
+            test_tic_tac_toe(human, episodes, num_simulations, ai_player, model_name,
+                             num_workers=num_workers, time_limit=time_limit)
         else:
             raise ValueError("Invalid game")
 
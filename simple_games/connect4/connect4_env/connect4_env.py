@@ -4,6 +4,12 @@ import numpy as np
 
 from simple_games.connect4.connect4_env.env_parts.connect4_board import Board
 
+# Indexes of all cells, to look up the Zobrist keys of a whole board at once
+ROWS, COLUMNS = np.indices((6, 7))
+
+# Seed of the Zobrist keys, changing it invalidates all stored keys (e.g. of the opening book)
+ZOBRIST_SEED = 20230830
+
 
 class Connect4Env:
     """
@@ -25,7 +31,7 @@ class Connect4Env:
         :param to_render: render the board flag
         """
 
-        # Load the list for the optimal first 7 moves from any position
+        # Load the list for the optimal first 7 moves from any position, keyed by the Zobrist keys (hash_state)
         with open('./simple_games/connect4/connect4_env/moves_list/optimal_start_moves.pkl', 'rb') as f:
             self.optimal_start_moves = pickle.load(f)
         self.optimal_move_count = 7
@@ -61,14 +67,28 @@ class Connect4Env:
                       (4, 0), (4, 1), (4, 2), (4, 3), (4, 4), (4, 5), (4, 6),
                       (5, 0), (5, 1), (5, 2), (5, 3), (5, 4), (5, 5), (5, 6))
 
+        # Index of every move in the list of all moves, for constant time conversions of the moves to indexes
+        self.move_indexes = {move: index for index, move in enumerate(self.moves)}
+
         # Initialize the game Board class
         self.board = Board(board_parameters, draw_parameters, self.moves, to_render)
 
+        # Zobrist keys - a random 64 bit key for the pieces of both players (index piece + 1) on every cell,
+        # and one for player -1 to move, the fixed seed gives the same keys in every process
+        zobrist_generator = np.random.default_rng(ZOBRIST_SEED)
+        self.zobrist_pieces = zobrist_generator.integers(0, 2 ** 64, size=(6, 7, 3), dtype=np.uint64)
+        self.zobrist_pieces[:, :, 1] = 0  # Empty cells don't change the key
+        self.zobrist_enemy = int(zobrist_generator.integers(0, 2 ** 64, dtype=np.uint64))
+
+        # Zobrist key of the game state, updated with every move made in step
+        self.hash_key = self.hash_state(self.board.np_board, 1)
+
     def reset(self):
         self.move_counter = 0
         self.player = 1
         self.enemy = -1
         self.board.reset()
+        self.hash_key = self.hash_state(self.board.np_board, 1)
         return np.copy(self.board.np_board), self.find_moves(self.board.np_board, 1, positions=None)
 
     @staticmethod
@@ -109,22 +129,49 @@ class Connect4Env:
         self.board.remove_mark(action_index)
 
     @staticmethod
-    def hash_state(state):
+    def position_key(state, player, move_counter):
+        """
+        Create a key identifying a position, used by the transposition table of the Monte-Carlo-Tree Search.
+        Unlike the hash of the state, the key is exact, so different positions never share a key
+
+        :param state: state of the game
+        :param player: player who is about to play
+        :param move_counter: how many moves have been made in round
+                             (not necessary for connect4, as it follows from the board,
+                             only for compatibility reasons)
+        :return: key of the position
         """
-        Hash state to be used in the Monte-Carlo-Tree Search.
-        Experimental feature ...
+
+        return state.tobytes(), player
+
+    def hash_state(self, state, player):
+        """
+        Compute the Zobrist key of a state from scratch, a deterministic 64 bit key
+        of the pieces on the board and the player to move, e.g. for the opening book of the Monte-Carlo-Tree Search.
+        The key of the played game is kept up to date move by move in step (update_hash)
 
         :param state: state of the game
-        :return: hash code of the game state
+        :param player: player who is about to play
+        :return: Zobrist key of the game state
+        """
+
+        pieces = self.zobrist_pieces[ROWS, COLUMNS, state.astype(np.intp) + 1]
+        hash_key = int(np.bitwise_xor.reduce(pieces, axis=None))
+        return hash_key ^ self.zobrist_enemy if player == -1 else hash_key
+
+    def update_hash(self, hash_key, state, action, player):
         """
+        Update a Zobrist key with a move, only the key of the placed piece and the player to move change
 
-        array = []
-        for x in range(6):
-            row = tuple(state[x])
-            array.append(row)
-        array = tuple(array)
-        hash_value = hash(array)
-        return hash_value
+        :param hash_key: Zobrist key of the state before the move
+        :param state: state of the game before the move
+        :param action: action to be performed
+        :param player: player making the move
+        :return: Zobrist key of the state after the move
+        """
+
+        x, y = self.moves[action]
+        return hash_key ^ int(self.zobrist_pieces[x, y, player + 1]) ^ self.zobrist_enemy
 
     def check_win(self, state, player):
         """
@@ -211,8 +258,46 @@ class Connect4Env:
         :return: state of the board (NumPy array) after the performed move (from the Board method)
         """
 
-        next_state = self.board.make_move(action, player, np.copy(state), to_render=None)
-        return np.copy(next_state)
+        # The Board method already returns a new array, so the state itself is not modified
+        return self.board.make_move(action, player, state, to_render=None)
+
+    def make_move_in_place(self, state, action, player):
+        """
+        Make a move directly on the provided state, without copying it,
+        so a search can walk down and back up one board with unmake_move
+
+        :param state: state of the game, modified in place
+        :param action: action to be performed
+        :param player: player making the move
+        :return: undo record of the move - the (x, y) position of the placed piece
+        """
+
+        position = self.board.moves[action]
+        state[position[0], position[1]] = player
+        return position
+
+    @staticmethod
+    def unmake_move(state, undo):
+        """
+        Take back a move made with make_move_in_place
+
+        :param state: state of the game after the move, modified in place
+        :param undo: undo record returned by make_move_in_place
+        """
+
+        state[undo[0], undo[1]] = 0
+
+    def legal_moves_mask(self, moves):
+        """
+        Create a boolean mask of the legal actions, used to mask the action probabilities in one operation
+
+        :param moves: list of move indexes, as returned by find_moves
+        :return: boolean array over the action space, True for the legal actions
+        """
+
+        mask = np.zeros(self.action_space, dtype=bool)
+        mask[moves] = True
+        return mask
 
     def filter_moves(self, moves):
         """
@@ -223,10 +308,7 @@ class Connect4Env:
         :return: list of move indexes
         """
 
-        move_index = []
-        for move in moves:
-            index = self.moves.index(move)
-            move_index.append(index)
+        move_index = [self.move_indexes[move] for move in moves]
         move_index.sort()
         return move_index
 
@@ -313,7 +395,8 @@ class Connect4Env:
         :return: state of the game after move, reward for the new state, game over boolean, moves for the next state
         """
 
-        # Update the board based on the provided move
+        # Update the Zobrist key and the board based on the provided move
+        self.hash_key = self.update_hash(self.hash_key, self.board.np_board, action, self.player)
         self.board.np_board = self.board.make_move(action, self.player, self.board.np_board,
                                                    to_render=self.board.to_render)
 
@@ -3,6 +3,12 @@ trainer_parameters = {"LOAD": True, "MODEL_PATH": "saved_models/actor-critic--mo
                       "LOGGER_PATH": "saved_models/saved_logs/log-CONNECT4-month-5-day-20-ep-24949-100.0%.pkl",
                       "TEST_GAMES": 6, "TEST_BUDGET": 100, "DECAY": 1, "TOURNAMENT_GAMES": 18,
                       "TOURNAMENT_BUDGET": 100, "MEMORY_SIZE": 40_000, "MCTS_BUDGET": 800,
+                      "MCTS_BATCH_SIZE": 8, "MCTS_C": 4, "MCTS_TRANSPOSITIONS": True, "MCTS_MAX_NODES": 100_000,
+                      "MCTS_THREADS": 1, "MCTS_NOISE": "ROOT", "MCTS_SPARSE_NOISE": True, "MCTS_WIDENING": None,
+                      "MCTS_SOLVER": True, "EVALUATION_CACHE_SIZE": 50_000,
+                      "FULL_SEARCH_PROBABILITY": 0.25, "FAST_MCTS_BUDGET": 130,
+                      "EVALUATION_ROOT_SELECTION": "GUMBEL", "GUMBEL_ACTIONS": 16,
+                      "MCTS_EARLY_STOP": "FORCED", "EVALUATION_EARLY_STOP": "SETTLED",
                       "NUM_WORKERS": 6, "ITERATIONS": 20, "DATA_GENERATION_EPISODES": 240,
                       "THRESHOLD": 0.55, "HEURISTIC_START_WEIGHT": 0, "HEURISTIC_END_WEIGHT": 0,
                       "HEURISTIC_STEPS": 1}
@@ -7,6 +7,7 @@ from simple_games.connect4.connect4_env.connect4_env import Connect4Env
 from simple_games.connect4.connect4_env.env_parameters.connect4_env_parameters import board_parameters, draw_parameters
 from trainer.self_play_model.self_play_model import SelfPlayModel
 from trainer.monte_carlo_tree_search.monte_carlo_tree_search import MonteCarloTreeSearch
+from trainer.root_parallel.root_parallel import RootParallelSearch
 
 HUMAN = True
 EPISODES = 5
@@ -14,16 +15,24 @@ NUM_SIMULATIONS = 10
 AI_PLAYER = 1
 
 
-def test_connect4(human, episodes, num_simulations, ai_player, model_name):
+def test_connect4(human, episodes, num_simulations, ai_player, model_name, max_nodes=None, num_workers=1,
+                  time_limit=None):
     env = Connect4Env(board_parameters, draw_parameters, to_render=True)
-    model = SelfPlayModel(f"./simple_games/connect4/{model_name}")
+    model_path = f"./simple_games/connect4/{model_name}"
+    search_parameters = {"max_nodes": max_nodes, "time_limit": time_limit}
+    if num_workers > 1:
+        mcts = RootParallelSearch(env, board_parameters, draw_parameters, model_path, num_workers,
+                                  NUM_SIMULATIONS, 0, search_parameters)
+    else:
+        model = SelfPlayModel(model_path)
+        # THE AI MOVES ARE DETERMINISTIC, SO THE SEARCH STOPS ONCE THE MOVE IS SETTLED
+        mcts = MonteCarloTreeSearch(env, model, NUM_SIMULATIONS, 0, early_stop="SETTLED", **search_parameters)
     for episode in range(EPISODES):
         done = False
         reward = 0
         current_state, actions_index = env.reset()
         state_player = env.refactor_state(current_state, env.player, env.move_counter)
         env.render()
-        mcts = MonteCarloTreeSearch(env, model, NUM_SIMULATIONS, heuristic_weight=0)
         root = None
         while not done:
             if env.player == AI_PLAYER:
@@ -54,8 +63,7 @@ def test_connect4(human, episodes, num_simulations, ai_player, model_name):
                                             break
                         pg.event.clear()
                     env.remove_mark(actions_index)
-            if root is not None:
-                root = root.children[action]
+            root = mcts.advance_root(root, action)
             new_state, reward, done, actions_index = env.step(action)
             current_state = new_state
             state_player = env.refactor_state(new_state, env.player, env.move_counter)
@@ -63,6 +71,8 @@ def test_connect4(human, episodes, num_simulations, ai_player, model_name):
         time.sleep(3)
         print(f"LAST PLAYER: {env.player}, REWARD: {reward}")
         print("====================================================")
+    if num_workers > 1:
+        mcts.close()
 
 
 # test_connect4(HUMAN, EPISODES, NUM_SIMULATIONS, AI_PLAYER)
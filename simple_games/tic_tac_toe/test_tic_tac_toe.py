@@ -5,22 +5,32 @@ import pygame as pg
 from simple_games.tic_tac_toe.tic_tac_toe_env.tic_tac_toe_env import TicTacToeEnv
 from trainer.self_play_model.self_play_model import SelfPlayModel
 from trainer.monte_carlo_tree_search.monte_carlo_tree_search import MonteCarloTreeSearch
+from trainer.root_parallel.root_parallel import RootParallelSearch
 from simple_games.tic_tac_toe.tic_tac_toe_env.env_parameters.tic_tac_toe_env_parameters import board_parameters, draw_parameters
 
 
-def test_tic_tac_toe(human, episodes, num_simulations, ai_player, model_name):
+def test_tic_tac_toe(human, episodes, num_simulations, ai_player, model_name, max_nodes=None, num_workers=1,
+                     time_limit=None):
     env = TicTacToeEnv(board_parameters, draw_parameters, to_render=True)
-    model = SelfPlayModel(f"./tic_tac_toe/saved_models/{model_name}")
+    model_path = f"./tic_tac_toe/saved_models/{model_name}"
+    search_parameters = {"max_nodes": max_nodes, "time_limit": time_limit}
+    if num_workers > 1:
+        mcts = RootParallelSearch(env, board_parameters, draw_parameters, model_path, num_workers,
+                                  num_simulations, 0, search_parameters)
+    else:
+        model = SelfPlayModel(model_path)
+        # THE AI MOVES ARE DETERMINISTIC, SO THE SEARCH STOPS ONCE THE MOVE IS SETTLED
+        mcts = MonteCarloTreeSearch(env, model, num_simulations, 0, early_stop="SETTLED", **search_parameters)
     for episode in range(episodes):
         done = False
         current_state, actions_index = env.reset()
         state_player = env.refactor_state(current_state, env.player, env.move_counter)
         reward = 0
         env.render()
+        root = None
         while not done:
             if env.player == ai_player:
-                mcts = MonteCarloTreeSearch(env, model, num_simulations, heuristic_weight=0)
-                root = mcts.run(current_state, state_player, env.player)
+                root = mcts.run(current_state, state_player, env.player, root)
                 action = root.select_action(temperature=0)
             else:
                 if not human:
@@ -47,6 +57,7 @@ def test_tic_tac_toe(human, episodes, num_simulations, ai_player, model_name):
                                             break
                         pg.event.clear()
                     env.remove_mark(actions_index)
+            root = mcts.advance_root(root, action)
             new_state, reward, done, actions_index = env.step(action)
             current_state = new_state
             state_player = env.refactor_state(new_state, env.player, env.move_counter)
@@ -54,3 +65,5 @@ def test_tic_tac_toe(human, episodes, num_simulations, ai_player, model_name):
         print(f"LAST PLAYER: {env.player}, REWARD: {reward}")
         print("=============================================")
         time.sleep(3)
+    if num_workers > 1:
+        mcts.close()
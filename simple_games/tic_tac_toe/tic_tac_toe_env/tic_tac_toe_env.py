@@ -4,6 +4,12 @@ import numpy as np
 
 from simple_games.tic_tac_toe.tic_tac_toe_env.env_parts.tic_tac_toe_board import Board
 
+# Indexes of all cells, to look up the Zobrist keys of a whole board at once
+ROWS, COLUMNS = np.indices((3, 3))
+
+# Seed of the Zobrist keys, changing it invalidates all stored keys (e.g. of the opening book)
+ZOBRIST_SEED = 20230830
+
 
 class TicTacToeEnv:
     """
@@ -53,9 +59,22 @@ class TicTacToeEnv:
                       (1, 0), (1, 1), (1, 2),
                       (2, 0), (2, 1), (2, 2))
 
+        # Index of every move in the list of all moves, for constant time conversions of the moves to indexes
+        self.move_indexes = {move: index for index, move in enumerate(self.moves)}
+
         # Initialize the game Board class
         self.board = Board(board_parameters, draw_parameters, self.moves, to_render)
 
+        # Zobrist keys - a random 64 bit key for the pieces of both players (index piece + 1) on every cell,
+        # and one for player -1 to move, the fixed seed gives the same keys in every process
+        zobrist_generator = np.random.default_rng(ZOBRIST_SEED)
+        self.zobrist_pieces = zobrist_generator.integers(0, 2 ** 64, size=(3, 3, 3), dtype=np.uint64)
+        self.zobrist_pieces[:, :, 1] = 0  # Empty cells don't change the key
+        self.zobrist_enemy = int(zobrist_generator.integers(0, 2 ** 64, dtype=np.uint64))
+
+        # Zobrist key of the game state, updated with every move made in step
+        self.hash_key = self.hash_state(self.board.np_board, 1)
+
     def render(self):
         """
         Wrapper method to render the game board
@@ -93,6 +112,7 @@ class TicTacToeEnv:
         self.player = 1
         self.enemy = -1
         self.board.reset()
+        self.hash_key = self.hash_state(self.board.np_board, 1)
         return np.copy(self.board.np_board), self.find_moves(self.board.np_board, 1, positions=None)
 
     @staticmethod
@@ -139,22 +159,61 @@ class TicTacToeEnv:
         return self.filter_moves(moves)
 
     @staticmethod
-    def hash_state(state):
+    def position_key(state, player, move_counter):
         """
-        Hash state to be used in the Monte-Carlo-Tree Search.
-        Experimental feature ...
+        Create a key identifying a position, used by the transposition table of the Monte-Carlo-Tree Search.
+        Unlike the hash of the state, the key is exact, so different positions never share a key
 
         :param state: state of the game
-        :return: hash code of the game state
+        :param player: player who is about to play
+        :param move_counter: how many moves have been made in round
+                             (not necessary for tic-tac-toe, as it follows from the board,
+                             only for compatibility reasons)
+        :return: key of the position
         """
 
-        array = []
-        for x in range(3):
-            row = tuple(state[x])
-            array.append(row)
-        array = tuple(array)
-        hash_value = hash(array)
-        return hash_value
+        return state.tobytes(), player
+
+    def hash_state(self, state, player):
+        """
+        Compute the Zobrist key of a state from scratch, a deterministic 64 bit key
+        of the pieces on the board and the player to move, e.g. for the opening book of the Monte-Carlo-Tree Search.
+        The key of the played game is kept up to date move by move in step (update_hash)
+
+        :param state: state of the game
+        :param player: player who is about to play
+        :return: Zobrist key of the game state
+        """
+
+        pieces = self.zobrist_pieces[ROWS, COLUMNS, state.astype(np.intp) + 1]
+        hash_key = int(np.bitwise_xor.reduce(pieces, axis=None))
+        return hash_key ^ self.zobrist_enemy if player == -1 else hash_key
+
+    def update_hash(self, hash_key, state, action, player):
+        """
+        Update a Zobrist key with a move, only the key of the placed piece and the player to move change
+
+        :param hash_key: Zobrist key of the state before the move
+        :param state: state of the game before the move
+        :param action: action to be performed
+        :param player: player making the move
+        :return: Zobrist key of the state after the move
+        """
+
+        x, y = self.moves[action]
+        return hash_key ^ int(self.zobrist_pieces[x, y, player + 1]) ^ self.zobrist_enemy
+
+    def legal_moves_mask(self, moves):
+        """
+        Create a boolean mask of the legal actions, used to mask the action probabilities in one operation
+
+        :param moves: list of move indexes, as returned by find_moves
+        :return: boolean array over the action space, True for the legal actions
+        """
+
+        mask = np.zeros(self.action_space, dtype=bool)
+        mask[moves] = True
+        return mask
 
     def filter_moves(self, moves):
         """
@@ -165,10 +224,7 @@ class TicTacToeEnv:
         :return: list of move indexes
         """
 
-        move_index = []
-        for move in moves:
-            index = self.moves.index(move)
-            move_index.append(index)
+        move_index = [self.move_indexes[move] for move in moves]
         move_index.sort()
         return move_index
 
@@ -184,6 +240,32 @@ class TicTacToeEnv:
 
         return self.board.make_move(state, action, player, to_render=None)
 
+    def make_move_in_place(self, state, action, player):
+        """
+        Make a move directly on the provided state, without copying it,
+        so a search can walk down and back up one board with unmake_move
+
+        :param state: state of the game, modified in place
+        :param action: action to be performed
+        :param player: player making the move
+        :return: undo record of the move - the (x, y) position of the placed piece
+        """
+
+        position = self.board.moves[action]
+        state[position[0], position[1]] = player
+        return position
+
+    @staticmethod
+    def unmake_move(state, undo):
+        """
+        Take back a move made with make_move_in_place
+
+        :param state: state of the game after the move, modified in place
+        :param undo: undo record returned by make_move_in_place
+        """
+
+        state[undo[0], undo[1]] = 0
+
     def check_win(self, state, player):
         """
         Check for game win for the last player based on the provided game state.
@@ -314,7 +396,8 @@ class TicTacToeEnv:
         :return: state of the game after move, reward for the new state, game over boolean, moves for the next state
         """
 
-        # Update the board based on the provided move
+        # Update the Zobrist key and the board based on the provided move
+        self.hash_key = self.update_hash(self.hash_key, self.board.np_board, action, self.player)
         self.board.np_board = self.board.make_move(self.board.np_board, action,
                                                    self.player, to_render=self.board.to_render)
 
@@ -3,6 +3,12 @@ trainer_parameters = {"LOAD": False, "MODEL_PATH": None,
                       "LOGGER_PATH": None,
                       "TEST_GAMES": 16, "TEST_BUDGET": 20, "DECAY": 0.9, "TOURNAMENT_GAMES": 16,
                       "TOURNAMENT_BUDGET": 100, "MEMORY_SIZE": 40_000, "MCTS_BUDGET": 200,
+                      "MCTS_BATCH_SIZE": 1, "MCTS_C": 4, "MCTS_TRANSPOSITIONS": False, "MCTS_MAX_NODES": 10_000,
+                      "MCTS_THREADS": 1, "MCTS_NOISE": "ROOT", "MCTS_SPARSE_NOISE": True, "MCTS_WIDENING": None,
+                      "MCTS_SOLVER": True, "EVALUATION_CACHE_SIZE": 10_000,
+                      "FULL_SEARCH_PROBABILITY": 1, "FAST_MCTS_BUDGET": 50,
+                      "EVALUATION_ROOT_SELECTION": "GUMBEL", "GUMBEL_ACTIONS": 16,
+                      "MCTS_EARLY_STOP": "FORCED", "EVALUATION_EARLY_STOP": "SETTLED",
                       "NUM_WORKERS": 8, "ITERATIONS": 20, "DATA_GENERATION_EPISODES": 640,
                       "THRESHOLD": 0.55, "HEURISTIC_START_WEIGHT": 0, "HEURISTIC_END_WEIGHT": 0,
                       "HEURISTIC_STEPS": 10}
@@ -5,6 +5,7 @@ import numpy as np
 
 from checkers.checkers_env.checkers_env import CheckersEnv
 from trainer.monte_carlo_tree_search.monte_carlo_tree_search import MonteCarloTreeSearch
+from trainer.monte_carlo_tree_search.search_statistics.search_statistics import SearchStatistics
 from trainer.self_play_model.self_play_model import SelfPlayModel
 from simple_games.tic_tac_toe.tic_tac_toe_env.tic_tac_toe_env import TicTacToeEnv
 from simple_games.connect4.connect4_env.connect4_env import Connect4Env
@@ -28,9 +29,11 @@ def filter_actions(root, env):
 
 
 def finish_episode_np(state_buffer, action_probs_buffer, reward_buffer,
-                      train_data, reward, last_player, decay, last_index):
+                      train_data, reward, last_player, decay, last_index, episode_length):
     """
-    Add the data generated during an episode to the data arrays
+    Add the data generated during an episode to the data arrays.
+    Not every move of the episode has to be recorded, so the reward is decayed by the distance of the move
+    from the end of the episode, not by its position in the episode data
 
     :param state_buffer: numpy array storing the input to the model (usually game states)
     :param action_probs_buffer: numpy array with action probabilities at a given state
@@ -40,17 +43,18 @@ def finish_episode_np(state_buffer, action_probs_buffer, reward_buffer,
     :param last_player: the player who should have played after game over
     :param decay: reward decay rate
     :param last_index: number of generated elements already in the arrays
+    :param episode_length: number of moves made in the episode
     :return: the number of generated elements after the adding the episode data
     """
 
     count = 0
 
-    # Iterate over the list, starting from the last elements - necessary for decay
-    for state, player, action_probs, mcts_value in reversed(train_data):
+    # Iterate over the list, starting from the last elements
+    for state, player, action_probs, mcts_value, move in reversed(train_data):
         index = count + last_index
 
         # Decay the reward, as the reward is most influential towards the end of the game
-        adjusted_reward = (reward * (decay ** count))
+        adjusted_reward = (reward * (decay ** (episode_length - 1 - move)))
 
         # If the data element was generated for the player who lost, then invert the environment reward
         if last_player == player:
@@ -70,9 +74,13 @@ def finish_episode_np(state_buffer, action_probs_buffer, reward_buffer,
 
 
 def generate_data(env_name, board_parameters, draw_parameters, generation_episodes,
-                  num_workers, num_simulations, decay, heuristic_weight):
+                  num_workers, num_simulations, decay, heuristic_weight, search_parameters,
+                  cache_size, full_search_probability=1, fast_simulations=None):
     """
-    Generate training data through self-play and return it to the main training process
+    Generate training data through self-play and return it to the main training process.
+    With playout cap randomization (full search probability below 1), only the moves which get the full search
+    are recorded as training data, the other moves get a cheap search with the fast budget
+    and are only used to advance the game, so more games are played with the same computation
 
     :param env_name: name of the environment from which the data should be generated (the one used for training)
     :param board_parameters: parameters for the game board
@@ -82,9 +90,22 @@ def generate_data(env_name, board_parameters, draw_parameters, generation_episod
     :param num_simulations: number of simulation steps to be run in the Monte-Carlo-Tree Search
     :param decay: reward decay rate, parameter for the value future rewards
     :param heuristic_weight: weight the heuristics are assigned in the Monte-Carlo-Tree Search
-    :return:
+    :param search_parameters: keyword arguments of the Monte-Carlo-Tree Search (e.g. leaf evaluation batch size)
+    :param cache_size: number of model evaluations kept in the LRU evaluation cache of the process, 0 disables it
+    :param full_search_probability: probability of a move getting the full search and being recorded,
+                                    1 to run the full search on every move
+    :param fast_simulations: number of simulation steps of the fast search of the moves which are not recorded,
+                             None for the same number as the full search
+    :return: arrays with the generated states, action probabilities and rewards, the number of generated elements,
+             statistics of the searches (and the evaluation cache) of the process
     """
 
+    # The fast moves without a budget would need a time limit, otherwise their searches would never stop
+    if fast_simulations is None:
+        fast_simulations = num_simulations
+    if fast_simulations is None and search_parameters.get("time_limit") is None:
+        raise ValueError("THE FAST SEARCHES NEED A SIMULATION BUDGET OR A TIME LIMIT")
+
     # Disable GPU, force all operations to run on the CPU
     os.environ["CUDA_VISIBLE_DEVICES"] = ""
     tf.config.set_visible_devices([], 'GPU')
@@ -111,7 +132,10 @@ def generate_data(env_name, board_parameters, draw_parameters, generation_episod
     generate_data_reward = np.zeros(max_steps, dtype=np.float32)
 
     # Load the model used in the data generation
-    model = SelfPlayModel("saved_models/data_generation_models/actor-critic-self_play.h5")
+    model = SelfPlayModel("saved_models/data_generation_models/actor-critic-self_play.h5", cache_size)
+
+    # Counters and timers shared by the searches of all episodes, returned to the main training process
+    statistics = SearchStatistics()
 
     # Run the data generation episodes
     for data_episode in range(worker_episodes):
@@ -126,22 +150,36 @@ def generate_data(env_name, board_parameters, draw_parameters, generation_episod
 
         # Initialize the Monte-Carlo-Tree Search for 1 round, the temperature parameter adjusts the randomness of
         # action selection, infinity is random, 0 is deterministic.
-        mcts = MonteCarloTreeSearch(env, model, num_simulations, heuristic_weight)
+        mcts = MonteCarloTreeSearch(env, model, num_simulations, heuristic_weight,
+                                    statistics=statistics, **search_parameters)
         root = None
         temperature = 2
+        noise = mcts.noise
 
         # Main loop for 1 round
         while not done:
+            # Decide if the move gets the full search and is recorded, or only the fast search (playout cap)
+            full_search = mcts.rng.random() < full_search_probability
+            mcts.budget = num_simulations if full_search else fast_simulations
+
+            # The fast moves only advance the game, so they get no dirichlet noise and stay close to the policy.
+            # A root reused from a fast search has no noise, run adds it only to the roots of the "ROOT" policy
+            if full_search and mcts.noise != noise and noise == "ALL":
+                root = None
+            mcts.noise = noise if full_search else "NONE"
+
             # Run a Monte-Carlo-Tree Search simulation to find the optimal action
             root = mcts.run(current_state, state_player, env.player, root)
-            action = root.select_action(temperature=temperature)
+            action = mcts.select_action(root, temperature=temperature)
             action_probs = filter_actions(root, env)
 
-            # Shift the root of the tree to the node of the chosen action
-            root = root.children[action]
+            # Shift the root of the tree to the node of the chosen action, discarding the rest of the tree
+            root = mcts.advance_root(root, action)
 
-            # Add the data from the step to the episode data list
-            episode_train_examples.append((state_player, env.player, action_probs, root.value()))
+            # Add the data from the step to the episode data list, the moves of the fast search are not recorded
+            if full_search:
+                episode_train_examples.append((state_player, env.player, action_probs, root.value(),
+                                               env.move_counter))
 
             # Update the environment based on the chosen action
             new_state, reward, done, actions_index = env.step(action)
@@ -156,5 +194,9 @@ def generate_data(env_name, board_parameters, draw_parameters, generation_episod
 
         # Add the episode data the data arrays and update the total element count in buffers
         num_elements = finish_episode_np(generate_data_state, generate_data_action_probs, generate_data_reward,
-                                         episode_train_examples, reward, env.player, decay, num_elements)
-    return generate_data_state, generate_data_action_probs, generate_data_reward, num_elements
+                                         episode_train_examples, reward, env.player, decay, num_elements,
+                                         env.move_counter)
+
+    # The evaluation cache of the process is reported with the search statistics
+    statistics.record_cache(model.cache_statistics())
+    return generate_data_state, generate_data_action_probs, generate_data_reward, num_elements, statistics
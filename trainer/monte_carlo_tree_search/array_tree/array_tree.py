@@ -0,0 +1,595 @@
+import numpy as np
+from numba import jit
+
+from trainer.monte_carlo_tree_search.score.score import select_ucb, select_ucb_widened, UNPROVEN
+from trainer.monte_carlo_tree_search.utils.utils import sample_action, pack_state, unpack_state
+
+
+@jit(nopython=True, nogil=True)
+def select_path(visit_counts, value_sums, priors, first_child, num_children, winning_children, proven,
+                root, c, virtual_loss, path, widening_constant=0.0, widening_exponent=0.0):
+    """
+    Descend the tree from the root, until a node which has not been expanded yet (or a proven node) is reached,
+    and add virtual loss to the nodes on the path, so other threads are steered to different leaves.
+    The GIL is released, so the threads can do their environment and model work in the meantime.
+
+    :param visit_counts: array with the visit counts of all nodes in the tree
+    :param value_sums: array with the summed values of all nodes in the tree
+    :param priors: array with the priors of all nodes in the tree
+    :param first_child: array with the index of the first child of all nodes in the tree
+    :param num_children: array with the number of children of all nodes in the tree
+    :param winning_children: array with the immediately winning child of all nodes in the tree
+    :param proven: array with the proven results of all nodes in the tree
+    :param root: index of the root node
+    :param c: exploration constant of the ucb score
+    :param virtual_loss: number of lost visits added to the nodes on the path
+    :param path: array filled with the node indexes leading to the leaf
+    :param widening_constant: constant of progressive widening, 0 to consider all children
+    :param widening_exponent: exponent of progressive widening
+    :return: length of the path
+    """
+
+    node = root
+    path[0] = node
+    length = 1
+    while num_children[node] > 0 and proven[node] == UNPROVEN and length < len(path):
+        if winning_children[node] != -1:
+            node = winning_children[node]
+        else:
+            first = first_child[node]
+            last = first + num_children[node]
+            if widening_constant > 0:
+                node = first + select_ucb_widened(c, visit_counts[node], priors[first:last], value_sums[first:last],
+                                                  visit_counts[first:last], proven[first:last],
+                                                  widening_constant, widening_exponent)
+            else:
+                node = first + select_ucb(c, visit_counts[node], priors[first:last],
+                                          value_sums[first:last], visit_counts[first:last], proven[first:last])
+        path[length] = node
+        length += 1
+
+    for i in range(length):
+        visit_counts[path[i]] += virtual_loss
+        value_sums[path[i]] -= virtual_loss
+    return length
+
+
+@jit(nopython=True, nogil=True)
+def revert_virtual_loss(visit_counts, value_sums, path, virtual_loss):
+    """
+    Remove the virtual loss added to the nodes on the path, once its leaf has been evaluated
+
+    :param visit_counts: array with the visit counts of all nodes in the tree
+    :param value_sums: array with the summed values of all nodes in the tree
+    :param path: array with the node indexes leading to the leaf
+    :param virtual_loss: number of lost visits added to the nodes on the path
+    """
+
+    for i in range(len(path)):
+        visit_counts[path[i]] -= virtual_loss
+        value_sums[path[i]] += virtual_loss
+
+
+@jit(nopython=True, nogil=True)
+def backpropagate_path(visit_counts, value_sums, path, value):
+    """
+    Backpropagate the value from the environment termination to all its ancestors,
+    stored as indexes of the tree arrays. The sign of the value alternates going up the path,
+    as every node keeps its value from the perspective of the player who made the move into it
+
+    :param visit_counts: array with the visit counts of all nodes in the tree
+    :param value_sums: array with the summed values of all nodes in the tree
+    :param path: array with the node indexes leading to the termination
+    :param value: value at the termination, from the perspective of the player who made the last move
+    """
+
+    for i in range(len(path) - 1, -1, -1):
+        index = path[i]
+        value_sums[index] += value
+        visit_counts[index] += 1
+        value = -value
+
+
+class ArrayTree:
+    """
+    Class storing a whole Monte-Carlo-Tree as a struct of arrays, instead of one Python object per node.
+    Every node is an index into preallocated NumPy arrays (visit counts, value sums, priors, ...),
+    the children of a node are stored next to each other, so a node only keeps the offset of its first child
+    and the number of children. The arrays grow (double in size) when the node pool is exhausted.
+    """
+
+    def __init__(self, capacity=4096):
+        """
+        Initialize the node pool of the tree
+
+        :param capacity: number of nodes the arrays can initially hold
+        """
+
+        self.capacity = capacity
+        self.size = 0
+
+        # Statistics of the nodes
+        self.visit_counts = np.zeros(capacity, dtype=np.int32)
+        self.value_sums = np.zeros(capacity, dtype=np.float64)
+        self.priors = np.zeros(capacity, dtype=np.float32)
+        self.players = np.zeros(capacity, dtype=np.int8)
+
+        # Results of the nodes proven by the search (MCTS-solver), from the perspective of the player
+        # who made the move into the node, like the value sums
+        self.proven = np.full(capacity, UNPROVEN, dtype=np.int8)
+
+        # Structure of the tree, -1 indicates no parent / no children
+        self.actions = np.full(capacity, -1, dtype=np.int32)
+        self.parents = np.full(capacity, -1, dtype=np.int32)
+        self.first_child = np.full(capacity, -1, dtype=np.int32)
+        self.num_children = np.zeros(capacity, dtype=np.int32)
+
+        # Child winning immediately, found when the node is expanded, -1 if there is none
+        self.winning_children = np.full(capacity, -1, dtype=np.int32)
+
+        # Zobrist keys of the positions, kept only for the positions in the moves of the opening book
+        self.hash_keys = np.zeros(capacity, dtype=np.uint64)
+
+        # Environment states, only kept for the expanded nodes, stored compactly as int8 boards
+        self.states = {}
+
+    def clear(self):
+        """
+        Remove all nodes from the tree, the allocated arrays are kept for the next search
+        """
+
+        self.visit_counts[:self.size] = 0
+        self.value_sums[:self.size] = 0
+        self.priors[:self.size] = 0
+        self.players[:self.size] = 0
+        self.proven[:self.size] = UNPROVEN
+        self.actions[:self.size] = -1
+        self.parents[:self.size] = -1
+        self.first_child[:self.size] = -1
+        self.num_children[:self.size] = 0
+        self.winning_children[:self.size] = -1
+        self.hash_keys[:self.size] = 0
+        self.states = {}
+        self.size = 0
+
+    def grow(self, min_capacity):
+        """
+        Double the capacity of the node pool, until it can hold at least the requested number of nodes
+
+        :param min_capacity: the number of nodes the arrays need to hold
+        """
+
+        capacity = self.capacity
+        while capacity < min_capacity:
+            capacity *= 2
+
+        def resize(array, fill_value):
+            new_array = np.full(capacity, fill_value, dtype=array.dtype)
+            new_array[:self.capacity] = array
+            return new_array
+
+        self.visit_counts = resize(self.visit_counts, 0)
+        self.value_sums = resize(self.value_sums, 0)
+        self.priors = resize(self.priors, 0)
+        self.players = resize(self.players, 0)
+        self.proven = resize(self.proven, UNPROVEN)
+        self.actions = resize(self.actions, -1)
+        self.parents = resize(self.parents, -1)
+        self.first_child = resize(self.first_child, -1)
+        self.num_children = resize(self.num_children, 0)
+        self.winning_children = resize(self.winning_children, -1)
+        self.hash_keys = resize(self.hash_keys, 0)
+        self.capacity = capacity
+
+    def allocate(self, num_nodes):
+        """
+        Reserve a contiguous block of nodes in the pool
+
+        :param num_nodes: number of nodes to reserve
+        :return: index of the first reserved node
+        """
+
+        if self.size + num_nodes > self.capacity:
+            self.grow(self.size + num_nodes)
+        first = self.size
+        self.size += num_nodes
+        return first
+
+    def new_root(self, player):
+        """
+        Create a node with no ancestors - the start of the tree
+
+        :param player: the player who is about to make a move
+        :return: view of the root node
+        """
+
+        index = self.allocate(1)
+        self.players[index] = player
+        return ArrayNode(self, index)
+
+    def expand(self, index, state, player, action_probs, winning_action=None):
+        """
+        Expand the node by creating children nodes for all actions with non-zero probability
+
+        :param index: index of the expanded node
+        :param state: the environment state of the node
+        :param player: the player who is about to make a move in the node
+        :param action_probs: probabilities of the actions arising in the node's state
+        :param winning_action: action winning immediately from the node, None if there is none
+        """
+
+        actions = np.flatnonzero(action_probs)
+        first = self.allocate(len(actions))
+        last = first + len(actions)
+
+        self.players[index] = player
+        self.states[index] = pack_state(state)
+        self.first_child[index] = first
+        self.num_children[index] = len(actions)
+
+        self.priors[first:last] = action_probs[actions]
+        self.players[first:last] = player
+        self.actions[first:last] = actions
+        self.parents[first:last] = index
+
+        if winning_action is not None:
+            self.winning_children[index] = first + np.searchsorted(actions, winning_action)
+
+    def share(self, index, other_index):
+        """
+        Turn the node into a transposition of an already expanded node, by pointing it
+        to the same block of children, so the children statistics are shared
+
+        :param index: index of the node reaching the position by a different order of moves
+        :param other_index: index of the expanded node with the same position
+        """
+
+        self.players[index] = self.players[other_index]
+        self.states[index] = self.states[other_index]
+        self.first_child[index] = self.first_child[other_index]
+        self.num_children[index] = self.num_children[other_index]
+        self.winning_children[index] = self.winning_children[other_index]
+
+    def prune(self, index):
+        """
+        Remove the children of the node, turning it back into a leaf.
+        The space of the removed nodes is freed by the next compaction.
+        The expansion set the player to the one about to move in the node, the leaf keeps the player making the move
+
+        :param index: index of the pruned node
+        """
+
+        if self.num_children[index] > 0:
+            self.players[index] = -self.players[index]
+        self.first_child[index] = -1
+        self.num_children[index] = 0
+        self.winning_children[index] = -1
+        self.states.pop(index, None)
+
+    def compact(self, index):
+        """
+        Move the subtree of the node to the front of the node pool, with the node as the new root of the tree.
+        The rest of the nodes (e.g. the siblings of the played action) are discarded, freeing their space in the pool
+
+        :param index: index of the new root
+        :return: view of the new root
+        """
+
+        # Order the retained nodes breadth-first, so every block of children stays contiguous,
+        # a block shared by transpositions is only moved once
+        order = [index]
+        blocks = set()
+        position = 0
+        while position < len(order):
+            node = order[position]
+            first = self.first_child[node]
+            if self.num_children[node] > 0 and first not in blocks:
+                blocks.add(first)
+                order.extend(range(first, first + self.num_children[node]))
+            position += 1
+
+        size = len(order)
+        old_indexes = np.array(order, dtype=np.int64)
+        new_indexes = np.full(self.capacity, -1, dtype=np.int32)
+        new_indexes[old_indexes] = np.arange(size, dtype=np.int32)
+
+        def move(array, fill_value, remap=False):
+            new_array = np.full(self.capacity, fill_value, dtype=array.dtype)
+            values = array[old_indexes]
+            if remap:
+                values = np.where(values >= 0, new_indexes[values], -1)
+            new_array[:size] = values
+            return new_array
+
+        self.visit_counts = move(self.visit_counts, 0)
+        self.value_sums = move(self.value_sums, 0)
+        self.priors = move(self.priors, 0)
+        self.players = move(self.players, 0)
+        self.proven = move(self.proven, UNPROVEN)
+        self.actions = move(self.actions, -1)
+        self.parents = move(self.parents, -1, remap=True)
+        self.first_child = move(self.first_child, -1, remap=True)
+        self.num_children = move(self.num_children, 0)
+        self.winning_children = move(self.winning_children, -1, remap=True)
+        self.hash_keys = move(self.hash_keys, 0)
+        self.parents[0] = -1
+
+        self.states = {int(new_indexes[old_index]): state for old_index, state in self.states.items()
+                       if new_indexes[old_index] != -1}
+        self.size = size
+        return ArrayNode(self, 0)
+
+    def backpropagate(self, path, value):
+        """
+        Backpropagate the value from the environment termination to all its ancestors
+
+        :param path: list of node indexes leading to the termination
+        :param value: value at the termination, from the perspective of the player who made the last move
+        """
+
+        backpropagate_path(self.visit_counts, self.value_sums, np.array(path, dtype=np.int32), value)
+
+
+class ArrayNode:
+    """
+    View of a single node stored in an ArrayTree.
+    It exposes the same interface as Node, so the array-backed tree can be used as a drop-in replacement
+    by the Monte-Carlo-Tree Search and the code consuming its root node.
+    """
+
+    __slots__ = ("tree", "index")
+
+    def __init__(self, tree, index):
+        """
+        Create a view of the node
+
+        :param tree: the ArrayTree holding the node
+        :param index: index of the node in the tree arrays
+        """
+
+        self.tree = tree
+        self.index = index
+
+    def __eq__(self, other):
+        return isinstance(other, ArrayNode) and self.tree is other.tree and self.index == other.index
+
+    def __hash__(self):
+        return hash((id(self.tree), self.index))
+
+    @property
+    def visit_count(self):
+        return int(self.tree.visit_counts[self.index])
+
+    @visit_count.setter
+    def visit_count(self, visit_count):
+        self.tree.visit_counts[self.index] = visit_count
+
+    @property
+    def value_sum(self):
+        return float(self.tree.value_sums[self.index])
+
+    @value_sum.setter
+    def value_sum(self, value_sum):
+        self.tree.value_sums[self.index] = value_sum
+
+    @property
+    def prior(self):
+        return float(self.tree.priors[self.index])
+
+    @property
+    def proven(self):
+        return int(self.tree.proven[self.index])
+
+    @proven.setter
+    def proven(self, proven):
+        self.tree.proven[self.index] = proven
+
+    @property
+    def player(self):
+        return int(self.tree.players[self.index])
+
+    @player.setter
+    def player(self, player):
+        self.tree.players[self.index] = player
+
+    @property
+    def hash_key(self):
+        return int(self.tree.hash_keys[self.index])
+
+    @hash_key.setter
+    def hash_key(self, hash_key):
+        self.tree.hash_keys[self.index] = hash_key
+
+    @property
+    def state(self):
+        packed_state = self.tree.states.get(self.index)
+        return None if packed_state is None else unpack_state(packed_state)
+
+    @property
+    def child_priors(self):
+        first = self.tree.first_child[self.index]
+        return self.tree.priors[first:first + self.tree.num_children[self.index]]
+
+    @property
+    def winning_action(self):
+        winning_child = self.tree.winning_children[self.index]
+        return None if winning_child == -1 else int(self.tree.actions[winning_child])
+
+    @property
+    def child_actions(self):
+        first = self.tree.first_child[self.index]
+        return self.tree.actions[first:first + self.tree.num_children[self.index]]
+
+    @property
+    def child_visit_counts(self):
+        first = self.tree.first_child[self.index]
+        return self.tree.visit_counts[first:first + self.tree.num_children[self.index]]
+
+    @property
+    def child_value_sums(self):
+        first = self.tree.first_child[self.index]
+        return self.tree.value_sums[first:first + self.tree.num_children[self.index]]
+
+    @property
+    def child_proven(self):
+        first = self.tree.first_child[self.index]
+        return self.tree.proven[first:first + self.tree.num_children[self.index]]
+
+    @property
+    def children(self):
+        """
+        Build a dictionary mapping the actions to views of the children,
+        for compatibility with the Node interface
+
+        :return: dictionary of action - child node pairs
+        """
+
+        first = self.tree.first_child[self.index]
+        return {int(self.tree.actions[child]): ArrayNode(self.tree, child)
+                for child in range(first, first + self.tree.num_children[self.index])}
+
+    def expanded(self):
+        """
+        Check the number of children the node has, if has any,
+        that means that the node has been expanded.
+
+        :return: boolean whether the node is expanded
+        """
+
+        return self.tree.num_children[self.index] > 0
+
+    def get_child(self, action):
+        """
+        Get the child reached by the action, the actions of the children are sorted, so it is found by bisection
+
+        :param action: the action leading to the child
+        :return: view of the child node, None if the node has no child for this action
+        """
+
+        first = self.tree.first_child[self.index]
+        actions = self.tree.actions[first:first + self.tree.num_children[self.index]]
+        position = np.searchsorted(actions, action)
+        if position == len(actions) or actions[position] != action:
+            return None
+        return ArrayNode(self.tree, first + position)
+
+    def value(self):
+        """
+        Get the average value of the node
+
+        :return: value of the node
+        """
+
+        visit_count = self.tree.visit_counts[self.index]
+        if visit_count == 0:
+            return 0
+        return self.tree.value_sums[self.index] / visit_count
+
+    def select_action(self, temperature, rng=None):
+        """
+        Select an action based on the visit counts of the children
+
+        :param temperature: parameter to adjust the randomness of the action choice,
+                            0 - deterministic action based on the visit counts,
+                           infinity - action choice with uniform probabilities,
+                           in-between - probabilities dependent on the visit count
+        :param rng: NumPy random generator used for the random choices, None for the global NumPy generator
+        :return: the selected action of the tree
+        """
+
+        first = self.tree.first_child[self.index]
+        last = first + self.tree.num_children[self.index]
+        return sample_action(self.tree.actions[first:last], self.tree.visit_counts[first:last], temperature,
+                             self.tree.proven[first:last], rng)
+
+    def select_dict_action(self, env, path_length, start_player):
+        """
+        Look up the move of the opening book of the environment, like Node.select_dict_action
+
+        :param env: the environment, with the opening book
+        :param path_length: length of the search path leading to this node
+        :param start_player: the player who started the search
+        :return: the move of the opening book, None if the position is not in the book
+        """
+
+        move_count = env.move_counter + path_length - 1
+        if move_count > env.optimal_move_count or start_player != self.player:
+            return None
+        return env.optimal_start_moves.get(self.hash_key)
+
+    def select_child(self, env, path_length, start_player, c=4, widening=None):
+        """
+        Select the child to simulate next, the move of the opening book or a winning action
+        (found when the node was expanded) is always picked, otherwise the child with the highest ucb score
+
+        :param env: the environment, where the actions are played out
+        :param path_length: length of the search path leading to this node
+        :param start_player: the player who started the search
+        :param c: exploration constant of the ucb score
+        :param widening: (constant, exponent) of progressive widening, None to consider all children
+        :return: the selected action, view of the selected child
+        """
+
+        # The move of the opening book is only followed, if it is one of the children
+        dict_action = self.select_dict_action(env, path_length, start_player)
+        dict_child = None if dict_action is None else self.get_child(dict_action)
+        if dict_child is not None:
+            return dict_action, dict_child
+
+        tree = self.tree
+        first = tree.first_child[self.index]
+        last = first + tree.num_children[self.index]
+
+        winning_child = tree.winning_children[self.index]
+        if winning_child != -1:
+            return int(tree.actions[winning_child]), ArrayNode(tree, winning_child)
+
+        if widening is None:
+            best = first + select_ucb(c, tree.visit_counts[self.index], tree.priors[first:last],
+                                      tree.value_sums[first:last], tree.visit_counts[first:last],
+                                      tree.proven[first:last])
+        else:
+            best = first + select_ucb_widened(c, tree.visit_counts[self.index], tree.priors[first:last],
+                                              tree.value_sums[first:last], tree.visit_counts[first:last],
+                                              tree.proven[first:last], *widening)
+        return int(tree.actions[best]), ArrayNode(tree, best)
+
+    def expand(self, state, player, action_probs, winning_action=None):
+        """
+        Expand this node by creating children nodes
+        with all the possible actions arising from this node,
+        i.e. all actions with non-zero probability.
+
+        :param state: the environment state of the node
+        :param player: the player who is about to make a move in the node
+        :param action_probs: probabilities of the actions arising in the node's state
+        :param winning_action: action winning immediately from this node, None if there is none
+        """
+
+        self.tree.expand(self.index, state, player, action_probs, winning_action)
+
+    def share(self, node):
+        """
+        Turn this node into a transposition of an already expanded node
+
+        :param node: view of the expanded node with the same position
+        """
+
+        self.tree.share(self.index, node.index)
+
+    def set_child_priors(self, child_priors):
+        """
+        Replace the priors of the children, e.g. when noise is added to the priors of a reused root
+
+        :param child_priors: new priors, in the order of the children
+        """
+
+        first = self.tree.first_child[self.index]
+        self.tree.priors[first:first + self.tree.num_children[self.index]] = child_priors
+
+    def prune(self):
+        """
+        Remove the children of this node, turning it back into a leaf
+        """
+
+        self.tree.prune(self.index)
@@ -1,9 +1,17 @@
+import math
 import time
+from heapq import heappush, heappop
+from itertools import count
+from threading import Lock, Thread
 
 import numpy as np
 
 from trainer.monte_carlo_tree_search.node.node import Node
-from trainer.monte_carlo_tree_search.utils.utils import apply_dirichlet_noise, normalize_action
+from trainer.monte_carlo_tree_search.array_tree.array_tree import ArrayTree, ArrayNode, select_path, revert_virtual_loss
+from trainer.monte_carlo_tree_search.score.score import UNPROVEN, proven_result, node_value
+from trainer.monte_carlo_tree_search.search_statistics.search_statistics import SearchStatistics
+from trainer.monte_carlo_tree_search.utils.utils import (apply_dirichlet_noise, apply_legal_dirichlet_noise,
+                                                         normalize_action, count_tree_nodes)
 
 
 class MonteCarloTreeSearch:
@@ -14,30 +22,251 @@ class MonteCarloTreeSearch:
     trained via reinforcement learning, via domain-specific knowledge, or environment feedback.
     """
 
-    def __init__(self, env, model, budget, heuristic_weight, alpha=1, epsilon=0.25):
+    def __init__(self, env, model, budget, heuristic_weight, alpha=1, epsilon=0.25, array_tree=False,
+                 batch_size=1, virtual_loss=1, c=4, transposition_table=False, max_nodes=None,
+                 num_threads=1, time_limit=None, soft_time_fraction=0.5, noise="ALL", sparse_noise=False,
+                 widening_constant=None, widening_exponent=0.5, statistics=None, solver=False, root_selection="PUCT",
+                 gumbel_actions=16, gumbel_scale=1.0, gumbel_visit_constant=50, gumbel_value_scale=0.1,
+                 early_stop="NONE", seed=None):
         """
         Initialize the parameters of the Monte Carlo Tree,
         and the dirichlet noise used in it.
 
         :param env: the environment providing state and actions
         :param model: neural networks for action probability and state value calculation
-        :param budget: the maximum number of rollouts to perform
+        :param budget: the maximum number of rollouts to perform, None for no limit (only with a time limit)
         :param heuristic_weight: weight provided to domain specific information
         :param alpha: alpha parameter of dirichlet noise
         :param epsilon: epsilon parameter of dirichlet noise
+        :param array_tree: store the tree in preallocated NumPy arrays (ArrayTree) instead of Node objects
+        :param batch_size: number of leaves evaluated together in one neural network call
+        :param virtual_loss: number of lost visits temporarily added to the path of a leaf waiting for evaluation
+        :param c: exploration constant of the ucb score used to select the children
+        :param transposition_table: share the children statistics and neural network evaluations
+                                    of positions reached by different orders of moves
+        :param max_nodes: maximum number of nodes kept in the tree reused between moves, None for no limit
+        :param num_threads: number of threads evaluating leaves concurrently (threaded batched evaluation),
+                            the tree is array-backed and every access to it is serialized by one lock
+        :param time_limit: hard deadline of a search in seconds, None for searches limited only by the rollouts
+        :param soft_time_fraction: fraction of the time limit after which the search stops,
+                                   if the most visited action is also the one with the best value
+        :param noise: where dirichlet noise is added to the priors - "ALL" nodes, only the "ROOT" or "NONE"
+        :param sparse_noise: draw the dirichlet noise only over the legal actions, instead of the whole action space
+        :param widening_constant: number of the highest prior children considered after the first visit of a node,
+                                  growing with the visits (progressive widening), None to consider all children
+        :param widening_exponent: rate at which the number of considered children grows with the visits of a node
+        :param statistics: SearchStatistics collecting the counters and timers of the searches,
+                           None to collect them only for this object
+        :param solver: prove the results of the nodes from the terminal states (MCTS-solver),
+                       the proven subtrees are not searched and the search stops once the root is proven
+        :param root_selection: how the actions of the root are searched and chosen - "PUCT" (ucb score with noise)
+                               or "GUMBEL" (Gumbel top-k sampling with sequential halving, for small budgets)
+        :param gumbel_actions: number of root actions sampled for the sequential halving
+        :param gumbel_scale: scale of the Gumbel noise, 0 to consider the actions with the highest priors
+        :param gumbel_visit_constant: visit count added to the maximum child visit count,
+                                      when the values of the root actions are scaled for the halving
+        :param gumbel_value_scale: weight of the values of the root actions compared to their priors
+        :param early_stop: when the search stops before using up its budget - "NONE" (never),
+                           "FORCED" (after the first simulation, if there is only one legal action),
+                           "SETTLED" (also once the remaining simulations can't change the most visited action,
+                           only for deterministic action choices, as it distorts the visit distribution)
+        :param seed: seed of the random generator of the search (noise, action choices),
+                     a fixed position and seed give identical trees, None for a random seed
         """
 
         self.env = env
         self.model = model
-        self.budget = budget
         self.alpha = alpha
         self.epsilon = epsilon
+
+        # Random generator of this search, independent of the global NumPy generator
+        self.rng = np.random.default_rng(seed)
         self.heuristic_weight = heuristic_weight
+        self.c = c
+
+        # Dirichlet noise policy
+        if noise not in ("ALL", "ROOT", "NONE"):
+            raise ValueError(f"NOISE '{noise}' IS INCORRECT, TRY - 'ALL', 'ROOT', 'NONE'")
+        self.noise = noise
+        self.sparse_noise = sparse_noise
+
+        # Progressive widening parameters, None if all children are considered
+        self.widening = None if widening_constant is None else (widening_constant, widening_exponent)
+
+        # Batched leaf evaluation parameters
+        self.batch_size = batch_size
+        self.virtual_loss = virtual_loss
+
+        # Positions expanded during the search, mapping the position key to the node and its value
+        self.transposition_table = transposition_table
+        self.transpositions = {}
+
+        # Time control of the search, the time limit is never exceeded
+        # (apart from finishing the simulation in progress)
+        self.time_limit = time_limit
+        self.soft_time_fraction = soft_time_fraction
+
+        # Threaded batched evaluation, the threads share one tree, which has to be array-backed
+        self.num_threads = num_threads
+
+        # The array-backed tree is allocated once and its node pool reused between searches
+        self.array_tree = array_tree or num_threads > 1
+        self.tree = ArrayTree() if self.array_tree else None
+
+        # Limit of the tree size, enforced when the root is shifted to the next move
+        self.max_nodes = max_nodes
+
+        # Proving the wins, losses and draws of the nodes (MCTS-solver)
+        self.solver = solver
+
+        # Root action selection, the action chosen by the last Gumbel search (None for PUCT)
+        if root_selection not in ("PUCT", "GUMBEL"):
+            raise ValueError(f"ROOT SELECTION '{root_selection}' IS INCORRECT, TRY - 'PUCT', 'GUMBEL'")
+        self.root_selection = root_selection
+        self.gumbel_actions = gumbel_actions
+        self.gumbel_scale = gumbel_scale
+        self.gumbel_visit_constant = gumbel_visit_constant
+        self.gumbel_value_scale = gumbel_value_scale
+        self.gumbel_action = None
+
+        # The budget is checked against the time limit and the root selection, also when it is changed later
+        self.budget = budget
+
+        # Stopping the search once the chosen action can't change
+        if early_stop not in ("NONE", "FORCED", "SETTLED"):
+            raise ValueError(f"EARLY STOP '{early_stop}' IS INCORRECT, TRY - 'NONE', 'FORCED', 'SETTLED'")
+        self.early_stop = early_stop
+
+        # Why the last search stopped, set by search_continues (None while it runs or if it wasn't stopped there)
+        self.stop_reason = None
+
+        # Counters and timers of the searches, possibly shared with other searches of the process
+        self.statistics = statistics if statistics is not None else SearchStatistics()
+
+    @property
+    def budget(self):
+        """
+        The maximum number of rollouts of a search, None for no limit
+
+        :return: the rollout budget
+        """
+
+        return self._budget
+
+    @budget.setter
+    def budget(self, budget):
+        """
+        Set the rollout budget of the next searches, a search without a budget needs a time limit to terminate
+
+        :param budget: the maximum number of rollouts to perform, None for no limit (only with a time limit)
+        """
+
+        if budget is None and self.time_limit is None:
+            raise ValueError("A SEARCH WITHOUT A TIME LIMIT NEEDS A SIMULATION BUDGET")
+        if budget is None and self.root_selection == "GUMBEL":
+            raise ValueError("GUMBEL ROOT SELECTION NEEDS A SIMULATION BUDGET")
+        self._budget = budget
+
+    def new_root(self, player):
+        """
+        Create a root node, meaning a root with no ancestors - the start of the tree.
+        For the array-backed tree, the nodes of the previous search are discarded
+
+        :param player: the player who is about make a move
+        :return: the root node
+        """
+
+        if self.array_tree:
+            self.tree.clear()
+            return self.tree.new_root(player)
+        return Node(0, player)
+
+    def advance_root(self, root, action):
+        """
+        Shift the root of the tree to the child of the played action, so its subtree is reused by the next search.
+        If the tree holds more nodes than allowed, the least visited subtrees are pruned,
+        then the child is detached from the rest of the tree, so the discarded nodes are freed
+
+        :param root: root node of the last search, None if there is no tree
+        :param action: the action played in the root state
+        :return: the new root node, None if the tree has no node for the action
+        """
+
+        if root is None:
+            return None
+        child = root.get_child(action)
+        if child is None:
+            return None
+
+        if self.max_nodes is not None:
+            self.prune_tree(child)
+
+        if self.array_tree:
+            return self.tree.compact(child.index)
+        child.detach()
+        return child
+
+    def prune_tree(self, root):
+        """
+        Keep at most max_nodes nodes in the tree, by expanding the nodes in the order of their visit counts
+        and pruning the ones whose children no longer fit, so the least visited subtrees are evicted.
+        All children of an expanded node are counted, as their statistics are allocated,
+        even if (for the trees made of nodes) their node objects have not been created yet
+
+        :param root: root node of the tree
+        """
+
+        if not root.expanded():
+            return
+
+        num_nodes = 1 + len(root.child_priors)
+        tie_breaker = count()
+        heap = []
+        for child in root.children.values():
+            heappush(heap, (-child.visit_count, next(tie_breaker), child))
+
+        while len(heap) > 0:
+            _, _, node = heappop(heap)
+            if not node.expanded():
+                continue
+
+            num_children = len(node.child_priors)
+            if num_nodes + num_children > self.max_nodes:
+                node.prune()
+                continue
+
+            num_nodes += num_children
+            for child in node.children.values():
+                heappush(heap, (-child.visit_count, next(tie_breaker), child))
 
-    
     def run(self, state, state_player, player, root=None):
         """
         Run the search algorithm, as long as the budget allows, from the provided state.
+        The time of the search, the size of the final tree and of the reused subtree are added to the statistics
+
+        :param state: the environment state from which the tree search should be run
+        :param state_player: the environment state from the player's perspective
+        :param player: the player who is about make a move
+        :param root: root node - the start of the tree
+        :return: the root node
+        """
+
+        reused_size = count_tree_nodes(root) if root is not None and root.expanded() else 0
+        simulations = self.statistics.simulations
+        with self.statistics.timer("search"):
+            root = self.search(state, state_player, player, root)
+
+        # The part of the budget left when the early stop ended the search (forced or settled choice),
+        # the searches stopped by the time control or by a proven root are not counted
+        saved_simulations = 0
+        if self.budget is not None and self.stop_reason == "DETERMINED":
+            saved_simulations = max(0, self.budget - (self.statistics.simulations - simulations))
+        self.statistics.record_search(count_tree_nodes(root), reused_size, saved_simulations)
+        return root
+
+    def search(self, state, state_player, player, root=None):
+        """
+        Run the simulations of one search from the provided state
 
         :param state: the environment state from which the tree search should be run
         :param state_player: the environment state from the player's perspective
@@ -48,89 +277,741 @@ class MonteCarloTreeSearch:
 
         # Initialize the budget tracking, determining the termination of the search
         num_rollouts = 0
-        start_time = time.time()
-        time_taken = 0
+        start_time = time.monotonic()
+        self.stop_reason = None
 
         # TODO explain-start-player
         start_player = player
 
-        if root is None or len(root.children) == 0:
+        # The position keys depend on the depth in the tree, so they are only valid for one search
+        self.transpositions = {}
+
+        if root is None or not root.expanded():
             # Create a root node, meaning a root with no ancestors - the start of the tree
-            root = Node(0, player)
-            action_probs, _ = self.model.predict(state_player)
+            root = self.new_root(player)
+            if self.in_opening_book(1):
+                root.hash_key = self.env.hash_state(state, player)
+            action_probs, _ = self.predict(state_player)
             action_probs = action_probs.numpy()[0]
-            valid_moves = self.env.find_moves(state, player, *self.env.find_positions(state))
+            with self.statistics.timer("move_generation"):
+                valid_moves = self.env.find_moves(state, player, *self.env.find_positions(state))
 
             # Create children of the root node
-            noised_action_probs = apply_dirichlet_noise(action_probs, self.alpha, self.epsilon, self.env.action_space)
-            action_probs = normalize_action(self.env.action_space, np.array(valid_moves), noised_action_probs)
-            root.expand(state, player, action_probs)
+            legal_mask = self.env.legal_moves_mask(valid_moves)
+            action_probs = normalize_action(legal_mask, self.add_noise(action_probs, legal_mask, at_root=True))
+            root.expand(state, player, action_probs, self.find_winning_action(state, player, action_probs))
+
+        elif self.noise == "ROOT" and self.root_selection == "PUCT":
+            # A reused root was expanded as an inner node without noise, so the noise is added to its children now
+            root.set_child_priors(apply_legal_dirichlet_noise(np.asarray(root.child_priors, dtype=np.float64),
+                                                              np.arange(len(root.child_priors)),
+                                                              self.alpha, self.epsilon, self.rng))
+
+        # The Gumbel root selection searches the root actions in phases, with single simulations
+        self.gumbel_action = None
+        if self.root_selection == "GUMBEL":
+            self.gumbel_action = self.sequential_halving(root, start_player, start_time)
+            return root
+
+        # Share the budget between the threads of the threaded batched evaluation
+        if self.num_threads > 1:
+            self.evaluate_in_threads(root, start_time)
+            return root
 
         # Run the loop until the number of rollouts has been reached
-        # or the allocated time has elapsed
-        # TODO check-time-tracking
-        while self.budget > num_rollouts and self.budget > time_taken:
-            node = root
-            search_path = [node]
-
-            # Select the node to simulate next, and the action needed to reach that node
-            while node.expanded():
-                action, node = node.select_child(self.env, len(search_path), start_player)
-                search_path.append(node)
-
-            # Get the state of the child node by making the action
-            parent = search_path[-2]
-            state = parent.state
-            next_state = self.env.make_move(state, action, node.player)
-            next_state_enemy = self.env.refactor_state(next_state, -node.player, len(search_path))
-
-            # Calculate the value of the child node state, and get the valid moves in that state
-            value, game_end, valid_moves = self.env.state_reward(next_state, node.player, len(search_path))
+        # or the time management stops the search
+        while self.search_continues(root, num_rollouts, start_time):
+            if self.batch_size > 1:
+                # Collect several leaves and evaluate them with one neural network call
+                batch_size = self.batch_size
+                if self.budget is not None:
+                    batch_size = min(batch_size, self.budget - num_rollouts)
+                num_rollouts += self.simulate_batch(root, start_player, batch_size)
+            else:
+                self.simulate(root, start_player)
+                num_rollouts += 1
+        return root
 
-            if not game_end:
-                # If the game hasn't ended then expand this node
+    def reseed(self, seed):
+        """
+        Restart the random generator of the search from a new seed
+
+        :param seed: seed of the random generator, None for a random seed
+        """
+
+        self.rng = np.random.default_rng(seed)
+
+    def sequential_halving(self, root, start_player, start_time):
+        """
+        Search the root with Gumbel top-k sampling and sequential halving (Gumbel MuZero).
+        The actions with the highest priors perturbed by Gumbel noise are sampled, then the budget is split
+        into phases, in each phase the remaining actions get the same number of simulations,
+        and the worse half of them (by the perturbed priors and the scaled values) is discarded.
+        Below the root the simulations select the children by the ucb score as usual
+
+        :param root: root node - the start of the tree
+        :param start_player: the player who started the search
+        :param start_time: time at which the search started
+        :return: the chosen action
+        """
+
+        actions = np.asarray(root.child_actions)
+        logits = np.log(np.maximum(np.asarray(root.child_priors, dtype=np.float64), np.finfo(np.float64).tiny))
+        gumbel = self.gumbel_scale * self.rng.gumbel(size=len(actions))
+
+        # A winning action found when the root was expanded is always chosen, as in the ucb selection
+        if root.winning_action is not None:
+            remaining = np.searchsorted(actions, [root.winning_action])
+        else:
+            remaining = np.argsort(-(gumbel + logits), kind="mergesort")[:self.gumbel_actions]
+        num_sampled = len(remaining)
+        num_phases = max(1, math.ceil(math.log2(num_sampled)))
+
+        num_rollouts = 0
+        for phase in range(num_phases):
+            # The budget left is split evenly between the remaining phases and actions
+            num_visits = max(1, (self.budget - num_rollouts) // ((num_phases - phase) * len(remaining)))
+            for index in remaining:
+                for _ in range(num_visits):
+                    if not self.search_continues(root, num_rollouts, start_time):
+                        break
+                    self.simulate(root, start_player, int(actions[index]))
+                    num_rollouts += 1
+
+            # Keep the better half of the actions
+            scores = gumbel[remaining] + logits[remaining] + self.scaled_values(root, remaining)
+            remaining = remaining[np.argsort(-scores, kind="mergesort")[:math.ceil(len(remaining) / 2)]]
+        return int(actions[remaining[0]])
+
+    def scaled_values(self, root, indexes):
+        """
+        Scale the values of the root children to be added to their perturbed priors in the sequential halving,
+        the scale grows with the visits, so the values become more decisive than the priors as the search goes on
+
+        :param root: root node - the start of the tree
+        :param indexes: indexes of the children in the children arrays of the root
+        :return: scaled values of the children, from the perspective of the player to move in the root
+        """
+
+        visit_counts = np.asarray(root.child_visit_counts)
+        value_sums = np.asarray(root.child_value_sums)
+        proven = np.asarray(root.child_proven)
+
+        # The values of the children are from the perspective of the player who made the move into them,
+        # i.e. the player to move in the root, they are mapped to the range 0-1
+        values = np.array([node_value(value_sums[i], visit_counts[i], proven[i]) for i in indexes])
+        values = (values + 1) / 2
+        return (self.gumbel_visit_constant + np.max(visit_counts)) * self.gumbel_value_scale * values
+
+    def select_action(self, root, temperature):
+        """
+        Select the action to play after a search, the action chosen by the sequential halving for the Gumbel
+        root selection (unless the result of the root is proven), otherwise based on the visit counts of the children
+
+        :param root: root node of the search
+        :param temperature: parameter to adjust the randomness of the action choice (see Node.select_action),
+                            the Gumbel choice is only used for deterministic action choices (0)
+        :return: the selected action
+        """
+
+        if self.gumbel_action is not None and temperature == 0 and root.proven == UNPROVEN:
+            return self.gumbel_action
+        return root.select_action(temperature, self.rng)
+
+    def search_continues(self, root, num_rollouts, start_time):
+        """
+        Decide whether another simulation should be run, checked between the simulations.
+        Without a time limit the search runs until the rollout budget is used up,
+        until the result of the root is proven (with the MCTS-solver),
+        or until the chosen action is determined (with the early stop).
+        With a time limit, the search of a forced move (single action) stops immediately,
+        after the soft deadline the search stops as soon as the most visited action is also the one with
+        the best value (the choice is settled), in complicated positions it runs until the hard deadline.
+        The reason of the stop is kept in stop_reason - "BUDGET", "PROVEN", "DETERMINED" (early stop),
+        "SINGLE_ACTION", "DEADLINE" or "SOFT_DEADLINE"
+
+        :param root: root node - the start of the tree
+        :param num_rollouts: number of simulations run so far
+        :param start_time: time at which the search started
+        :return: boolean whether the search should continue
+        """
+
+        if self.budget is not None and num_rollouts >= self.budget:
+            self.stop_reason = "BUDGET"
+        elif self.solver and root.proven != UNPROVEN:
+            self.stop_reason = "PROVEN"
+        elif self.early_stop != "NONE" and self.action_determined(root, num_rollouts):
+            self.stop_reason = "DETERMINED"
+        elif self.time_limit is None:
+            return True
+        elif len(root.child_priors) == 1:
+            self.stop_reason = "SINGLE_ACTION"
+        else:
+            time_taken = time.monotonic() - start_time
+            if time_taken >= self.time_limit:
+                self.stop_reason = "DEADLINE"
+            elif time_taken >= self.soft_time_fraction * self.time_limit and self.best_action_settled(root.children):
+                self.stop_reason = "SOFT_DEADLINE"
+            else:
+                return True
+        return False
+
+    def action_determined(self, root, num_rollouts):
+        """
+        Check if the action chosen after the search is already determined, so the rest of the budget can be saved.
+        A single legal action is determined after the first simulation (the visit counts have to define the choice),
+        with the "SETTLED" early stop, the most visited action is determined once no other action can overtake it
+        with the remaining simulations (the results proven later by the MCTS-solver are not foreseen)
+
+        :param root: root node - the start of the tree
+        :param num_rollouts: number of simulations run so far
+        :return: boolean whether the chosen action is determined
+        """
+
+        visit_counts = np.asarray(root.child_visit_counts)
+        if np.sum(visit_counts) == 0:
+            return False
+        if len(visit_counts) == 1:
+            return True
+
+        # The Gumbel root selection does not choose the action by the visit counts
+        if self.early_stop != "SETTLED" or self.budget is None or self.root_selection == "GUMBEL":
+            return False
+        return self.visit_choice_determined(visit_counts, self.budget - num_rollouts)
+
+    @staticmethod
+    def visit_choice_determined(visit_counts, remaining_rollouts):
+        """
+        Check if the most visited child stays the most visited one, even if all the remaining simulations
+        visit another child. The ties are broken in favour of the first child, like in the action selection
+
+        :param visit_counts: array with the visit counts of the root's children
+        :param remaining_rollouts: number of simulations left in the budget
+        :return: boolean whether the most visited child can't be overtaken
+        """
+
+        best_index = np.argmax(visit_counts)
+        reachable_counts = visit_counts + remaining_rollouts
+        overtaking = ((reachable_counts > visit_counts[best_index])
+                      | ((reachable_counts == visit_counts[best_index]) & (np.arange(len(visit_counts)) < best_index)))
+        overtaking[best_index] = False
+        return not np.any(overtaking)
+
+    @staticmethod
+    def best_action_settled(children):
+        """
+        Check if the most visited child also has the best value from the parent's perspective
+        (the highest value, as the values of the children are from the perspective of the player making the move),
+        at least two children have to be visited for the comparison to be meaningful
+
+        :param children: dictionary of action - child node pairs of the root
+        :return: boolean whether the choice of the action is settled
+        """
+
+        visited_children = [child for child in children.values() if child.visit_count > 0]
+        if len(visited_children) < 2:
+            return False
+        most_visited = max(visited_children, key=lambda child: child.visit_count)
+        best_valued = max(visited_children, key=lambda child: child.value())
+        return most_visited == best_valued or most_visited.value() == best_valued.value()
+
+    def select_leaf(self, root, start_player, root_action=None):
+        """
+        Descend the tree from the root, until a node which has not been expanded yet is reached,
+        or a node whose result is proven (with the MCTS-solver), as its subtree does not have to be searched
+
+        :param root: root node - the start of the tree
+        :param start_player: the player who started the search
+        :param root_action: action played from the root, None to select it by the ucb score
+        :return: list of nodes leading to the leaf, the action needed to reach the leaf
+        """
+
+        node = root
+        search_path = [node]
+        action = None
+
+        if root_action is not None:
+            action, node = root_action, root.get_child(root_action)
+            search_path.append(node)
+
+        # Select the node to simulate next, and the action needed to reach that node
+        while node.expanded() and node.proven == UNPROVEN:
+            action, node = node.select_child(self.env, len(search_path), start_player, self.c, self.widening)
+            search_path.append(node)
+        return search_path, action
 
+    def play_leaf(self, search_path, action):
+        """
+        Get the state of the leaf node by making the action in its parent's state,
+        and check if the game has ended in that state
+
+        :param search_path: list of nodes leading to the leaf
+        :param action: the action needed to reach the leaf
+        :return: state of the leaf, state of the leaf from the next player's perspective,
+                 value of the leaf state, boolean indicating game over, valid moves in the leaf state
+        """
+
+        state = search_path[-2].state
+        self.update_leaf_key(search_path, state, action)
+        return self.play_action(state, action, search_path[-1].player, len(search_path))
+
+    def in_opening_book(self, path_length):
+        """
+        Check if the node at the end of a search path is within the moves covered by the opening book
+
+        :param path_length: length of the search path leading to the node
+        :return: boolean whether the opening book can hold the node's position
+        """
+
+        return self.env.move_counter + path_length - 1 <= self.env.optimal_move_count
+
+    def update_leaf_key(self, search_path, state, action):
+        """
+        Set the Zobrist key of the leaf, by updating the key of its parent with the action, before it is made.
+        The keys are only used to look up the moves of the opening book, so only the positions within
+        the moves of the book get a key
+
+        :param search_path: list of nodes leading to the leaf
+        :param state: state of the parent of the leaf, before the action is made
+        :param action: the action needed to reach the leaf
+        """
+
+        if self.in_opening_book(len(search_path)):
+            search_path[-1].hash_key = self.env.update_hash(search_path[-2].hash_key, state, action,
+                                                            search_path[-1].player)
+
+    def play_action(self, state, action, player, path_length):
+        """
+        Make the action in the state of a node, and check if the game has ended in the resulting state.
+        The states of the nodes are unpacked into new arrays, so the move is made in place on the provided copy
+
+        :param state: copy of the state of the node, in which the action is made (modified in place)
+        :param action: the action to make
+        :param player: the player making the action
+        :param path_length: length of the search path leading to the resulting state
+        :return: the resulting state, the resulting state from the next player's perspective,
+                 value of the resulting state, boolean indicating game over, valid moves in the resulting state
+        """
+
+        # Get the state of the child node by making the action
+        with self.statistics.timer("make_move"):
+            self.env.make_move_in_place(state, action, player)
+        next_state = state
+        next_state_enemy = self.env.refactor_state(next_state, -player, path_length)
+
+        # Calculate the value of the child node state, and get the valid moves in that state
+        with self.statistics.timer("move_generation"):
+            value, game_end, valid_moves = self.env.state_reward(next_state, player, path_length)
+        return next_state, next_state_enemy, value, game_end, valid_moves
+
+    def expand_leaf(self, search_path, next_state, valid_moves, action_probs, network_value):
+        """
+        Expand the leaf node with the neural network prediction made for its state
+
+        :param search_path: list of nodes leading to the leaf
+        :param next_state: state of the leaf
+        :param valid_moves: valid moves in the leaf state
+        :param action_probs: action probabilities predicted by the neural network for the leaf state
+        :param network_value: value predicted by the neural network for the leaf state
+        :return: value of the leaf state
+        """
+
+        node = search_path[-1]
+        parent = search_path[-2]
+        value, action_probs, winning_action = self.evaluate_leaf(next_state, -parent.player, valid_moves,
+                                                                 action_probs, network_value)
+
+        # Expand this node, i.e. create child nodes
+        node.expand(next_state, -parent.player, action_probs, winning_action)
+
+        if self.transposition_table:
+            self.transpositions[self.transposition_key(search_path, next_state)] = (node, value)
+        return value
+
+    def evaluate_leaf(self, next_state, player, valid_moves, action_probs, network_value):
+        """
+        Turn the neural network prediction made for the leaf state into its value and the priors of its children
+
+        :param next_state: state of the leaf
+        :param player: the player who is about to make a move in the leaf state
+        :param valid_moves: valid moves in the leaf state
+        :param action_probs: action probabilities predicted by the neural network for the leaf state
+        :param network_value: value predicted by the neural network for the leaf state
+        :return: value of the leaf state, normalized action probabilities, action winning immediately (or None)
+        """
+
+        if self.heuristic_weight != 0:
+            # Add heuristics based on domain-specific knowledge
+            heuristics_value = self.env.add_heuristics(next_state, player, valid_moves)
+        else:
+            heuristics_value = 0
+        value = self.heuristic_weight * heuristics_value + (1 - self.heuristic_weight) * network_value
+
+        # Apply dirichlet noise and normalize action probabilities to range 0-1, with sum equal to 1
+        legal_mask = self.env.legal_moves_mask(valid_moves)
+        action_probs = normalize_action(legal_mask, self.add_noise(action_probs, legal_mask, at_root=False))
+        return value, action_probs, self.find_winning_action(next_state, player, action_probs)
+
+    def add_noise(self, action_probs, legal_mask, at_root):
+        """
+        Add dirichlet noise to the action probabilities of a node being expanded, according to the noise policy
+
+        :param action_probs: action probabilities predicted by the neural network
+        :param legal_mask: boolean array over the action space, True for the legal actions
+        :param at_root: boolean whether the expanded node is the root of the search
+        :return: the (possibly) noised action probabilities
+        """
+
+        # The Gumbel root selection samples the root actions with its own noise
+        if (self.noise == "NONE" or (self.noise == "ROOT" and not at_root)
+                or (at_root and self.root_selection == "GUMBEL")):
+            return action_probs
+        if self.sparse_noise:
+            return apply_legal_dirichlet_noise(np.asarray(action_probs, dtype=np.float64), np.flatnonzero(legal_mask),
+                                               self.alpha, self.epsilon, self.rng)
+        return apply_dirichlet_noise(action_probs, self.alpha, self.epsilon, self.env.action_space, self.rng)
+
+    def transposition_key(self, search_path, next_state):
+        """
+        Get the key of the leaf position in the transposition table
+
+        :param search_path: list of nodes leading to the leaf
+        :param next_state: state of the leaf
+        :return: the position key, None if the transposition table is not used
+        """
+
+        if not self.transposition_table:
+            return None
+        return self.env.position_key(next_state, -search_path[-2].player, len(search_path))
+
+    def expand_transposition(self, search_path, next_state):
+        """
+        If the position of the leaf has already been expanded during this search, by a different order of moves,
+        then share that node's children and neural network evaluation with the leaf, instead of evaluating it again
+
+        :param search_path: list of nodes leading to the leaf
+        :param next_state: state of the leaf
+        :return: value of the position, None if the position has not been expanded yet
+        """
+
+        if not self.transposition_table:
+            return None
+
+        transposition = self.transpositions.get(self.transposition_key(search_path, next_state))
+        if transposition is None:
+            return None
+
+        node, value = transposition
+        search_path[-1].share(node)
+        return value
+
+    def find_winning_action(self, state, player, action_probs):
+        """
+        Find an action winning immediately from the state of a node being expanded,
+        so the winning move check is done once per node instead of on every selection
+
+        :param state: state of the expanded node
+        :param player: the player who is about to make a move in the node
+        :param action_probs: probabilities of the actions arising in the node's state
+        :return: the first winning action, None if there is none
+        """
+
+        with self.statistics.timer("winning_moves"):
+            return Node.find_winning_action(self.env, state, player, np.flatnonzero(action_probs))
+
+    def predict(self, states):
+        """
+        Evaluate states with the neural network, counting the call and its time in the statistics
+
+        :param states: the states from the perspective of the players to move, stacked along the first axis
+        :return: action probabilities and values predicted by the neural network
+        """
+
+        with self.statistics.timer("predict"):
+            prediction = self.model.predict(states)
+        self.statistics.record_prediction(len(states))
+        return prediction
+
+    def simulate(self, root, start_player, root_action=None):
+        """
+        Run one simulation - select a leaf, evaluate it and backpropagate the result
+
+        :param root: root node - the start of the tree
+        :param start_player: the player who started the search
+        :param root_action: action played from the root, None to select it by the ucb score
+        """
+
+        search_path, action = self.select_leaf(root, start_player, root_action)
+        if search_path[-1].proven != UNPROVEN:
+            self.backup_proven(search_path)
+            return
+
+        next_state, next_state_enemy, value, game_end, valid_moves = self.play_leaf(search_path, action)
+
+        if not game_end:
+            # If the game hasn't ended then expand this node, reusing the evaluation of a transposition if possible
+            transposition_value = self.expand_transposition(search_path, next_state)
+            if transposition_value is not None:
+                value = transposition_value
+            else:
                 # Get the action probabilities in the node state, and the node state value
                 # from the neural network
-                action_probs, network_value = self.model.predict(next_state_enemy)
-                action_probs = action_probs.numpy()[0]
-                network_value = network_value.numpy()[0][0]
+                action_probs, network_value = self.predict(next_state_enemy)
+                value = self.expand_leaf(search_path, next_state, valid_moves,
+                                         action_probs.numpy()[0], network_value.numpy()[0][0])
+
+        # Backpropagate the search result to parent nodes
+        self.backup(search_path, value, terminal=game_end)
+
+    def simulate_batch(self, root, start_player, batch_size):
+        """
+        Run up to batch_size simulations, with their leaves evaluated in a single neural network call.
+        Virtual loss is added to the path of every collected leaf, so the following descents
+        are steered to different leaves. Terminal leaves and known transpositions are backpropagated immediately.
+        The collection stops early, when an already collected leaf is selected again.
+
+        :param root: root node - the start of the tree
+        :param start_player: the player who started the search
+        :param batch_size: maximum number of simulations to run
+        :return: the number of simulations run
+        """
+
+        num_simulations = 0
+        leaves = []
+        pending_leaves = set()
+
+        for _ in range(batch_size):
+            search_path, action = self.select_leaf(root, start_player)
+            if search_path[-1] in pending_leaves:
+                break
+            if search_path[-1].proven != UNPROVEN:
+                # The root may be proven by a leaf of this batch, then the search is over
+                if len(search_path) == 1:
+                    break
+                self.backup_proven(search_path)
+                num_simulations += 1
+                continue
+
+            next_state, next_state_enemy, value, game_end, valid_moves = self.play_leaf(search_path, action)
+            num_simulations += 1
+
+            if game_end:
+                self.backup(search_path, value, terminal=True)
+                continue
+
+            transposition_value = self.expand_transposition(search_path, next_state)
+            if transposition_value is not None:
+                self.backup(search_path, transposition_value)
+            else:
+                self.apply_virtual_loss(search_path, self.virtual_loss)
+                leaves.append((search_path, next_state, next_state_enemy, valid_moves))
+                pending_leaves.add(search_path[-1])
+
+        if len(leaves) > 0:
+            # Pad the batch to a constant size, so the traced prediction function is not rebuilt for every size
+            states = [leaf[2] for leaf in leaves]
+            states += [states[-1]] * (self.batch_size - len(states))
+            action_probs, network_values = self.predict(np.concatenate(states))
+            action_probs = action_probs.numpy()
+            network_values = network_values.numpy()
+
+            for i, (search_path, next_state, _, valid_moves) in enumerate(leaves):
+                self.apply_virtual_loss(search_path, -self.virtual_loss)
+
+                # A leaf collected earlier in the batch may have been a transposition of this one
+                value = self.expand_transposition(search_path, next_state)
+                if value is None:
+                    value = self.expand_leaf(search_path, next_state, valid_moves,
+                                             action_probs[i], network_values[i][0])
+                self.backup(search_path, value)
+        return num_simulations
+
+    def evaluate_in_threads(self, root, start_time):
+        """
+        Run the simulations in several threads sharing the array-backed tree, until the budget is used up.
+        This is a threaded batched evaluator, not a tree-parallel search: every access to the tree
+        (selection, expansion, backpropagation) holds one lock, as the arrays of the tree are reallocated
+        when it grows, so the selection and backup kernels never run at the same time. Virtual loss spreads
+        the threads over different leaves, whose neural network predictions (which release the GIL) overlap,
+        so the search only gets faster when the predictions dominate the time of a simulation
+
+        :param root: root node - the start of the tree
+        :param start_time: time at which the search started
+        :return: the number of simulations run
+        """
+
+        lock = Lock()
+        progress = {"rollouts": 0}
+        threads = [Thread(target=self.evaluation_thread, args=(root, lock, progress, start_time))
+                   for _ in range(self.num_threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return progress["rollouts"]
+
+    def evaluation_thread(self, root, lock, progress, start_time):
+        """
+        Simulation loop of one thread of the threaded batched evaluation
+
+        :param root: root node - the start of the tree
+        :param lock: lock guarding the tree
+        :param progress: dictionary with the number of simulations started by all threads
+        :param start_time: time at which the search started
+        """
+
+        tree = self.tree
+        path = np.zeros(self.env.max_moves + 1, dtype=np.int32)
+        while True:
+            # Select a leaf and add virtual loss to its path
+            with lock:
+                if not self.search_continues(root, progress["rollouts"], start_time):
+                    return
+                progress["rollouts"] += 1
+
+                # The kernel doesn't know the opening book, so its moves are followed first, like in select_child
+                node, book_length = root, 0
+                while node.expanded() and node.proven == UNPROVEN:
+                    dict_action = node.select_dict_action(self.env, book_length + 1, root.player)
+                    child = None if dict_action is None else node.get_child(dict_action)
+                    if child is None:
+                        break
+                    path[book_length] = node.index
+                    book_length += 1
+                    node = child
+                tree.visit_counts[path[:book_length]] += self.virtual_loss
+                tree.value_sums[path[:book_length]] -= self.virtual_loss
 
-                if self.heuristic_weight != 0:
-                    # Add heuristics based on domain-specific knowledge
-                    heuristics_value = self.env.add_heuristics(next_state, -node.player, valid_moves)
+                length = book_length + select_path(tree.visit_counts, tree.value_sums, tree.priors, tree.first_child,
+                                                   tree.num_children, tree.winning_children, tree.proven, node.index,
+                                                   self.c, self.virtual_loss, path[book_length:],
+                                                   *(self.widening or (0.0, 0.0)))
+                indexes = path[:length].copy()
+                search_path = [ArrayNode(tree, int(index)) for index in indexes]
+
+                if search_path[-1].proven != UNPROVEN:
+                    revert_virtual_loss(tree.visit_counts, tree.value_sums, indexes, self.virtual_loss)
+                    self.backup_proven(search_path)
+                    continue
+
+                # The arrays of the tree are reallocated when it grows, so the leaf is read while holding the lock
+                state = search_path[-2].state
+                action = int(tree.actions[indexes[-1]])
+                player = search_path[-1].player
+                self.update_leaf_key(search_path, state, action)
+
+            next_state, next_state_enemy, value, game_end, valid_moves = self.play_action(state, action, player,
+                                                                                          length)
+
+            if not game_end:
+                with lock:
+                    transposition_value = None
+                    if not search_path[-1].expanded():
+                        transposition_value = self.expand_transposition(search_path, next_state)
+
+                if transposition_value is not None:
+                    value = transposition_value
                 else:
-                    heuristics_value = 0
-                value = self.heuristic_weight * heuristics_value + (1 - self.heuristic_weight) * network_value
+                    # Evaluate the leaf outside the lock, so the threads run their predictions concurrently
+                    action_probs, network_value = self.predict(next_state_enemy)
+                    value, action_probs, winning_action = self.evaluate_leaf(
+                        next_state, -player, valid_moves, action_probs.numpy()[0], network_value.numpy()[0][0])
+
+                    # Another thread may have expanded the same leaf in the meantime
+                    with lock:
+                        node = search_path[-1]
+                        if not node.expanded():
+                            node.expand(next_state, -player, action_probs, winning_action)
+                            if self.transposition_table:
+                                self.transpositions[self.transposition_key(search_path, next_state)] = (node, value)
+
+            with lock:
+                revert_virtual_loss(tree.visit_counts, tree.value_sums, indexes, self.virtual_loss)
+                self.backup(search_path, value, terminal=game_end)
 
-                # Apply dirichlet noise and normalize action probabilities to range 0-1, with sum equal to 1
-                noised_action_probs = apply_dirichlet_noise(action_probs, self.alpha, self.epsilon,
-                                                            self.env.action_space)
-                action_probs = normalize_action(self.env.action_space, np.array(valid_moves), noised_action_probs)
+    @staticmethod
+    def apply_virtual_loss(search_path, virtual_loss):
+        """
+        Make the nodes on the path look worse to their parents (or revert it, with a negative virtual loss),
+        by adding visits with a value which lowers their ucb score
 
-                # Expand this node, i.e. create child nodes
-                node.expand(next_state, -parent.player, action_probs)
+        :param search_path: list of nodes leading to the leaf
+        :param virtual_loss: number of lost visits to add
+        """
 
-            # Backpropagate the search result to parent nodes
-            self.backpropagate(search_path, value, parent.player * -1)
+        for node in search_path:
+            node.visit_count += virtual_loss
+            node.value_sum -= virtual_loss
 
-            time_taken = time.time() - start_time
-            num_rollouts += 1
-        return root
+    def backup(self, search_path, value, terminal=False):
+        """
+        Backpropagate the search result to parent nodes, for either of the tree representations,
+        this ends a simulation, so it is also counted in the statistics
+
+        :param search_path: list of nodes leading to the termination
+        :param value: value of the leaf from the perspective of the player to move in it (as predicted by the network),
+                      for a terminal leaf the reward of the player who made the last move
+        :param terminal: boolean whether the leaf is a terminal state of the game
+        """
+
+        self.statistics.record_simulation(len(search_path) - 1)
+
+        # The nodes keep their values from the perspective of the player who made the move into them
+        leaf_value = value if terminal else -value
+        if self.array_tree:
+            self.tree.backpropagate([node.index for node in search_path], leaf_value)
+        else:
+            self.backpropagate(search_path, leaf_value)
+
+        if self.solver:
+            self.prove(search_path, value if terminal else None)
+
+    def backup_proven(self, search_path):
+        """
+        Backpropagate the result of a proven leaf (MCTS-solver), which is known without playing out the leaf
+
+        :param search_path: list of nodes leading to the proven leaf
+        """
+
+        # The result is from the perspective of the player who made the move into the leaf,
+        # the backpropagated value from the perspective of the player to move in it
+        self.backup(search_path, -search_path[-1].proven)
 
     @staticmethod
-    def backpropagate(search_path, value, player):
+    def prove(search_path, terminal_value):
+        """
+        Mark the nodes on the path with a proven result (MCTS-solver). A terminal leaf is proven by its value,
+        then the ancestors are proven from the results of their children, going up the path
+        only as long as the nodes are newly proven
+
+        :param search_path: list of nodes leading to the leaf
+        :param terminal_value: value of the terminal leaf, None if the leaf is not terminal
+        """
+
+        if terminal_value is not None:
+            # The value and the result are both from the perspective of the player who made the last move
+            search_path[-1].proven = int(terminal_value)
+
+        for node in reversed(search_path[:-1]):
+            if node.proven != UNPROVEN or not node.expanded():
+                return
+            result = proven_result(node.child_proven)
+            if result == UNPROVEN:
+                return
+            node.proven = result
+
+    @staticmethod
+    def backpropagate(search_path, value):
         """
         Backpropagate the value from the environment termination to all its ancestors.
+        Every node keeps its value from the perspective of the player who made the move into it,
+        so the sign of the value alternates going up the path
 
         :param search_path: list of nodes leading to the termination
-        :param value: value at the termination
-        :param player: player who was to make the move at the end (i.e. the one who lost)
+        :param value: value at the termination, from the perspective of the player who made the last move
         """
 
         for node in reversed(search_path):
-            if node.player == player:
-                node.value_sum += -value
-            else:
-                node.value_sum += value
+            node.value_sum += value
             node.visit_count += 1
+            value = -value
@@ -1,6 +1,7 @@
 import numpy as np
 
-from trainer.monte_carlo_tree_search.score.score import ucb_score
+from trainer.monte_carlo_tree_search.score.score import select_ucb, select_ucb_widened, UNPROVEN
+from trainer.monte_carlo_tree_search.utils.utils import sample_action, pack_state, unpack_state
 
 
 class Node:
@@ -8,20 +9,89 @@ class Node:
 
     """
 
-    def __init__(self, player, prior):
+    # Nodes are created in large numbers, so their attributes are fixed to avoid a dictionary per node
+    __slots__ = ("player", "prior", "children", "packed_state", "winning_action", "hash_key", "parent_visit_counts",
+                 "parent_value_sums", "parent_proven", "index", "child_actions", "child_priors", "child_visit_counts",
+                 "child_value_sums", "child_proven")
+
+    def __init__(self, player, prior, parent_visit_counts=None, parent_value_sums=None, index=0, parent_proven=None):
         """
-        Initializes the node TODO explain-constructor
+        Initializes the node TODO explain-constructor.
+        The visit count and value sum of a node are kept in the children arrays of its parent,
+        so the parent can score all of its children at once
 
         :param player: the player making the move
         :param prior:
+        :param parent_visit_counts: array of the parent with its children visit counts, None for the root
+        :param parent_value_sums: array of the parent with its children value sums, None for the root
+        :param index: position of this node in the parent's arrays
+        :param parent_proven: array of the parent with its children proven results, None for the root
         """
 
-        self.visit_count = 0
         self.player = player
         self.prior = prior
-        self.value_sum = 0
+
+        # Children are created lazily, when they are selected for the first time,
+        # until then they only exist as entries of the children arrays
         self.children = {}
-        self.state = None
+
+        # State of the node, only kept for the expanded nodes, stored compactly (see the state property)
+        self.packed_state = None
+
+        # Winning action found once, when the node is expanded, None if there is no immediate win
+        self.winning_action = None
+
+        # Zobrist key of the position, kept only for the positions in the moves of the opening book
+        self.hash_key = None
+
+        # The root has no parent, so it keeps its statistics in its own arrays
+        if parent_visit_counts is None:
+            parent_visit_counts = np.zeros(1, dtype=np.int64)
+            parent_value_sums = np.zeros(1, dtype=np.float64)
+            parent_proven = np.full(1, UNPROVEN, dtype=np.int8)
+        self.parent_visit_counts = parent_visit_counts
+        self.parent_value_sums = parent_value_sums
+        self.parent_proven = parent_proven
+        self.index = index
+
+        # Statistics of the children, stored as contiguous arrays in the order of the children dictionary
+        self.child_actions = None
+        self.child_priors = None
+        self.child_visit_counts = None
+        self.child_value_sums = None
+        self.child_proven = None
+
+    @property
+    def state(self):
+        return None if self.packed_state is None else unpack_state(self.packed_state)
+
+    @state.setter
+    def state(self, state):
+        self.packed_state = None if state is None else pack_state(state)
+
+    @property
+    def visit_count(self):
+        return int(self.parent_visit_counts[self.index])
+
+    @visit_count.setter
+    def visit_count(self, visit_count):
+        self.parent_visit_counts[self.index] = visit_count
+
+    @property
+    def value_sum(self):
+        return float(self.parent_value_sums[self.index])
+
+    @value_sum.setter
+    def value_sum(self, value_sum):
+        self.parent_value_sums[self.index] = value_sum
+
+    @property
+    def proven(self):
+        return int(self.parent_proven[self.index])
+
+    @proven.setter
+    def proven(self, proven):
+        self.parent_proven[self.index] = proven
 
     def expanded(self):
         """
@@ -31,7 +101,39 @@ class Node:
         :return: boolean whether the node is expanded
         """
 
-        return len(self.children) > 0
+        return self.child_actions is not None and len(self.child_actions) > 0
+
+    def get_child(self, action):
+        """
+        Get the child reached by the action, creating its node if it does not exist yet.
+        The actions of the children are sorted, so the child is found by bisection
+
+        :param action: the action leading to the child
+        :return: the child node, None if the node has no child for this action
+        """
+
+        if self.child_actions is None:
+            return None
+        index = np.searchsorted(self.child_actions, action)
+        if index == len(self.child_actions) or self.child_actions[index] != action:
+            return None
+        return self.materialize_child(index)
+
+    def materialize_child(self, index):
+        """
+        Get the child at the index of the children arrays, creating its node when it is needed for the first time
+
+        :param index: position of the child in the children arrays
+        :return: the child node
+        """
+
+        action = int(self.child_actions[index])
+        child = self.children.get(action)
+        if child is None:
+            child = Node(self.player, self.child_priors[index], self.child_visit_counts,
+                         self.child_value_sums, int(index), self.child_proven)
+            self.children[action] = child
+        return child
 
     def value(self):
         """
@@ -44,7 +146,7 @@ class Node:
             return 0
         return self.value_sum / self.visit_count
 
-    def select_action(self, temperature):
+    def select_action(self, temperature, rng=None):
         """
         Select an action from the tree rollout (TODO check) TODO explain-action
 
@@ -52,107 +154,191 @@ class Node:
                             0 - deterministic action based on the visit counts,
                            infinity - action choice with uniform probabilities,
                            in-between - probabilities dependent on the visit count
+        :param rng: NumPy random generator used for the random choices, None for the global NumPy generator
         :return: the selected action of the tree
         """
 
-        # Get the visit counts of all children and the respective actions that lead to them
-        visit_counts = np.array([child.visit_count for child in self.children.values()])
-        actions = [action for action in self.children.keys()]
-
-        # Select an action based on the temperature and node visit counts
-        if temperature == 0:
-            action = actions[np.argmax(visit_counts)]
-        elif temperature == float("inf"):
-            action = np.random.choice(actions)
-        else:
-            visit_count_distribution = visit_counts ** (1 / temperature)
-            visit_count_distribution = visit_count_distribution / sum(visit_count_distribution)
-            action = np.random.choice(actions, p=visit_count_distribution)
-        return action
+        # Select an action based on the temperature and the visit counts of the children
+        return sample_action(self.child_actions, self.child_visit_counts, temperature, self.child_proven, rng)
 
     @staticmethod
-    def check_winning_moves(env, action, state, player):
+    def check_winning_moves(env, action, board, player):
         """
         Check if the action is winning by playing it out in the environment.
+        The move is made in place and taken back afterwards, so the board is unchanged when this returns.
 
         :param env: the environment, where the action is played out
         :param action: the action to test
-        :param state: the state of the environment in which the action should be played
+        :param board: the state of the environment in which the action should be played, modified during the check
         :param player: the player whose turn it is
         :return: the action if it is winning, None otherwise
         """
 
-        next_state = env.make_move(state, action, player)
-        value, game_end, valid_moves = env.state_reward(next_state, player, move_counter=0)
+        undo = env.make_move_in_place(board, action, player)
+        value, game_end, valid_moves = env.state_reward(board, player, move_counter=0)
+        env.unmake_move(board, undo)
         if value == 1:
             return action
         return None
 
     @staticmethod
-    def select_dict_action(env, state, path_length, start_player, current_player):
+    def find_winning_action(env, state, player, actions):
         """
-        TODO explain-dict-action
+        Play out the provided actions, to find an action winning immediately.
+        This is done only once per node, when it is expanded, and the result is reused by all later selections.
+        All actions are played on one copy of the state, instead of a new state for every action.
 
-        :param env:
-        :param state:
-        :param path_length:
-        :param start_player:
-        :param current_player:
-        :return:
+        :param env: the environment, where the actions are played out
+        :param state: the state of the environment in which the actions should be played
+        :param player: the player whose turn it is
+        :param actions: the actions to test
+        :return: the first winning action, None if there is none
         """
 
-        move_count = env.move_counter + path_length - 1
-        if move_count <= env.optimal_move_count and start_player == current_player:
-            hashed_state = env.hash_state(state)
-            if hashed_state in env.optimal_start_moves:
-                return env.optimal_start_moves[hashed_state]
+        board = np.copy(state)
+        for action in actions:
+            winning_action = Node.check_winning_moves(env, int(action), board, player)
+            if winning_action is not None:
+                return winning_action
         return None
 
-    def select_child(self, env, path_length, start_player):
+    def select_dict_action(self, env, path_length, start_player):
+        """
+        Look up the move of the opening book of the environment, for the positions in the first moves of the game,
+        in which the player who started the search is about to play. The book is keyed by the Zobrist keys
+        of the positions, so different positions don't share a move, the key of the node is updated move by move
+        from the key of the root (see MonteCarloTreeSearch.update_leaf_key)
+
+        :param env: the environment, with the opening book
+        :param path_length: length of the search path leading to this node
+        :param start_player: the player who started the search
+        :return: the move of the opening book, None if the position is not in the book
+        """
+
+        # The book is only used in the first moves, the expanded node's player is the player about to play in it
+        move_count = env.move_counter + path_length - 1
+        if move_count > env.optimal_move_count or start_player != self.player:
+            return None
+        return env.optimal_start_moves.get(self.hash_key)
+
+    def select_child(self, env, path_length, start_player, c=4, widening=None):
         """
+        Select the child to simulate next, the move of the opening book or a winning action
+        (found when the node was expanded) is always picked, otherwise the child with the highest ucb score,
+        computed for all children in one call
 
         :param env:
         :param path_length:
         :param start_player:
+        :param c: exploration constant of the ucb score
+        :param widening: (constant, exponent) of progressive widening, None to consider all children
         :return:
         """
 
-        c = 4
-        best_score = -np.inf
         best_action = -1
         best_child = None
 
-        # dict_action = self.select_dict_action(env, self.state, path_length, start_player, -self.player)
-        dict_action = False  # CHANGE DUE TO HASH COLLISIONS
-        if dict_action:
+        # The move of the opening book is only followed, if it is one of the children
+        dict_action = self.select_dict_action(env, path_length, start_player)
+        dict_child = None if dict_action is None else self.get_child(dict_action)
+        if dict_child is not None:
             best_action = dict_action
-            best_child = self.children[dict_action]
+            best_child = dict_child
+
+        elif self.winning_action is not None:
+            best_action = self.winning_action
+            best_child = self.get_child(self.winning_action)
 
         else:
-            for action, child in self.children.items():
-                winning_action = self.check_winning_moves(env, action, self.state, child.player)
-                if winning_action is not None:
-                    return winning_action, child
-                score = ucb_score(c, self.visit_count, child.prior, child.value(), child.visit_count)
-                if score > best_score:
-                    best_score = score
-                    best_action = action
-                    best_child = child
+            if widening is None:
+                best_index = select_ucb(c, self.visit_count, self.child_priors,
+                                        self.child_value_sums, self.child_visit_counts, self.child_proven)
+            else:
+                best_index = select_ucb_widened(c, self.visit_count, self.child_priors, self.child_value_sums,
+                                                self.child_visit_counts, self.child_proven, *widening)
+            best_action = int(self.child_actions[best_index])
+            best_child = self.materialize_child(best_index)
         return best_action, best_child
 
-    def expand(self, state, player, action_probs):
+    def expand(self, state, player, action_probs, winning_action=None):
         """
-        Expand this node by creating children nodes
+        Expand this node by creating the children arrays
         with all the possible actions arising from this node,
         i.e. all actions with non-zero probability.
+        The children nodes themselves are created when they are first selected.
 
         :param state: TODO what-state-doesnt-seem-useful
         :param player: TODO seems-weird
         :param action_probs: probabilities of the actions arising in the parent node's state
+        :param winning_action: action winning immediately from this node, None if there is none
         """
 
         self.player = player
-        self.state = np.copy(state)
-        for a, prob in enumerate(action_probs):
-            if prob != 0:
-                self.children[a] = Node(prior=prob, player=self.player)
+        self.state = state
+        self.winning_action = winning_action
+
+        self.child_actions = np.flatnonzero(action_probs)
+        self.child_priors = action_probs[self.child_actions]
+        self.child_visit_counts = np.zeros(len(self.child_actions), dtype=np.int64)
+        self.child_value_sums = np.zeros(len(self.child_actions), dtype=np.float64)
+        self.child_proven = np.full(len(self.child_actions), UNPROVEN, dtype=np.int8)
+        self.children = {}
+
+    def share(self, node):
+        """
+        Turn this node into a transposition of an already expanded node, which reached the same position
+        by a different order of moves. The children and their statistics are shared, not copied,
+        so the visits made through either of the nodes are seen by both.
+
+        :param node: the expanded node with the same position
+        """
+
+        self.player = node.player
+        self.packed_state = node.packed_state
+        self.winning_action = node.winning_action
+        self.children = node.children
+        self.child_actions = node.child_actions
+        self.child_priors = node.child_priors
+        self.child_visit_counts = node.child_visit_counts
+        self.child_value_sums = node.child_value_sums
+        self.child_proven = node.child_proven
+
+    def set_child_priors(self, child_priors):
+        """
+        Replace the priors of the children, e.g. when noise is added to the priors of a reused root
+
+        :param child_priors: new priors, in the order of the children arrays
+        """
+
+        self.child_priors[:] = child_priors
+        for child in self.children.values():
+            child.prior = self.child_priors[child.index]
+
+    def prune(self):
+        """
+        Remove the children of this node, turning it back into a leaf.
+        The statistics of the node itself are kept, it is expanded again when it is selected.
+        The expansion set the player to the one about to move in the node, the leaf keeps the player making the move
+        """
+
+        if self.expanded():
+            self.player = -self.player
+        self.children = {}
+        self.packed_state = None
+        self.winning_action = None
+        self.child_actions = None
+        self.child_priors = None
+        self.child_visit_counts = None
+        self.child_value_sums = None
+        self.child_proven = None
+
+    def detach(self):
+        """
+        Make this node the root of its own tree, by moving its statistics out of the parent's arrays,
+        so the parent and the siblings of this node are no longer referenced and can be freed
+        """
+
+        self.parent_visit_counts = np.array([self.visit_count], dtype=np.int64)
+        self.parent_value_sums = np.array([self.value_sum], dtype=np.float64)
+        self.parent_proven = np.array([self.proven], dtype=np.int8)
+        self.index = 0
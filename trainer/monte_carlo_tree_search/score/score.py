@@ -1,6 +1,10 @@
 import numpy as np
 from numba import jit
 
+# Proven result of a node which has not been solved (MCTS-solver), the proven results are 1 (win), 0 (draw)
+# and -1 (loss), like the values of the node from the perspective of the player who made the move into the node
+UNPROVEN = 2
+
 
 @jit(nopython=True)
 def ucb_score(c, parent_visit_count, child_prior, child_value, child_visit_count):
@@ -10,14 +14,122 @@ def ucb_score(c, parent_visit_count, child_prior, child_value, child_visit_count
     :param c: bias parameter
     :param parent_visit_count: the number of times the parent node has been visited
     :param child_prior:
-    :param child_value: the value of the child node
+    :param child_value: the value of the child node, from the perspective of the player to move in the parent
     :param child_visit_count: the number of times the child node has been visited
     :return: the ucb score of the node
     """
 
     prior_score = c * child_prior * np.sqrt(parent_visit_count) / (child_visit_count + 1)
     if child_visit_count > 0:
-        value_score = -child_value
+        value_score = child_value
     else:
         value_score = 0
     return value_score + prior_score
+
+
+@jit(nopython=True)
+def node_value(value_sum, visit_count, proven):
+    """
+    Get the value of a node used in its ucb score, the exact result if the node is proven (MCTS-solver),
+    otherwise the average of its values
+
+    :param value_sum: the summed values of the node
+    :param visit_count: the number of times the node has been visited
+    :param proven: the proven result of the node, UNPROVEN if it is not solved
+    :return: value of the node
+    """
+
+    if proven != UNPROVEN:
+        return proven
+    if visit_count > 0:
+        return value_sum / visit_count
+    return 0
+
+
+@jit(nopython=True)
+def select_ucb(c, parent_visit_count, child_priors, child_value_sums, child_visit_counts, child_proven):
+    """
+    Calculate the Upper Confidence Bound (UCB) for all children of a node at once
+    and select the child with the highest score.
+    The children statistics are provided as contiguous arrays, ties are broken in favour of the first child.
+    The children with a proven result are scored with their exact value instead of their average value
+
+    :param c: bias parameter
+    :param parent_visit_count: the number of times the parent node has been visited
+    :param child_priors: array with the prior probabilities of the children
+    :param child_value_sums: array with the summed values of the children
+    :param child_visit_counts: array with the number of times each child has been visited
+    :param child_proven: array with the proven results of the children, UNPROVEN for the unsolved ones
+    :return: index of the child with the highest ucb score
+    """
+
+    best_score = -np.inf
+    best_index = -1
+    for i in range(len(child_priors)):
+        child_value = node_value(child_value_sums[i], child_visit_counts[i], child_proven[i])
+        score = ucb_score(c, parent_visit_count, child_priors[i], child_value, child_visit_counts[i])
+        if score > best_score:
+            best_score = score
+            best_index = i
+    return best_index
+
+
+@jit(nopython=True)
+def select_ucb_widened(c, parent_visit_count, child_priors, child_value_sums, child_visit_counts, child_proven,
+                       widening_constant, widening_exponent):
+    """
+    Select the child with the highest Upper Confidence Bound (UCB) with progressive widening.
+    Only the children with the highest priors are considered, their number grows with the parent's visit count
+    as widening_constant * parent_visit_count ** widening_exponent, ties are broken in favour of the first child.
+
+    :param c: bias parameter
+    :param parent_visit_count: the number of times the parent node has been visited
+    :param child_priors: array with the prior probabilities of the children
+    :param child_value_sums: array with the summed values of the children
+    :param child_visit_counts: array with the number of times each child has been visited
+    :param child_proven: array with the proven results of the children, UNPROVEN for the unsolved ones
+    :param widening_constant: number of children considered after the first visit
+    :param widening_exponent: rate at which the number of considered children grows with the visits
+    :return: index of the child with the highest ucb score
+    """
+
+    num_considered = max(1, int(np.ceil(widening_constant * parent_visit_count ** widening_exponent)))
+    if num_considered >= len(child_priors):
+        return select_ucb(c, parent_visit_count, child_priors, child_value_sums, child_visit_counts, child_proven)
+
+    considered = np.sort(np.argsort(-child_priors, kind="mergesort")[:num_considered])
+    best_score = -np.inf
+    best_index = -1
+    for i in considered:
+        child_value = node_value(child_value_sums[i], child_visit_counts[i], child_proven[i])
+        score = ucb_score(c, parent_visit_count, child_priors[i], child_value, child_visit_counts[i])
+        if score > best_score:
+            best_score = score
+            best_index = i
+    return best_index
+
+
+@jit(nopython=True)
+def proven_result(child_proven):
+    """
+    Derive the result of a node from the proven results of its children (MCTS-solver).
+    The player to move in the node wins if any child is won for it, loses if all children are lost for it,
+    and draws if all children are proven and the best of them is a draw.
+    The result of the node is from the perspective of the player who made the move into the node (the opponent)
+
+    :param child_proven: array with the proven results of the children,
+                         from the perspective of the player to move in the node
+    :return: the proven result of the node, UNPROVEN if it can't be proven yet
+    """
+
+    best_result = -1
+    for result in child_proven:
+        if result == 1:
+            return -1
+        if result == UNPROVEN:
+            best_result = UNPROVEN
+        elif best_result != UNPROVEN:
+            best_result = max(best_result, result)
+    if best_result == UNPROVEN:
+        return UNPROVEN
+    return -best_result
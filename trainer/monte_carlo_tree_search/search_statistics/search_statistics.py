@@ -0,0 +1,199 @@
+import time
+from contextlib import contextmanager
+from threading import Lock
+
+
+class SearchStatistics:
+    """
+    Class collecting counters and timers of the Monte-Carlo-Tree Searches, showing where the time of a search goes
+    (neural network predictions, move generation, making moves, checking winning moves) and how large the trees grow.
+    One object can be shared by all searches of a process, and the objects of several processes merged together.
+    """
+
+    # Names of the timed parts of the search
+    TIMERS = ("search", "predict", "move_generation", "make_move", "winning_moves")
+
+    def __init__(self):
+        """
+        Initialize all counters and timers to 0
+        """
+
+        self.searches = 0
+        self.simulations = 0
+        self.predict_calls = 0
+        self.predicted_states = 0
+
+        # Depth of the leaves reached by the simulations
+        self.depth_sum = 0
+        self.max_depth = 0
+
+        # Number of nodes in the tree at the end of a search, and in the subtree reused from the previous search
+        self.tree_size_sum = 0
+        self.max_tree_size = 0
+        self.reused_size_sum = 0
+
+        # Simulations of the budget left unused by the searches stopped early, and the number of such searches
+        self.saved_simulations = 0
+        self.early_stops = 0
+
+        # Lookups of the model evaluation caches of the processes, served from the cache (hits) or by the model
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+        # Time spent in the timed parts of the search, in seconds
+        self.times = dict.fromkeys(self.TIMERS, 0.0)
+
+        # The threads of a threaded search update the statistics concurrently
+        self.lock = Lock()
+
+    def __getstate__(self):
+        # The lock can't be pickled, the statistics are sent from the worker processes without it
+        state = self.__dict__.copy()
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = Lock()
+
+    @contextmanager
+    def timer(self, name):
+        """
+        Measure the time spent in a block of code and add it to the timer of the given name
+
+        :param name: name of the timer, one of TIMERS
+        """
+
+        start = time.perf_counter()
+        yield
+        duration = time.perf_counter() - start
+        with self.lock:
+            self.times[name] += duration
+
+    def record_prediction(self, num_states):
+        """
+        Count a neural network call
+
+        :param num_states: number of states evaluated in the call
+        """
+
+        with self.lock:
+            self.predict_calls += 1
+            self.predicted_states += num_states
+
+    def record_simulation(self, depth):
+        """
+        Count a finished simulation
+
+        :param depth: depth of the leaf reached by the simulation
+        """
+
+        with self.lock:
+            self.simulations += 1
+            self.depth_sum += depth
+            self.max_depth = max(self.max_depth, depth)
+
+    def record_search(self, tree_size, reused_size, saved_simulations=0):
+        """
+        Count a finished search
+
+        :param tree_size: number of nodes in the tree at the end of the search
+        :param reused_size: number of nodes in the subtree reused from the previous search
+        :param saved_simulations: number of simulations of the budget left unused, as the early stop ended the search
+        """
+
+        with self.lock:
+            self.searches += 1
+            self.tree_size_sum += tree_size
+            self.max_tree_size = max(self.max_tree_size, tree_size)
+            self.reused_size_sum += reused_size
+            self.saved_simulations += saved_simulations
+            self.early_stops += saved_simulations > 0
+
+    def record_cache(self, cache_statistics):
+        """
+        Add the counters of a model evaluation cache, once the process using it has finished its searches
+
+        :param cache_statistics: dict with the hits and misses of the cache (see SelfPlayModel.cache_statistics),
+                                 None if the model has no cache
+        """
+
+        if cache_statistics is None:
+            return
+        with self.lock:
+            self.cache_hits += cache_statistics["hits"]
+            self.cache_misses += cache_statistics["misses"]
+
+    def merge(self, other):
+        """
+        Add the counters and timers of other statistics (e.g. collected by another process) to these statistics
+
+        :param other: the statistics to be added
+        """
+
+        self.searches += other.searches
+        self.simulations += other.simulations
+        self.predict_calls += other.predict_calls
+        self.predicted_states += other.predicted_states
+        self.depth_sum += other.depth_sum
+        self.max_depth = max(self.max_depth, other.max_depth)
+        self.tree_size_sum += other.tree_size_sum
+        self.max_tree_size = max(self.max_tree_size, other.max_tree_size)
+        self.reused_size_sum += other.reused_size_sum
+        self.saved_simulations += other.saved_simulations
+        self.early_stops += other.early_stops
+        self.cache_hits += other.cache_hits
+        self.cache_misses += other.cache_misses
+        for name in self.TIMERS:
+            self.times[name] += other.times[name]
+
+    def summary(self):
+        """
+        Calculate the rates and averages of the collected statistics.
+        The times of merged statistics are summed over the processes, so they are total CPU times, not wall clock
+
+        :return: dictionary of the statistics
+        """
+
+        searches = max(self.searches, 1)
+        simulations = max(self.simulations, 1)
+        budget = max(self.simulations + self.saved_simulations, 1)
+        search_time = self.times["search"]
+        summary = {"searches": self.searches,
+                   "simulations": self.simulations,
+                   "simulations_per_second": self.simulations / search_time if search_time > 0 else 0,
+                   "predict_calls": self.predict_calls,
+                   "predict_latency_ms": 1000 * self.times["predict"] / max(self.predict_calls, 1),
+                   "mean_depth": self.depth_sum / simulations,
+                   "max_depth": self.max_depth,
+                   "mean_tree_size": self.tree_size_sum / searches,
+                   "max_tree_size": self.max_tree_size,
+                   "mean_reused_size": self.reused_size_sum / searches,
+                   "early_stops": self.early_stops,
+                   "saved_simulations": self.saved_simulations,
+                   "saved_simulations_share": self.saved_simulations / budget,
+                   "cache_hits": self.cache_hits,
+                   "cache_hit_share": self.cache_hits / max(self.cache_hits + self.cache_misses, 1)}
+
+        # Time of every part, with its share of the search time
+        for name in self.TIMERS:
+            summary[f"{name}_time"] = self.times[name]
+            if name != "search":
+                summary[f"{name}_share"] = self.times[name] / search_time if search_time > 0 else 0
+        return summary
+
+    def print_statistics(self):
+        """
+        Print the summary of the statistics to the terminal
+        """
+
+        print("======================== SEARCH STATISTICS =========================")
+        for key, value in self.summary().items():
+            if key.endswith("_share"):
+                # Format the shares of the search time <- percentage values
+                print(key.upper(), ":", "{:.1f}".format(value * 100), "%")
+            elif isinstance(value, float):
+                print(key.upper(), ":", "{:.3f}".format(value))
+            else:
+                print(key.upper(), ":", value)
+        print("====================================================================")
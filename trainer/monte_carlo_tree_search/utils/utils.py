@@ -1,30 +1,187 @@
+import sys
+
 import numpy as np
 from numba import jit
 
+@jit(nopython=True)
+def sample_dirichlet(rng, alpha, size):
+    """
+    Sample symmetric dirichlet noise from the provided generator, by normalizing gamma distributed samples
+    (the compiled functions only support the gamma distribution of the NumPy generators)
+
+    :param rng: NumPy random generator to sample from
+    :param alpha: alpha parameter of dirichlet noise
+    :param size: number of entries of the noise vector
+    :return: the noise vector (sum of 1)
+    """
+
+    noise = rng.gamma(alpha, 1.0, size)
+    return noise / np.sum(noise)
+
+
 @jit(nopython=True, fastmath=True)
-def apply_dirichlet_noise(action_probs, alpha, epsilon, action_space):
-    return (1 - epsilon) * action_probs + epsilon * np.random.dirichlet([alpha]*action_space)
+def apply_dirichlet_noise(action_probs, alpha, epsilon, action_space, rng):
+    return (1 - epsilon) * action_probs + epsilon * sample_dirichlet(rng, alpha, action_space)
+
+
+@jit(nopython=True)
+def apply_legal_dirichlet_noise(action_probs, legal_actions, alpha, epsilon, rng):
+    """
+    Mix dirichlet noise into the probabilities of the legal actions only,
+    so the noise vector has one entry per legal action instead of one per action in the action space
+
+    :param action_probs: probabilities of all actions in the action space
+    :param legal_actions: indexes of the legal actions
+    :param alpha: alpha parameter of dirichlet noise
+    :param epsilon: epsilon parameter of dirichlet noise (weight of the noise)
+    :param rng: NumPy random generator the noise is sampled from
+    :return: the noised action probabilities
+    """
 
-# @jit(nopython=True, fastmath=True)
-def normalize_action(action_space, valid_moves, action_probs):
+    noised_action_probs = (1 - epsilon) * action_probs
+    noise = sample_dirichlet(rng, alpha, len(legal_actions))
+    for i in range(len(legal_actions)):
+        noised_action_probs[legal_actions[i]] += epsilon * noise[i]
+    return noised_action_probs
+
+
+def sample_action(actions, visit_counts, temperature, proven=None, rng=None):
     """
-    # TODO document-normalize
+    Select an action based on the visit counts of the nodes the actions lead to.
+    If the results of some nodes are proven (MCTS-solver), then an action proven to win is always selected,
+    and the actions proven to lose are avoided (the results are from the perspective of the player making the move)
 
-    :param action_space:
-    :param valid_moves:
-    :param action_probs:
-    :return:
+    :param actions: array with the actions
+    :param visit_counts: array with the visit counts of the nodes reached by the actions
+    :param temperature: parameter to adjust the randomness of the action choice,
+                        0 - deterministic action based on the visit counts,
+                       infinity - action choice with uniform probabilities,
+                       in-between - probabilities dependent on the visit count
+    :param proven: array with the proven results of the nodes reached by the actions, None if nothing is proven
+    :param rng: NumPy random generator used for the random choices, None for the global NumPy generator
+    :return: the selected action
     """
 
-    print(action_space)
-    print(valid_moves)
+    if rng is None:
+        rng = np.random
+
+    if proven is not None:
+        winning = np.flatnonzero(proven == 1)
+        if len(winning) > 0:
+            return int(actions[winning[0]])
 
-    for i in range(action_space):
-        if i not in valid_moves:
-            action_probs[i] = 0
-    if np.sum(action_probs) == 0:
-        for i in valid_moves:
-            action_probs[i] = 1 / len(valid_moves)
+        # Only the actions which are not proven to lose are kept, if there are any
+        not_losing = proven != -1
+        if 0 < np.count_nonzero(not_losing) < len(actions):
+            actions = actions[not_losing]
+            visit_counts = visit_counts[not_losing]
+            if np.sum(visit_counts) == 0:
+                temperature = float("inf")
+
+    if temperature == 0:
+        action = actions[np.argmax(visit_counts)]
+    elif temperature == float("inf"):
+        action = rng.choice(actions)
     else:
-        action_probs /= np.sum(action_probs)
-    return action_probs
\ No newline at end of file
+        visit_count_distribution = np.asarray(visit_counts, dtype=np.float64) ** (1 / temperature)
+        visit_count_distribution = visit_count_distribution / sum(visit_count_distribution)
+        action = rng.choice(actions, p=visit_count_distribution)
+    return int(action)
+
+
+def normalize_action(legal_mask, action_probs):
+    """
+    Zero the probabilities of the illegal actions and renormalize the rest to sum up to 1.
+    If the network assigned no probability to any legal action, then the legal actions are chosen uniformly
+
+    :param legal_mask: boolean array over the action space, True for the legal actions
+    :param action_probs: probabilities of all actions in the action space
+    :return: the normalized probabilities of the legal actions
+    """
+
+    action_probs = np.where(legal_mask, action_probs, 0)
+    total = np.sum(action_probs)
+    if total == 0:
+        return legal_mask / np.count_nonzero(legal_mask)
+    return action_probs / total
+
+
+def pack_state(state):
+    """
+    Store a board state compactly for the search tree.
+    All board values of the environments (empty, pieces, kings) are small integers,
+    so they fit into int8, which takes an eighth of the memory of the float64 boards used by the environments
+
+    :param state: board state of the environment
+    :return: int8 copy of the board state
+    """
+
+    return np.array(state, dtype=np.int8)
+
+
+def unpack_state(packed_state):
+    """
+    Restore a board state stored by pack_state, in the form used by the environments
+
+    :param packed_state: int8 board state
+    :return: float64 copy of the board state
+    """
+
+    return packed_state.astype(np.float64)
+
+
+def measure_tree_memory(root):
+    """
+    Measure the memory held by a search tree, used to compare the memory cost of the node representations.
+    For trees made of nodes, the nodes reachable from the root are counted, including their children arrays
+    and states (nodes and arrays shared by transpositions are counted once).
+    For array-backed trees, the arrays of the tree are counted, including the preallocated capacity not used yet
+
+    :param root: root of the tree
+    :return: number of nodes, total number of bytes held by the tree
+    """
+
+    if hasattr(root, "tree"):
+        tree = root.tree
+        num_bytes = sum(array.nbytes for array in vars(tree).values() if isinstance(array, np.ndarray))
+        num_bytes += sys.getsizeof(tree.states) + sum(sys.getsizeof(state) for state in tree.states.values())
+        return tree.size, num_bytes
+
+    counted = set()
+    num_nodes = 0
+    num_bytes = 0
+    nodes = [root]
+    while nodes:
+        node = nodes.pop()
+        if id(node) in counted:
+            continue
+        num_nodes += 1
+        for member in (node, node.children, node.packed_state, node.child_actions, node.child_priors,
+                       node.child_visit_counts, node.child_value_sums, node.child_proven, node.parent_visit_counts,
+                       node.parent_value_sums, node.parent_proven):
+            if member is not None and id(member) not in counted:
+                counted.add(id(member))
+                num_bytes += sys.getsizeof(member)
+        nodes.extend(node.children.values())
+    return num_nodes, num_bytes
+
+
+def count_tree_nodes(root):
+    """
+    Count the nodes of a search tree, for trees made of nodes only the created (materialized) nodes are counted
+
+    :param root: root of the tree
+    :return: number of nodes in the tree
+    """
+
+    if hasattr(root, "tree"):
+        return root.tree.size
+
+    counted = set()
+    nodes = [root]
+    while nodes:
+        node = nodes.pop()
+        if id(node) not in counted:
+            counted.add(id(node))
+            nodes.extend(node.children.values())
+    return len(counted)
@@ -11,6 +11,7 @@ from trainer.buffers.uniform_buffer_actor_critic import UniformBufferActorCritic
 from trainer.test.test_games import play_test_game_pair
 from trainer.data_generator.data_generator import generate_data
 from trainer.logger.logger import Logger
+from trainer.monte_carlo_tree_search.search_statistics.search_statistics import SearchStatistics
 
 
 class TrainerActorCriticV2:
@@ -88,6 +89,36 @@ class TrainerActorCriticV2:
         self.tournament_simulations = trainer_parameters["TOURNAMENT_BUDGET"]
         self.test_simulations = trainer_parameters["TEST_BUDGET"]
 
+        # Store the playout cap randomization parameters, only the moves with the full search are recorded
+        self.full_search_probability = trainer_parameters["FULL_SEARCH_PROBABILITY"]
+        self.fast_generator_simulations = trainer_parameters["FAST_MCTS_BUDGET"]
+
+        # Store the Monte-Carlo-Tree Search settings passed on to the searches in every process
+        self.search_parameters = {"batch_size": trainer_parameters["MCTS_BATCH_SIZE"],
+                                  "c": trainer_parameters["MCTS_C"],
+                                  "transposition_table": trainer_parameters["MCTS_TRANSPOSITIONS"],
+                                  "max_nodes": trainer_parameters["MCTS_MAX_NODES"],
+                                  "num_threads": trainer_parameters["MCTS_THREADS"],
+                                  "noise": trainer_parameters["MCTS_NOISE"],
+                                  "sparse_noise": trainer_parameters["MCTS_SPARSE_NOISE"],
+                                  "widening_constant": trainer_parameters["MCTS_WIDENING"],
+                                  "solver": trainer_parameters["MCTS_SOLVER"],
+                                  "early_stop": trainer_parameters["MCTS_EARLY_STOP"]}
+
+        # The tournament and test searches choose their actions with their own root selection,
+        # the Gumbel root selection is meant for their small budgets.
+        # Their actions are chosen deterministically, so they can stop as soon as the chosen action is settled
+        self.evaluation_search_parameters = {**self.search_parameters,
+                                             "root_selection": trainer_parameters["EVALUATION_ROOT_SELECTION"],
+                                             "gumbel_actions": trainer_parameters["GUMBEL_ACTIONS"],
+                                             "early_stop": trainer_parameters["EVALUATION_EARLY_STOP"]}
+
+        # Store the size of the model evaluation cache kept by every process
+        self.evaluation_cache_size = trainer_parameters["EVALUATION_CACHE_SIZE"]
+
+        # Statistics of the searches run during the data generation of the latest iteration
+        self.search_statistics = SearchStatistics()
+
         # Store and calculate the Monte-Carlo-Tree Search heuristics parameters
         self.heuristic_start_weight = trainer_parameters["HEURISTIC_START_WEIGHT"]
         self.heuristic_end_weight = trainer_parameters["HEURISTIC_END_WEIGHT"]
@@ -109,7 +140,9 @@ class TrainerActorCriticV2:
 
         # Generate data function parameters
         parameters = [(self.env_name, self.board_parameters, self.draw_parameters, self.data_generation_episodes,
-                      self.num_workers, self.generator_simulations, self.decay, self.heuristic_weight)]
+                      self.num_workers, self.generator_simulations, self.decay, self.heuristic_weight,
+                      self.search_parameters, self.evaluation_cache_size, self.full_search_probability,
+                      self.fast_generator_simulations)]
 
         # Set up process pool, generate data in each separate process, and receive the data in this method
         pool = Pool(self.num_workers)
@@ -120,13 +153,16 @@ class TrainerActorCriticV2:
         pool.join()
         gc.collect()
 
-        # Load the generated data to the buffer and update the total step count
+        # Load the generated data to the buffer, update the total step count
+        # and aggregate the search statistics of all workers
+        self.search_statistics = SearchStatistics()
         for worker in range(self.num_workers):
-            num_elements = data[worker][-1]
+            num_elements = data[worker][3]
             for index in range(num_elements):
                 state, action_probs, reward = data[worker][0][index], data[worker][1][index], data[worker][2][index]
                 self.buffer.record((state, action_probs, reward))
                 total_steps += 1
+            self.search_statistics.merge(data[worker][4])
         return total_steps
 
     def update_logger(self, test_log, loss, iteration, steps):
@@ -144,10 +180,11 @@ class TrainerActorCriticV2:
 
     def print_log(self):
         """
-        Wrapper method to print the latest Logger data
+        Print the latest Logger data and the search statistics of the latest data generation
         """
 
         self.logger.print_log()
+        self.search_statistics.print_statistics()
 
     def test_network(self):
         """
@@ -162,7 +199,8 @@ class TrainerActorCriticV2:
 
         # Test function parameters
         parameters = [(self.env_name, self.board_parameters, self.draw_parameters,
-                       self.test_simulations, self.heuristic_weight)]
+                       self.test_simulations, self.heuristic_weight, self.evaluation_search_parameters,
+                       self.evaluation_cache_size)]
 
         # Set up the process pool, play a test game (with 2 rounds) in each process,
         # and receive the results of the games
@@ -203,7 +241,7 @@ class TrainerActorCriticV2:
 
         # Tournament function parameters
         parameters = [(self.env_name, self.board_parameters, self.draw_parameters,
-                       self.tournament_simulations, 0)]
+                       self.tournament_simulations, 0, self.evaluation_search_parameters, self.evaluation_cache_size)]
 
         # Set up the process pool and perform a two round tournament in each process,
         # with the result of each of these 2 round games being returned to tournament results
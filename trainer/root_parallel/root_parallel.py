@@ -0,0 +1,169 @@
+import os
+from multiprocessing import Pool
+
+import numpy as np
+import tensorflow as tf
+
+from trainer.monte_carlo_tree_search.monte_carlo_tree_search import MonteCarloTreeSearch
+from trainer.monte_carlo_tree_search.utils.utils import sample_action
+from trainer.self_play_model.self_play_model import SelfPlayModel
+
+# Search of the worker process, created once by the pool initializer and reused for every move
+worker_search = None
+
+
+def initialize_worker(env_class, board_parameters, draw_parameters, model_path, num_simulations, heuristic_weight,
+                      search_parameters):
+    """
+    Load the environment, the model and the Monte-Carlo-Tree Search of a root-parallel worker process
+
+    :param env_class: class of the environment (game) to be played
+    :param board_parameters: parameters for the game board
+    :param draw_parameters: parameters for the game drawer
+    :param model_path: path to the file where the self-play model is stored
+    :param num_simulations: number of simulation steps to be run in the Monte-Carlo-Tree Search of every worker
+    :param heuristic_weight: weight the heuristics are assigned in the Monte-Carlo-Tree Search
+    :param search_parameters: keyword arguments of the Monte-Carlo-Tree Search (e.g. leaf evaluation batch size)
+    """
+
+    global worker_search
+
+    # Disable GPU, force all operations to run on the CPU
+    os.environ["CUDA_VISIBLE_DEVICES"] = ""
+    tf.config.set_visible_devices([], 'GPU')
+
+    # Initialize a copy of the played environment, without rendering
+    env = env_class(board_parameters, draw_parameters)
+    model = SelfPlayModel(model_path)
+    worker_search = MonteCarloTreeSearch(env, model, num_simulations, heuristic_weight, **search_parameters)
+
+
+def search_position(state, state_player, player, move_counter, seed):
+    """
+    Run an independent search of the position in a worker process
+
+    :param state: the environment state from which the tree search should be run
+    :param state_player: the environment state from the player's perspective
+    :param player: the player who is about make a move
+    :param move_counter: number of moves made in the game so far
+    :param seed: seed of the random generator of the search (dirichlet noise), different for every worker
+    :return: the actions of the root's children, the visit counts of the root's children
+    """
+
+    worker_search.reseed(seed)
+    worker_search.env.move_counter = move_counter
+
+    root = worker_search.run(state, state_player, player)
+    children = root.children
+    actions = np.array(list(children.keys()), dtype=np.int64)
+    visit_counts = np.array([child.visit_count for child in children.values()], dtype=np.int64)
+    return actions, visit_counts
+
+
+class MergedRoot:
+    """
+    Root of a root-parallel search, holding the visit counts of the root's children summed over all workers
+    """
+
+    def __init__(self, actions, visit_counts):
+        """
+        Store the merged statistics of the root's children
+
+        :param actions: sorted array of the actions searched by any of the workers
+        :param visit_counts: visit counts of the actions, summed over all workers
+        """
+
+        self.actions = actions
+        self.visit_counts = visit_counts
+
+    def select_action(self, temperature):
+        """
+        Select an action based on the merged visit counts
+
+        :param temperature: parameter to adjust the randomness of the action choice,
+                            0 - deterministic action based on the visit counts,
+                           infinity - action choice with uniform probabilities,
+                           in-between - probabilities dependent on the visit count
+        :return: the selected action
+        """
+
+        return sample_action(self.actions, self.visit_counts, temperature)
+
+
+class RootParallelSearch:
+    """
+    Class implementing root-parallel Monte-Carlo-Tree Search.
+    Several worker processes search the same position independently, each with a different dirichlet noise,
+    and the visit counts of their root's children are merged before an action is selected.
+    It exposes the run and advance_root methods of MonteCarloTreeSearch, so the play loops can use either of them.
+    """
+
+    def __init__(self, env, board_parameters, draw_parameters, model_path, num_workers, budget,
+                 heuristic_weight, search_parameters=None, seed=0):
+        """
+        Start the worker processes, each loading its own environment and model
+
+        :param env: the played environment, the workers create their own copies of it
+        :param board_parameters: parameters for the game board
+        :param draw_parameters: parameters for the game drawer
+        :param model_path: path to the file where the self-play model is stored
+        :param num_workers: number of worker processes searching the position
+        :param budget: the maximum number of rollouts to perform in every worker
+        :param heuristic_weight: weight the heuristics are assigned in the Monte-Carlo-Tree Search
+        :param search_parameters: keyword arguments of the Monte-Carlo-Tree Search (e.g. leaf evaluation batch size)
+        :param seed: seed from which the noise seeds of the workers are derived
+        """
+
+        if search_parameters is None:
+            search_parameters = {}
+
+        self.env = env
+        self.num_workers = num_workers
+        self.seed = seed
+        self.pool = Pool(num_workers, initializer=initialize_worker,
+                         initargs=(type(env), board_parameters, draw_parameters, model_path, budget,
+                                   heuristic_weight, search_parameters))
+
+    def run(self, state, state_player, player, root=None):
+        """
+        Search the position in all workers and merge the visit counts of the root's children
+
+        :param state: the environment state from which the tree search should be run
+        :param state_player: the environment state from the player's perspective
+        :param player: the player who is about make a move
+        :param root: unused, the workers do not keep their trees between moves
+        :return: the merged root
+        """
+
+        # The move counter of the played environment is passed on, as it is needed by the opening books
+        parameters = [(state, state_player, player, self.env.move_counter, self.seed + worker)
+                      for worker in range(self.num_workers)]
+        self.seed += self.num_workers
+        results = self.pool.starmap(search_position, parameters)
+
+        # Sum the visit counts of every action over the workers
+        actions = np.unique(np.concatenate([result[0] for result in results]))
+        visit_counts = np.zeros(len(actions), dtype=np.int64)
+        for worker_actions, worker_visit_counts in results:
+            visit_counts[np.searchsorted(actions, worker_actions)] += worker_visit_counts
+        return MergedRoot(actions, visit_counts)
+
+    @staticmethod
+    def advance_root(root, action):
+        """
+        The workers search every position from scratch, so there is no subtree to reuse
+
+        :param root: the merged root of the last search
+        :param action: the action played in the root state
+        :return: None
+        """
+
+        return None
+
+    def close(self):
+        """
+        Stop the worker processes
+        """
+
+        self.pool.close()
+        self.pool.join()
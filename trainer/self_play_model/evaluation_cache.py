@@ -0,0 +1,86 @@
+from collections import OrderedDict
+from hashlib import blake2b
+from threading import Lock
+
+
+class EvaluationCache:
+    """
+    Class implementing a bounded least-recently-used (LRU) cache of neural network evaluations.
+    Positions which are evaluated again and again (e.g. the opening position of every episode)
+    are then served from the cache, instead of running the model.
+    The cache can be shared by the threads of a threaded search.
+    """
+
+    def __init__(self, capacity):
+        """
+        Initialize an empty cache and its hit/miss counters
+
+        :param capacity: maximum number of evaluations kept in the cache
+        """
+
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = Lock()
+
+    @staticmethod
+    def position_key(observation):
+        """
+        Create a compact key of a model input, by hashing its bytes into a 16 byte digest
+
+        :param observation: a single model input (usually refactored game state)
+        :return: key of the model input
+        """
+
+        return blake2b(observation.tobytes(), digest_size=16).digest()
+
+    def get_batch(self, keys):
+        """
+        Get the evaluations of a whole batch from the cache and mark them as the most recently used ones.
+        The batch is served only if every input has been evaluated before, otherwise the model evaluates all of it,
+        so the inputs of the batch are counted either all as hits or all as misses
+
+        :param keys: keys of the model inputs of the batch
+        :return: list of the cached evaluations, None if any of them is not in the cache
+        """
+
+        with self.lock:
+            if not all(key in self.entries for key in keys):
+                self.misses += len(keys)
+                return None
+            for key in keys:
+                self.entries.move_to_end(key)
+            self.hits += len(keys)
+            return [self.entries[key] for key in keys]
+
+    def put(self, key, entry):
+        """
+        Add an evaluation to the cache, removing the least recently used one if the cache is full
+
+        :param key: key of the model input
+        :param entry: the evaluation to be cached
+        """
+
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        """
+        Remove all evaluations from the cache, e.g. after the model weights have changed
+        """
+
+        with self.lock:
+            self.entries.clear()
+
+    def statistics(self):
+        """
+        Get the cache counters
+
+        :return: dict with the number of hits, misses and cached evaluations
+        """
+
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.entries)}
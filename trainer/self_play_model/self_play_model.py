@@ -3,10 +3,12 @@ os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
 os.environ["CUDA_VISIBLE_DEVICES"] = ""
 os.environ["TF_FORCE_GPU_ALLOW_GROWTH"] = 'true'
 
-from tensorflow import device
+import numpy as np
+from tensorflow import device, convert_to_tensor
 from tensorflow.keras.saving import load_model
 
 from trainer.algorithms.actor_critic.actor_critic_trainers import predict
+from trainer.self_play_model.evaluation_cache import EvaluationCache
 
 
 class SelfPlayModel:
@@ -14,14 +16,16 @@ class SelfPlayModel:
     Class storing an Actor-Critic model
     """
 
-    def __init__(self, file_name):
+    def __init__(self, file_name, cache_size=0):
         """
         Load the model from the file
 
         :param file_name: path to the file where the self-play model is stored
+        :param cache_size: number of evaluations kept in the LRU evaluation cache, 0 disables the cache
         """
 
         self.model = load_model(file_name)
+        self.cache = EvaluationCache(cache_size) if cache_size > 0 else None
 
     def predict(self, observations):
         """
@@ -32,8 +36,35 @@ class SelfPlayModel:
         :return: action probabilities, state value (model output values)
         """
 
+        if self.cache is None:
+            with device('/cpu:0'):
+                return predict(self.model, observations)
+
+        # If every input has been evaluated before, then serve the whole batch from the cache
+        observations = np.asarray(observations)
+        keys = [self.cache.position_key(observation) for observation in observations]
+        entries = self.cache.get_batch(keys)
+        if entries is not None:
+            return (convert_to_tensor(np.stack([entry[0] for entry in entries])),
+                    convert_to_tensor(np.stack([entry[1] for entry in entries])))
+
+        # Otherwise evaluate the whole batch, keeping its size constant, and cache the results
         with device('/cpu:0'):
-            return predict(self.model, observations)
+            action_probs, values = predict(self.model, observations)
+        for key, key_action_probs, key_value in zip(keys, action_probs.numpy(), values.numpy()):
+            self.cache.put(key, (key_action_probs, key_value))
+        return action_probs, values
+
+    def cache_statistics(self):
+        """
+        Get the hit and miss counters of the evaluation cache
+
+        :return: dict with the number of hits, misses and cached evaluations, None if the cache is disabled
+        """
+
+        if self.cache is None:
+            return None
+        return self.cache.statistics()
 
     def set_weights(self, model_weights):
         """
@@ -44,6 +75,10 @@ class SelfPlayModel:
 
         self.model.set_weights(model_weights)
 
+        # The cached evaluations were made with the old weights
+        if self.cache is not None:
+            self.cache.clear()
+
     def get_weights(self):
         """
         Get the weights of this model's layers
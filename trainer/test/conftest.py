@@ -0,0 +1,111 @@
+import zlib
+
+import numpy as np
+import pytest
+
+from checkers.checkers_env.checkers_env import CheckersEnv
+from checkers.checkers_env.env_parameters.checkers_env_parameters import (board_parameters as checkers_board,
+                                                                          draw_parameters as checkers_draw)
+from simple_games.connect4.connect4_env.connect4_env import Connect4Env
+from simple_games.connect4.connect4_env.env_parameters.connect4_env_parameters import (
+    board_parameters as connect4_board, draw_parameters as connect4_draw)
+from simple_games.tic_tac_toe.tic_tac_toe_env.tic_tac_toe_env import TicTacToeEnv
+from simple_games.tic_tac_toe.tic_tac_toe_env.env_parameters.tic_tac_toe_env_parameters import (
+    board_parameters as tic_tac_toe_board, draw_parameters as tic_tac_toe_draw)
+
+
+class Prediction:
+    """
+    Array returned by the stub model, with the numpy() method of the TensorFlow tensors
+    """
+
+    def __init__(self, array):
+        self.array = array
+
+    def numpy(self):
+        return self.array
+
+
+class StubModel:
+    """
+    Replacement of SelfPlayModel for the tests, predicting deterministic pseudo-random action probabilities
+    and values derived from the bytes of the state, so the searches run without TensorFlow.
+    The values can be given by a function of the refactored state instead
+    """
+
+    def __init__(self, action_space, value_function=None):
+        """
+        Create the stub model
+
+        :param action_space: number of actions of the environment
+        :param value_function: function of the refactored state returning its value, None for pseudo-random values
+        """
+
+        self.action_space = action_space
+        self.value_function = value_function
+        self.num_predictions = 0
+
+    def predict(self, states):
+        """
+        Predict the action probabilities and the values of the states
+
+        :param states: the refactored states, stacked along the first axis
+        :return: action probabilities and values of the states
+        """
+
+        states = np.asarray(states)
+        action_probs = np.zeros((len(states), self.action_space), dtype=np.float32)
+        values = np.zeros((len(states), 1), dtype=np.float32)
+        for i, state in enumerate(states):
+            key = state.astype(np.int64).tobytes()
+            rng = np.random.default_rng(zlib.crc32(key))
+            probs = rng.random(self.action_space).astype(np.float32)
+            action_probs[i] = probs / np.sum(probs)
+            values[i, 0] = 0.2 * rng.random() - 0.1
+            if self.value_function is not None:
+                values[i, 0] = self.value_function(state)
+        self.num_predictions += len(states)
+        return Prediction(action_probs), Prediction(values)
+
+
+@pytest.fixture
+def checkers_state():
+    """
+    Create the starting position of checkers, the pieces of player 1 are on the bottom three rows
+
+    :return: the starting state
+    """
+
+    state = np.zeros((8, 8))
+    for x in range(8):
+        for y in range(8):
+            if (x + y) % 2 == 1 and x < 3:
+                state[x, y] = -1
+            elif (x + y) % 2 == 1 and x > 4:
+                state[x, y] = 1
+    return state
+
+
+@pytest.fixture
+def tic_tac_toe_env():
+    return TicTacToeEnv(tic_tac_toe_board, tic_tac_toe_draw)
+
+
+@pytest.fixture
+def connect4_env():
+    return Connect4Env(connect4_board, connect4_draw)
+
+
+@pytest.fixture
+def checkers_env():
+    return CheckersEnv(checkers_board, checkers_draw)
+
+
+@pytest.fixture
+def checkers_array_env():
+    return CheckersEnv(dict(checkers_board, ENGINE="ARRAY"), checkers_draw)
+
+
+@pytest.fixture
+def stub_model():
+    return StubModel
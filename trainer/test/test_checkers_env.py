@@ -0,0 +1,95 @@
+import numpy as np
+
+
+def random_positions(env, state, num_games, seed):
+    """
+    Play random games from the state, with the moves found by the environment
+
+    :param env: the checkers environment
+    :param state: the starting state
+    :param num_games: number of games played
+    :param seed: seed of the random moves
+    :return: list of the (state, player to move) positions of the games
+    """
+
+    rng = np.random.default_rng(seed)
+    positions = []
+    for _ in range(num_games):
+        game_state = np.copy(state)
+        player = 1
+        for move in range(env.max_moves):
+            actions = np.flatnonzero(env.legal_moves_mask(env.find_moves(game_state, player,
+                                                                         *env.find_positions(game_state))))
+            if len(actions) == 0:
+                break
+            positions.append((game_state, player))
+            game_state = env.make_move(game_state, int(rng.choice(actions)), player)
+            if env.state_reward(game_state, player, move + 1)[1]:
+                break
+            player = -player
+    return positions
+
+
+def test_bitboard_engine_matches_array_engine(checkers_env, checkers_array_env, checkers_state):
+    for state, player in random_positions(checkers_array_env, checkers_state, 10, seed=0):
+        array_mask = checkers_array_env.legal_moves_mask(
+            checkers_array_env.find_moves(state, player, *checkers_array_env.find_positions(state)))
+        bitboard_mask = checkers_env.legal_moves_mask(
+            checkers_env.find_moves(state, player, *checkers_env.find_positions(state)))
+        assert np.array_equal(array_mask, bitboard_mask)
+
+        for action in np.flatnonzero(array_mask):
+            array_state = checkers_array_env.make_move(state, int(action), player)
+            bitboard_state = checkers_env.make_move(state, int(action), player)
+            assert np.array_equal(array_state, bitboard_state)
+
+            array_reward = checkers_array_env.state_reward(array_state, player, 1)
+            bitboard_reward = checkers_env.state_reward(bitboard_state, player, 1)
+            assert array_reward[:2] == bitboard_reward[:2]
+            assert np.array_equal(checkers_array_env.legal_moves_mask(array_reward[2]),
+                                  checkers_env.legal_moves_mask(bitboard_reward[2]))
+
+
+def test_action_index_tables_invert_the_moves_list(checkers_env, connect4_env, tic_tac_toe_env):
+    for action, move in enumerate(checkers_env.moves_list):
+        assert checkers_env.action_indexes[move] == action
+        assert action in checkers_env.endpoint_actions[(move[0], move[-1])]
+    assert sum(len(actions) for actions in checkers_env.endpoint_actions.values()) == checkers_env.action_space
+
+    for env in (connect4_env, tic_tac_toe_env):
+        moves = list(env.move_indexes)
+        assert env.filter_moves(moves[::-1]) == list(range(len(moves)))
+
+
+def test_find_action_resolves_only_possible_moves(checkers_env, checkers_state):
+    possible_moves = checkers_env.find_moves(checkers_state, 1, *checkers_env.find_positions(checkers_state))
+    for action in possible_moves:
+        move = checkers_env.moves_list[action]
+        assert checkers_env.find_action(move[0], move[-1], possible_moves) == action
+    assert checkers_env.find_action((5, 0), (3, 2), possible_moves) is None
+
+
+def found_moves(env, state, player):
+    return {env.moves_list[action] for action in env.find_moves(state, player, *env.find_positions(state))}
+
+
+def test_multi_jump_captures(checkers_env, checkers_array_env):
+    # A MAN MUST FINISH ITS DOUBLE JUMP, THE SINGLE JUMP IS A PREFIX OF IT
+    state = np.zeros((8, 8))
+    state[6, 1] = 1
+    state[5, 2] = state[3, 2] = state[0, 7] = -1
+
+    # A KING CHOOSES BETWEEN A DOUBLE JUMP AND A SINGLE JUMP IN ANOTHER DIRECTION
+    king_state = np.zeros((8, 8))
+    king_state[4, 3] = 2
+    king_state[3, 2] = king_state[1, 2] = king_state[3, 4] = king_state[7, 0] = -1
+
+    for env in (checkers_env, checkers_array_env):
+        assert found_moves(env, state, 1) == {((6, 1), (4, 3), (2, 1))}
+        assert found_moves(env, king_state, 1) == {((4, 3), (2, 1), (0, 3)), ((4, 3), (2, 5))}
+
+        new_state = env.make_move(king_state, env.action_indexes[((4, 3), (2, 1), (0, 3))], 1)
+        expected = np.zeros((8, 8))
+        expected[0, 3] = 2
+        expected[3, 4] = expected[7, 0] = -1
+        assert np.array_equal(new_state, expected)
@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+ENVIRONMENTS = ["tic_tac_toe_env", "connect4_env", "checkers_env", "checkers_array_env"]
+
+
+@pytest.fixture(params=ENVIRONMENTS)
+def env_and_state(request):
+    """
+    Every environment with its starting state, checkers starts from the checkers_state fixture
+
+    :return: the environment and the starting state
+    """
+
+    env = request.getfixturevalue(request.param)
+    if "checkers" in request.param:
+        return env, request.getfixturevalue("checkers_state")
+    return env, np.zeros(env.observation_space)
+
+
+def random_game(env, state, seed):
+    """
+    Play a random game from the state, with the moves found by the environment
+
+    :param env: the environment
+    :param state: the starting state
+    :param seed: seed of the random moves
+    :return: list of the (state, player to move, legal actions) positions of the game
+    """
+
+    rng = np.random.default_rng(seed)
+    positions = []
+    player = 1
+    for move in range(env.max_moves):
+        actions = env.find_moves(state, player, *env.find_positions(state))
+        if actions is None or len(actions) == 0:
+            break
+        positions.append((state, player, actions))
+        state = env.make_move(state, int(rng.choice(actions)), player)
+        if env.state_reward(state, player, move + 1)[1]:
+            break
+        player = -player
+    return positions
+
+
+def test_make_move_in_place_round_trips(env_and_state):
+    env, start_state = env_and_state
+    for seed in range(3):
+        for state, player, actions in random_game(env, start_state, seed):
+            for action in actions:
+                board = np.copy(state)
+                undo = env.make_move_in_place(board, action, player)
+                assert np.array_equal(board, env.make_move(state, action, player))
+                env.unmake_move(board, undo)
+                assert np.array_equal(board, state)
+
+
+def test_make_move_in_place_updates_the_position_sets(checkers_array_env, checkers_state):
+    env = checkers_array_env
+    for state, player, actions in random_game(env, checkers_state, seed=0):
+        for action in actions:
+            board = np.copy(state)
+            piece_positions, king_positions = env.find_positions(board)
+            undo = env.make_move_in_place(board, action, player, piece_positions, king_positions)
+            assert (piece_positions, king_positions) == env.find_positions(board)
+            env.unmake_move(board, undo, piece_positions, king_positions)
+            assert (piece_positions, king_positions) == env.find_positions(state)
+
+
+def test_incremental_hash_matches_hash_from_scratch(env_and_state):
+    env, start_state = env_and_state
+    for seed in range(3):
+        for state, player, actions in random_game(env, start_state, seed):
+            hash_key = env.hash_state(state, player)
+            for action in actions:
+                next_state = env.make_move(state, action, player)
+                assert env.update_hash(hash_key, state, action, player) == env.hash_state(next_state, -player)
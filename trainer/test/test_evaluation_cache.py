@@ -0,0 +1,31 @@
+import numpy as np
+
+from trainer.self_play_model.evaluation_cache import EvaluationCache
+
+
+def test_partially_cached_batch_counts_no_hits():
+    cache = EvaluationCache(8)
+    keys = [cache.position_key(np.full((2, 3, 3), i, dtype=np.float32)) for i in range(3)]
+    cache.put(keys[0], ("probs", "value"))
+    cache.put(keys[1], ("probs", "value"))
+
+    # The model evaluates the whole batch, as one of its inputs is missing from the cache
+    assert cache.get_batch(keys) is None
+    assert cache.statistics() == {"hits": 0, "misses": 3, "size": 2}
+
+    cache.put(keys[2], ("probs", "value"))
+    assert cache.get_batch(keys) == [("probs", "value")] * 3
+    assert cache.statistics() == {"hits": 3, "misses": 3, "size": 3}
+
+
+def test_served_batch_is_most_recently_used():
+    cache = EvaluationCache(2)
+    keys = [cache.position_key(np.full(4, i, dtype=np.float32)) for i in range(3)]
+    cache.put(keys[0], 0)
+    cache.put(keys[1], 1)
+    assert cache.get_batch([keys[0]]) == [0]
+
+    # The least recently used evaluation is removed once the cache is full
+    cache.put(keys[2], 2)
+    assert cache.get_batch([keys[1]]) is None
+    assert cache.get_batch([keys[0], keys[2]]) == [0, 2]
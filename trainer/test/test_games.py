@@ -10,7 +10,8 @@ from trainer.monte_carlo_tree_search.monte_carlo_tree_search import MonteCarloTr
 from trainer.self_play_model.self_play_model import SelfPlayModel
 
 
-def play_test_game_pair(env_name, board_parameters, draw_parameters, num_simulations, heuristic_weight):
+def play_test_game_pair(env_name, board_parameters, draw_parameters, num_simulations, heuristic_weight,
+                        search_parameters, cache_size):
     """
     Play 2 test games of the model against a random agent, the sides switch in-between rounds.
     Save and return the win/loss/draw statistics
@@ -20,6 +21,8 @@ def play_test_game_pair(env_name, board_parameters, draw_parameters, num_simulat
     :param draw_parameters: parameters for the game drawer
     :param num_simulations: number of simulation steps to be run in the Monte-Carlo-Tree Search
     :param heuristic_weight: weight the heuristics are assigned in the Monte-Carlo-Tree Search
+    :param search_parameters: keyword arguments of the Monte-Carlo-Tree Search (e.g. leaf evaluation batch size)
+    :param cache_size: number of model evaluations kept in the LRU evaluation cache of the process, 0 disables it
     :return: list with the win/loss/draw counts
     """
 
@@ -37,7 +40,7 @@ def play_test_game_pair(env_name, board_parameters, draw_parameters, num_simulat
         env = CheckersEnv(board_parameters, draw_parameters)
 
     # Load the model to be tested
-    test_model = SelfPlayModel("saved_models/test_models/actor-critic-test.h5")
+    test_model = SelfPlayModel("saved_models/test_models/actor-critic-test.h5", cache_size)
 
     test_model_wins = 0
     test_model_losses = 0
@@ -54,7 +57,7 @@ def play_test_game_pair(env_name, board_parameters, draw_parameters, num_simulat
         state_player = env.refactor_state(current_state, env.player, env.move_counter)
 
         # Initialize the Monte-Carlo-Tree Search for 1 round
-        mcts = MonteCarloTreeSearch(env, test_model, num_simulations, heuristic_weight)
+        mcts = MonteCarloTreeSearch(env, test_model, num_simulations, heuristic_weight, **search_parameters)
         root = None
 
         # In the first game, the model is always the starting player (red),
@@ -73,13 +76,12 @@ def play_test_game_pair(env_name, board_parameters, draw_parameters, num_simulat
             if (env.player == 1 and red_player == "agent") or \
                     (env.player == -1 and black_player == "agent"):
                 root = mcts.run(current_state, state_player, env.player, root)
-                action = root.select_action(temperature=0)
+                action = mcts.select_action(root, temperature=0)
             else:
                 action = random.sample(actions_index, 1)[0]
 
-            # Shift the root of the tree to the node of the chosen action
-            if root is not None:
-                root = root.children[action]
+            # Shift the root of the tree to the node of the chosen action, discarding the rest of the tree
+            root = mcts.advance_root(root, action)
 
             # Update the environment based on the chosen action
             new_state, reward, done, actions_index = env.step(action)
@@ -0,0 +1,252 @@
+import numpy as np
+import pytest
+
+from trainer.monte_carlo_tree_search.monte_carlo_tree_search import MonteCarloTreeSearch
+from trainer.monte_carlo_tree_search.node.node import Node
+from trainer.monte_carlo_tree_search.utils.utils import count_tree_nodes, measure_tree_memory
+
+
+def play_search_game(env, model, state, num_moves, **search_parameters):
+    """
+    Play the moves chosen by the search with the tree reused between the moves,
+    checking that every chosen action is legal
+
+    :param env: the environment of the game
+    :param model: the model evaluating the leaves
+    :param state: the starting state
+    :param num_moves: maximum number of moves played
+    :param search_parameters: keyword arguments of the Monte-Carlo-Tree Search
+    """
+
+    mcts = MonteCarloTreeSearch(env, model, 60, 0, seed=0, **search_parameters)
+    root = None
+    player = 1
+    for move in range(num_moves):
+        valid_moves = env.find_moves(state, player, *env.find_positions(state))
+        legal_mask = env.legal_moves_mask(valid_moves)
+        if not np.any(legal_mask):
+            return
+
+        root = mcts.run(state, env.refactor_state(state, player, move), player, root)
+        action = mcts.select_action(root, temperature=0)
+        assert legal_mask[action], f"illegal action {action} in move {move}"
+
+        root = mcts.advance_root(root, action)
+        state = env.make_move(state, action, player)
+        _, game_end, _ = env.state_reward(state, player, move + 1)
+        if game_end:
+            return
+        player = -player
+
+
+@pytest.mark.parametrize("search_parameters", [{}, {"array_tree": True},
+                                               {"num_threads": 4, "transposition_table": True, "solver": True}])
+def test_bounded_tree_reuse_plays_legal_moves(checkers_env, checkers_state, stub_model, search_parameters):
+    play_search_game(checkers_env, stub_model(checkers_env.action_space), checkers_state, 30,
+                     max_nodes=50, **search_parameters)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_gumbel_selection_picks_dominant_move(tic_tac_toe_env, stub_model, seed):
+    # The positions with the centre taken by the first player are evaluated as won for it, the others as lost
+    def value_function(refactored_state):
+        board, player = refactored_state[0], refactored_state[1][0, 0]
+        return 0.9 * player if board[1, 1] == 1 else -0.9 * player
+
+    state = np.zeros((3, 3))
+    model = stub_model(tic_tac_toe_env.action_space, value_function)
+    mcts = MonteCarloTreeSearch(tic_tac_toe_env, model, 32, 0, root_selection="GUMBEL", gumbel_actions=9, seed=seed)
+    root = mcts.run(state, tic_tac_toe_env.refactor_state(state, 1, 0), 1)
+    assert mcts.select_action(root, temperature=0) == 4
+
+
+@pytest.mark.parametrize("array_tree", [False, True])
+def test_solver_selects_proven_win(tic_tac_toe_env, stub_model, array_tree):
+    # The first player wins only by the fork in the centre, there is no immediate win
+    state = np.array([[0, 0, 0], [1, 0, 0], [-1, 1, -1]], dtype=np.float64)
+    model = stub_model(tic_tac_toe_env.action_space)
+    mcts = MonteCarloTreeSearch(tic_tac_toe_env, model, 400, 0, solver=True, array_tree=array_tree, seed=0)
+    root = mcts.run(state, tic_tac_toe_env.refactor_state(state, 1, 4), 1)
+
+    # The proven result is from the perspective of the player making the move, like the averaged value
+    assert root.get_child(4).proven == 1
+    assert root.get_child(4).value() > 0
+    assert mcts.select_action(root, temperature=0) == 4
+
+
+def test_best_action_settled_compares_values_of_the_moving_player():
+    root = Node(0, 1)
+    root.expand(np.zeros((3, 3)), 1, np.full(3, 1 / 3))
+    children = {action: root.get_child(action) for action in range(3)}
+    for child, visit_count, value_sum in zip(children.values(), [10, 4, 2], [6.0, 0.8, -1.0]):
+        child.visit_count = visit_count
+        child.value_sum = value_sum
+    assert MonteCarloTreeSearch.best_action_settled(children)
+
+    # The most visited child is no longer the best one for the player making the move
+    children[1].value_sum = 3.6
+    assert not MonteCarloTreeSearch.best_action_settled(children)
+
+
+@pytest.mark.parametrize("search_parameters", [{}, {"array_tree": True}, {"num_threads": 4}])
+def test_node_keys_match_keys_computed_from_scratch(connect4_env, stub_model, search_parameters):
+    state = np.zeros((6, 7))
+    mcts = MonteCarloTreeSearch(connect4_env, stub_model(connect4_env.action_space), 200, 0, seed=0,
+                                **search_parameters)
+    root = mcts.run(state, connect4_env.refactor_state(state, 1, 0), 1)
+
+    # The keys are updated move by move for the positions within the moves of the opening book
+    nodes = [(root, 1)]
+    while len(nodes) > 0:
+        node, path_length = nodes.pop()
+        if node.expanded() and path_length - 1 <= connect4_env.optimal_move_count:
+            assert node.hash_key == connect4_env.hash_state(node.state, node.player)
+            nodes.extend((child, path_length + 1) for child in node.children.values())
+
+
+def count_allocated_nodes(root):
+    """
+    Count the nodes allocated by a tree, including the children which have no node objects yet
+
+    :param root: root of the tree
+    :return: number of allocated nodes
+    """
+
+    if hasattr(root, "tree"):
+        return root.tree.size
+
+    num_nodes = 1
+    nodes = [root]
+    while len(nodes) > 0:
+        node = nodes.pop()
+        if node.expanded():
+            num_nodes += len(node.child_priors)
+            nodes.extend(node.children.values())
+    return num_nodes
+
+
+@pytest.mark.parametrize("array_tree", [False, True])
+def test_advanced_root_keeps_at_most_max_nodes(connect4_env, stub_model, array_tree):
+    state = np.zeros((6, 7))
+    mcts = MonteCarloTreeSearch(connect4_env, stub_model(connect4_env.action_space), 400, 0, max_nodes=60,
+                                array_tree=array_tree, seed=0)
+    root = mcts.run(state, connect4_env.refactor_state(state, 1, 0), 1)
+    action = mcts.select_action(root, temperature=0)
+    root = mcts.advance_root(root, action)
+    assert root.expanded()
+    assert count_allocated_nodes(root) <= 60
+
+
+SEARCH_MODES = [
+    {},
+    {"array_tree": True},
+    {"batch_size": 8},
+    {"array_tree": True, "batch_size": 8},
+    {"transposition_table": True},
+    {"num_threads": 4},
+    {"solver": True},
+    {"array_tree": True, "solver": True},
+    {"root_selection": "GUMBEL", "gumbel_actions": 8},
+    {"array_tree": True, "root_selection": "GUMBEL", "gumbel_actions": 8},
+    {"time_limit": 0.05},
+    {"early_stop": "FORCED"},
+    {"early_stop": "SETTLED"},
+    {"widening_constant": 2},
+    {"noise": "ROOT", "sparse_noise": True},
+    {"noise": "NONE"},
+]
+
+
+def search_mode_id(search_parameters):
+    return ",".join(f"{key}={value}" for key, value in search_parameters.items()) or "default"
+
+
+@pytest.mark.parametrize("search_parameters", SEARCH_MODES, ids=search_mode_id)
+@pytest.mark.parametrize("game", ["checkers", "connect4"])
+def test_every_search_mode_plays_legal_moves(request, stub_model, game, search_parameters):
+    env = request.getfixturevalue(f"{game}_env")
+    state = request.getfixturevalue("checkers_state") if game == "checkers" else np.zeros(env.observation_space)
+    play_search_game(env, stub_model(env.action_space), state, 10, **search_parameters)
+
+
+@pytest.mark.parametrize("array_tree", [False, True])
+def test_seeded_searches_build_identical_trees(connect4_env, stub_model, array_tree):
+    state = np.zeros((6, 7))
+    visit_counts = []
+    for _ in range(2):
+        mcts = MonteCarloTreeSearch(connect4_env, stub_model(connect4_env.action_space), 100, 0,
+                                    array_tree=array_tree, seed=7)
+        root = mcts.run(state, connect4_env.refactor_state(state, 1, 0), 1)
+        visit_counts.append({action: child.visit_count for action, child in root.children.items()})
+    assert visit_counts[0] == visit_counts[1]
+
+
+@pytest.mark.parametrize("search_parameters", [{}, {"transposition_table": True}, {"array_tree": True}],
+                         ids=search_mode_id)
+def test_tree_memory_grows_with_the_searched_nodes(checkers_env, checkers_state, stub_model, search_parameters):
+    memory = []
+    for budget in (50, 200):
+        mcts = MonteCarloTreeSearch(checkers_env, stub_model(checkers_env.action_space), budget, 0, seed=0,
+                                    **search_parameters)
+        root = mcts.run(checkers_state, checkers_env.refactor_state(checkers_state, 1, 0), 1)
+        num_nodes, num_bytes = measure_tree_memory(root)
+        assert num_nodes == count_tree_nodes(root)
+        memory.append((num_nodes, num_bytes))
+
+    # Node trees grow with the simulations, array trees only once their preallocated capacity is used up
+    assert memory[0][0] < memory[1][0]
+    assert 0 < memory[0][1] <= memory[1][1]
+
+
+def test_search_without_budget_needs_a_time_limit(connect4_env, stub_model):
+    model = stub_model(connect4_env.action_space)
+    with pytest.raises(ValueError):
+        MonteCarloTreeSearch(connect4_env, model, None, 0)
+
+    # The budget changed after the construction is checked as well
+    mcts = MonteCarloTreeSearch(connect4_env, model, 50, 0)
+    with pytest.raises(ValueError):
+        mcts.budget = None
+
+    # The sequential halving of the Gumbel root selection splits the budget, so it can't be limited by time only
+    with pytest.raises(ValueError):
+        MonteCarloTreeSearch(connect4_env, model, None, 0, time_limit=0.05, root_selection="GUMBEL")
+
+
+def test_only_the_early_stop_saves_simulations(tic_tac_toe_env, stub_model):
+    model = stub_model(tic_tac_toe_env.action_space)
+
+    # A single legal action is determined after the first simulation
+    state = np.array([[1, -1, 1], [1, -1, -1], [-1, 1, 0]], dtype=np.float64)
+    mcts = MonteCarloTreeSearch(tic_tac_toe_env, model, 100, 0, early_stop="FORCED", seed=0)
+    mcts.run(state, tic_tac_toe_env.refactor_state(state, 1, 8), 1)
+    assert mcts.stop_reason == "DETERMINED"
+    assert mcts.statistics.summary()["saved_simulations"] == 99
+
+    # The searches ended by a proven root or by the deadline don't count as early stops
+    state = np.array([[0, 0, 0], [1, 0, 0], [-1, 1, -1]], dtype=np.float64)
+    for search_parameters, stop_reason in (({"solver": True}, "PROVEN"), ({"time_limit": 0.05}, "DEADLINE")):
+        mcts = MonteCarloTreeSearch(tic_tac_toe_env, model, 10 ** 6, 0, soft_time_fraction=1, seed=0,
+                                    **search_parameters)
+        mcts.run(state, tic_tac_toe_env.refactor_state(state, 1, 4), 1)
+        assert mcts.stop_reason == stop_reason
+        assert mcts.statistics.summary()["saved_simulations"] == 0
+        assert mcts.statistics.summary()["early_stops"] == 0
+
+
+def test_threads_follow_the_opening_book(connect4_env, stub_model):
+    openings = []
+    for search_parameters in ({}, {"array_tree": True}, {"num_threads": 4}):
+        state = np.zeros((6, 7))
+        player = 1
+        actions = []
+        mcts = MonteCarloTreeSearch(connect4_env, stub_model(connect4_env.action_space), 100, 0, noise="NONE",
+                                    seed=0, **search_parameters)
+        for move in range(6):
+            connect4_env.move_counter = move
+            root = mcts.run(state, connect4_env.refactor_state(state, player, move), player)
+            actions.append(mcts.select_action(root, temperature=0))
+            state = connect4_env.make_move(state, actions[-1], player)
+            player = -player
+        openings.append(actions)
+    assert openings[0] == openings[1] == openings[2]
@@ -0,0 +1,15 @@
+from trainer.monte_carlo_tree_search.search_statistics.search_statistics import SearchStatistics
+
+
+def test_cache_counters_are_merged_into_the_summary():
+    statistics = SearchStatistics()
+    statistics.record_cache({"hits": 3, "misses": 1, "size": 4})
+    statistics.record_cache(None)
+
+    worker_statistics = SearchStatistics()
+    worker_statistics.record_cache({"hits": 1, "misses": 3, "size": 4})
+    statistics.merge(worker_statistics)
+
+    summary = statistics.summary()
+    assert summary["cache_hits"] == 4
+    assert summary["cache_hit_share"] == 0.5
@@ -9,7 +9,8 @@ from trainer.monte_carlo_tree_search.monte_carlo_tree_search import MonteCarloTr
 from trainer.self_play_model.self_play_model import SelfPlayModel
 
 
-def tournament_pair(env_name, board_parameters, draw_parameters, num_simulations, heuristic_weight):
+def tournament_pair(env_name, board_parameters, draw_parameters, num_simulations, heuristic_weight,
+                    search_parameters, cache_size):
     """
     Play 2 games of the currently trained model, against an older model, which till now had the best performance.
     The sides switch in-between rounds.
@@ -20,6 +21,8 @@ def tournament_pair(env_name, board_parameters, draw_parameters, num_simulations
     :param draw_parameters: parameters for the game drawer
     :param num_simulations: number of simulation steps to be run in the Monte-Carlo-Tree Search
     :param heuristic_weight: weight the heuristics are assigned in the Monte-Carlo-Tree Search
+    :param search_parameters: keyword arguments of the Monte-Carlo-Tree Search (e.g. leaf evaluation batch size)
+    :param cache_size: number of model evaluations kept in the LRU evaluation cache of the process, 0 disables it
     :return: list with training model win count and old (target) model win count
     """
 
@@ -37,8 +40,8 @@ def tournament_pair(env_name, board_parameters, draw_parameters, num_simulations
         env = CheckersEnv(board_parameters, draw_parameters)
 
     # Load the training model and the old model to play against each other
-    trained_model = SelfPlayModel("saved_models/tournament_models/actor-critic-tournament-target-False.h5")
-    target_model = SelfPlayModel("saved_models/tournament_models/actor-critic-tournament-target-True.h5")
+    trained_model = SelfPlayModel("saved_models/tournament_models/actor-critic-tournament-target-False.h5", cache_size)
+    target_model = SelfPlayModel("saved_models/tournament_models/actor-critic-tournament-target-True.h5", cache_size)
 
     wins_training = 0
     wins_target = 0
@@ -54,8 +57,8 @@ def tournament_pair(env_name, board_parameters, draw_parameters, num_simulations
         state_player = env.refactor_state(current_state, env.player, env.move_counter)
 
         # Initialize the Monte-Carlo-Tree Search for 1 round for both models
-        mcts_trained = MonteCarloTreeSearch(env, trained_model, num_simulations, heuristic_weight)
-        mcts_target = MonteCarloTreeSearch(env, target_model, num_simulations, heuristic_weight)
+        mcts_trained = MonteCarloTreeSearch(env, trained_model, num_simulations, heuristic_weight, **search_parameters)
+        mcts_target = MonteCarloTreeSearch(env, target_model, num_simulations, heuristic_weight, **search_parameters)
         root_trained = None
         root_target = None
 
@@ -72,16 +75,14 @@ def tournament_pair(env_name, board_parameters, draw_parameters, num_simulations
             # find the chosen action
             if env.player == player_trained:
                 root_trained = mcts_trained.run(current_state, state_player, env.player, root_trained)
-                action = root_trained.select_action(temperature=0)
+                action = mcts_trained.select_action(root_trained, temperature=0)
             else:
                 root_target = mcts_target.run(current_state, state_player, env.player, root_target)
-                action = root_target.select_action(temperature=0)
+                action = mcts_target.select_action(root_target, temperature=0)
 
-            # Shift the root of one of the trees to the node of the chosen action
-            if root_trained is not None:
-                root_trained = root_trained.children[action]
-            if root_target is not None:
-                root_target = root_target.children[action]
+            # Shift the roots of both trees to the node of the chosen action, discarding the rest of the trees
+            root_trained = mcts_trained.advance_root(root_trained, action)
+            root_target = mcts_target.advance_root(root_target, action)
 
             # Update the environment based on the chosen action
             new_state, reward, done, action_index = env.step(action)
@@ -109,7 +110,8 @@ def tournament_pair(env_name, board_parameters, draw_parameters, num_simulations
     return [wins_training, wins_target]
 
 
-def tournament(env, model_trained, model_target, num_games, num_simulations, heuristic_weight, threshold=0.55):
+def tournament(env, model_trained, model_target, num_games, num_simulations, heuristic_weight, threshold=0.55,
+               search_parameters=None):
     """
     Play a specified amount of rounds of the currently trained model against an older model,
     which till now had the best performance.
@@ -122,9 +124,13 @@ def tournament(env, model_trained, model_target, num_games, num_simulations, heu
     :param num_simulations: number of simulation steps to be run in the Monte-Carlo-Tree Search
     :param heuristic_weight: weight the heuristics are assigned in the Monte-Carlo-Tree Search
     :param threshold: win rate needed for the trained model to determined its victory
+    :param search_parameters: keyword arguments of the Monte-Carlo-Tree Search (e.g. tree size limit)
     :return: boolean indicating the trained model's victory or not
     """
 
+    if search_parameters is None:
+        search_parameters = {}
+
     wins_training = 0
     wins_target = 0
 
@@ -147,22 +153,29 @@ def tournament(env, model_trained, model_target, num_games, num_simulations, heu
             red_models = model_target
             black_models = model_trained
 
+        # Initialize the Monte-Carlo-Tree Search for 1 round for both models, the trees are reused between moves
+        mcts_red = MonteCarloTreeSearch(env, red_models, num_simulations, heuristic_weight, **search_parameters)
+        mcts_black = MonteCarloTreeSearch(env, black_models, num_simulations, heuristic_weight, **search_parameters)
+        root_red = None
+        root_black = None
+
         # Main loop of 1 round
         while not done:
             # If there is only 1 action to be picked, then don't run Monte-Carlo-Tree Search simulation,
             # just pick the available action
-            # Otherwise initialize a tree for one of the models, depending on whose turn it is
+            # Otherwise run the tree of one of the models, depending on whose turn it is
             if len(action_index) == 1:
                 action = action_index[0]
-            else:
-                if env.player == 1:  # PLAYER RED
-                    mcts = MonteCarloTreeSearch(env, red_models, num_simulations, heuristic_weight)
-                else:  # PLAYER BLACK
-                    mcts = MonteCarloTreeSearch(env, black_models, num_simulations, heuristic_weight)
-
-                # Select an action based on the tree simulation
-                root = mcts.run(current_state, state_player, env.player)
-                action = root.select_action(temperature=0)
+            elif env.player == 1:  # PLAYER RED
+                root_red = mcts_red.run(current_state, state_player, env.player, root_red)
+                action = mcts_red.select_action(root_red, temperature=0)
+            else:  # PLAYER BLACK
+                root_black = mcts_black.run(current_state, state_player, env.player, root_black)
+                action = mcts_black.select_action(root_black, temperature=0)
+
+            # Shift the roots of both trees to the node of the chosen action, discarding the rest of the trees
+            root_red = mcts_red.advance_root(root_red, action)
+            root_black = mcts_black.advance_root(root_black, action)
 
             # Update the environment based on the chosen action
             new_state, reward, done, action_index = env.step(action)